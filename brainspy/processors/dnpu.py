@@ -493,9 +493,8 @@ class DNPU(nn.Module):
         # pass data through the processor
         if self.processor.is_hardware():
             original_data_shape = data.shape
-            data = data.reshape(
-                original_data_shape[0] * original_data_shape[1], -1)
-            result = self.processor(data)
+            # Nodes are measured in parallel when the setup has multiple devices
+            result = self.processor.forward_nodes(data)
             if not self.processor.average_plateaus:
                 result = result.reshape(
                     int(self.processor.waveform_mgr.plateau_length *
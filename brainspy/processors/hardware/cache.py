@@ -0,0 +1,248 @@
+"""
+File containing the measurement cache of the HardwareProcessor. Measuring on hardware takes
+seconds, and the same inputs are often measured several times, e.g., the elite genomes of a
+genetic algorithm in every generation, or evaluation scripts that run the same inputs with the
+same control voltages again. The cache keeps the outputs of the measurements, keyed by a hash
+of the quantised input batch and of the configurations of the drivers and the waveform, so that
+repeated measurements are returned from memory instead of being measured again.
+
+The cache is opt-in, and it has the following eviction policies:
+
+1. Least recently used: the least recently used outputs are evicted when there are more than
+max_entries, or when they take more memory than max_memory.
+
+2. Maximum age: outputs that are older than max_age seconds are measured again, to account for
+the drift of the devices.
+
+The outputs can be persisted to disk, so that they are kept between sessions.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+import collections
+
+import numpy as np
+
+from brainspy.utils.pytorch import TorchUtils
+
+DEFAULT_MAX_ENTRIES = 128
+DEFAULT_MAX_MEMORY = 256 * 1024 * 1024  # Bytes
+DEFAULT_QUANTISATION = 1e-6  # Volts
+
+
+def get_context(*configs) -> str:
+    """
+    Gets a canonical representation of the configurations that affect a measurement, so that
+    the measurements of different setups, or with different waveforms, do not share outputs.
+
+    Parameters
+    ----------
+    *configs
+        Configurations, such as the dictionaries of the drivers and of the waveform.
+
+    Returns
+    -------
+    str
+        JSON representation of the configurations, with sorted keys.
+    """
+    return json.dumps(configs, sort_keys=True, default=repr)
+
+
+class MeasurementCache:
+    """
+    Least recently used cache of the outputs of the measurements of a HardwareProcessor.
+
+    Parameters
+    ----------
+    configs : dict
+        Configurations of the cache, with the following optional keys:
+
+        1. max_entries : int
+        Maximum number of outputs that are kept. By default DEFAULT_MAX_ENTRIES.
+
+        2. max_memory : int
+        Maximum number of bytes taken by the outputs that are kept. Outputs that are larger
+        are not cached. By default DEFAULT_MAX_MEMORY.
+
+        3. max_age : float
+        Number of seconds after which an output is measured again, to account for the drift of
+        the devices. By default None, which keeps the outputs until they are evicted.
+
+        4. quantisation : float
+        Step, in volts, to which the inputs are rounded before hashing them, so that inputs
+        that only differ by numerical noise share their outputs. By default
+        DEFAULT_QUANTISATION. If it is 0, the inputs are hashed exactly.
+
+        5. path : str
+        Path of a .npz file where the outputs are persisted when the cache is saved. The
+        outputs of the file are loaded when the cache is created, if it exists. By default
+        None, which only keeps the outputs in memory.
+    context : str, optional
+        Representation of the configurations that affect the measurements (see get_context),
+        which is part of the keys. By default "".
+
+    Attributes
+    ----------
+    stats : dict
+        Number of hits, misses, evictions and expirations of the cache.
+    """
+    def __init__(self, configs: dict, context: str = ""):
+        assert type(configs) == dict, "The measurement cache configs should be of type - dict"
+        self.max_entries = configs.get("max_entries", DEFAULT_MAX_ENTRIES)
+        self.max_memory = configs.get("max_memory", DEFAULT_MAX_MEMORY)
+        self.max_age = configs.get("max_age", None)
+        self.quantisation = configs.get("quantisation", DEFAULT_QUANTISATION)
+        self.path = configs.get("path", None)
+        assert type(self.max_entries) == int and self.max_entries > 0, (
+            "The maximum number of entries should be a positive integer")
+        assert self.max_memory > 0, "The maximum memory should be positive"
+        assert self.max_age is None or self.max_age > 0, "The maximum age should be positive"
+        assert self.quantisation >= 0, "The quantisation step cannot be negative"
+        self.context = hashlib.blake2b(context.encode(), digest_size=16).digest()
+        self.lock = threading.Lock()
+        # Key -> (time at which the output was measured, output)
+        self.entries = collections.OrderedDict()
+        self.memory = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        if self.path is not None and os.path.exists(self.path):
+            self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get_key(self, x, *args) -> str:
+        """
+        Gets the key of an input batch, which is a hash of the quantised input, its shape, the
+        context of the cache and the given arguments.
+
+        Parameters
+        ----------
+        x : torch.Tensor or np.array
+            Input batch.
+        *args
+            Other values that affect the measurement, such as the format of the input.
+
+        Returns
+        -------
+        str
+            Hexadecimal digest of the key.
+        """
+        x = TorchUtils.to_numpy(x) if not isinstance(x, np.ndarray) else x
+        if self.quantisation > 0:
+            x = np.round(x / self.quantisation).astype(np.int64)
+        else:
+            x = x.astype(np.float64)
+        key = hashlib.blake2b(self.context, digest_size=20)
+        key.update(repr((x.shape, ) + args).encode())
+        key.update(np.ascontiguousarray(x).data)
+        return key.hexdigest()
+
+    def get(self, key: str):
+        """
+        Gets the output of a key, if it is cached and it has not expired. Expired outputs are
+        removed.
+
+        Parameters
+        ----------
+        key : str
+            Key of the input batch (see get_key).
+
+        Returns
+        -------
+        np.array or None
+            Cached output, which should not be modified, or None if it is not cached.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.is_expired(entry[0]):
+                self.remove(key)
+                self.stats["expirations"] += 1
+                entry = None
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, key: str, output, measured_at: float = None):
+        """
+        Caches a copy of the output of a key, evicting the least recently used outputs that do
+        not fit in the cache.
+
+        Parameters
+        ----------
+        key : str
+            Key of the input batch (see get_key).
+        output : np.array
+            Output of the measurement.
+        measured_at : float, optional
+            Time, as given by time.time, at which the output was measured. By default None,
+            which uses the current time.
+        """
+        output = np.array(output, copy=True)
+        if output.nbytes > self.max_memory:
+            return
+        output.setflags(write=False)
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = (time.time() if measured_at is None else measured_at, output)
+            self.memory += output.nbytes
+            while len(self.entries) > self.max_entries or self.memory > self.max_memory:
+                self.remove(next(iter(self.entries)))
+                self.stats["evictions"] += 1
+
+    def remove(self, key: str):
+        """
+        Removes the output of a key. The lock should be held by the caller.
+        """
+        _, output = self.entries.pop(key)
+        self.memory -= output.nbytes
+
+    def is_expired(self, measured_at: float) -> bool:
+        """
+        Whether an output that was measured at the given time has to be measured again.
+        """
+        return self.max_age is not None and time.time() - measured_at > self.max_age
+
+    def clear(self):
+        """
+        Removes all of the outputs of the cache, e.g., after calibrating the setup again.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.memory = 0
+
+    def save(self):
+        """
+        Persists the outputs that have not expired to the path of the cache, if it has one.
+        The file is replaced atomically, so that it is not corrupted if saving is interrupted.
+        """
+        if self.path is None:
+            return
+        with self.lock:
+            entries = [(key, measured_at, output)
+                       for key, (measured_at, output) in self.entries.items()
+                       if not self.is_expired(measured_at)]
+        arrays = {f"output_{i}": output for i, (_, _, output) in enumerate(entries)}
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "wb") as file:
+            np.savez(file,
+                     keys=np.array([key for key, _, _ in entries], dtype=str),
+                     times=np.array([measured_at for _, measured_at, _ in entries],
+                                    dtype=np.float64),
+                     **arrays)
+        os.replace(temporary_path, self.path)
+
+    def load(self):
+        """
+        Loads the outputs persisted to the path of the cache, from the least to the most
+        recently used, skipping the ones that have expired.
+        """
+        with np.load(self.path, allow_pickle=False) as data:
+            for i, (key, measured_at) in enumerate(zip(data["keys"], data["times"])):
+                if not self.is_expired(measured_at):
+                    self.put(str(key), data[f"output_{i}"], float(measured_at))
@@ -2,7 +2,7 @@
 File containing the class for CDAQ to CDAQ drivers.
 """
 import numpy as np
-
+from brainspy.utils.waveform import CompressedWaveform
 from brainspy.processors.hardware.drivers.ni.setup import (
     NationalInstrumentsSetup,
     CDAQ_TO_CDAQ_RAMPING_TIME_SECONDS,
@@ -63,22 +63,25 @@ class CDAQtoCDAQ(NationalInstrumentsSetup):
 
         Parameters
         ----------
-        y : np.array
+        y : np.array or CompressedWaveform
             Input data matrix to be sent to the device.
             The data should have a shape of: (device_input_channel_no, data_point_no)
             Where device_input_channel_no is typically the number of activation
-            electrodes of the DNPU.
+            electrodes of the DNPU. Compressed waveforms are only expanded when
+            writing them to the device.
 
         Returns
         -------
         np.array
             Output data that has been read from the device when receiving the input y.
         """
-        assert type(
-            y) == np.ndarray, "The input should be of type -numpy array"
+        assert type(y) == np.ndarray or type(
+            y) == CompressedWaveform, "The input should be of type -numpy array"
         # The convention for pytorch and nidaqmx is different. Therefore,
         # the input to the device needs to be transposed before sending it to the device.
-        y = y.T
+        # Compressed waveforms are transposed when they are expanded.
+        if type(y) == np.ndarray:
+            y = y.T
         data = self.read_data(y)
 
         # Convert list to numpy, ensure it has dimension (channel_no, data)
@@ -94,3 +97,78 @@ class CDAQtoCDAQ(NationalInstrumentsSetup):
         # The convention for pytorch and nidaqmx is different. Therefore,
         # the output from the device needs to be transposed before sending it back.
         return data.T
+
+    def forward_numpy_chunks(self, chunks, points_to_write: int):
+        """
+        Streaming version of forward_numpy. The input waveform is sent to the device chunk
+        by chunk, and the output of each chunk is yielded as soon as it has been read. This
+        allows measuring waveforms that do not fit in memory at once. The extra point that
+        the CDAQ measurements add at the beginning is only removed from the first chunk.
+
+        Parameters
+        ----------
+        chunks : iterable
+            Iterable of np.array chunks of the input waveform. Each chunk should have a shape
+            of: (chunk_point_no, device_input_channel_no).
+        points_to_write : int
+            Total number of points of the waveform, summed over all of the chunks.
+
+        Yields
+        ------
+        np.array
+            Output data that has been read from the device for each of the chunks, with a
+            shape of (chunk_point_no, device_output_channel_no).
+        """
+        # The convention for pytorch and nidaqmx is different. Therefore,
+        # the input to the device needs to be transposed before sending it to the device.
+        chunks = (y.T for y in chunks)
+        offset = self.configs['offset']
+        for data in self.read_data_chunks(chunks, points_to_write):
+            data = self.process_output_data(data)
+            data = self.inversion * self.average_point_difference(
+                data[:, offset:])
+            offset = 0
+            yield data.T
+
+    def forward_numpy_continuous(self, chunks, points_to_write: int, samples_per_read=None):
+        """
+        Continuous version of forward_numpy, where the input waveform is sent to the device
+        chunk by chunk, without stopping the tasks in between, and the output is yielded in
+        blocks as soon as it is acquired (see read_data_continuous). The blocks do not
+        correspond to the chunks. The extra points that the CDAQ measurements add at the
+        beginning are removed from the first blocks, and the samples that do not complete an
+        averaged point are kept until the next block arrives.
+
+        Parameters
+        ----------
+        chunks : iterable
+            Iterable of np.array chunks of the input waveform. Each chunk should have a shape
+            of: (chunk_point_no, device_input_channel_no).
+        points_to_write : int
+            Total number of points of the waveform, summed over all of the chunks.
+        samples_per_read : int, optional
+            Number of samples per channel of each block that is read, by default None (see
+            read_data_continuous).
+
+        Yields
+        ------
+        np.array
+            Output data, with a shape of (block_point_no, device_output_channel_no). The blocks
+            add up to the output that forward_numpy returns for the whole waveform.
+        """
+        # The convention for pytorch and nidaqmx is different. Therefore,
+        # the input to the device needs to be transposed before sending it to the device.
+        chunks = (y.T for y in chunks)
+        offset = self.configs['offset']
+        remainder = None
+        for data in self.read_data_continuous(chunks, points_to_write,
+                                              samples_per_read):
+            data = self.process_output_data(data)
+            skip = min(offset, data.shape[1])
+            data, offset = data[:, skip:], offset - skip
+            if remainder is not None:
+                data = np.concatenate((remainder, data), axis=1)
+            usable = data.shape[1] - data.shape[1] % self.io_point_difference
+            data, remainder = data[:, :usable], data[:, usable:]
+            if usable > 0:
+                yield (self.inversion * self.average_point_difference(data)).T
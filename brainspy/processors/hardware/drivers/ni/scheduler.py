@@ -0,0 +1,293 @@
+"""
+File containing a scheduler that shares a national instruments setup between several callers.
+Each call to the forward pass of a driver pays a fixed overhead, as the tasks are started and
+the waveform ramps from and back to zero. When several experiments measure small batches on the
+same setup, the scheduler coalesces their requests into a single waveform, measures it once,
+and splits the output back to each of the callers.
+"""
+import json
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+from brainspy.utils.manager import get_driver
+from brainspy.utils.waveform import CompressedWaveform
+
+# Maximum time, in seconds, that a request waits for other requests to be coalesced with it.
+DEFAULT_MAX_WAIT_TIME = 0.01
+
+# Schedulers that are shared between the callers with compatible configurations
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+class RequestScheduler:
+    """
+    Scheduler that receives forward_numpy requests from several threads, and measures them
+    through a single driver. The requests that arrive within a maximum wait time of each other
+    are coalesced into a single waveform, which is possible because every waveform starts and
+    ends at zero. The output of the waveform is split back into the outputs of each of the
+    requests, in the same order.
+
+    The scheduler can be used in place of the driver, as the attributes that it does not define
+    are taken from the driver.
+
+    Parameters
+    ----------
+    driver : NationalInstrumentsSetup
+        Driver through which the requests are measured.
+    max_wait_time : float
+        Maximum time, in seconds, that the first request of a measurement waits for other
+        requests.
+    max_batch_samples : int or None
+        Maximum number of waveform samples (per channel) of a measurement. None means that there
+        is no limit.
+    """
+    def __init__(self,
+                 driver,
+                 max_wait_time: float = DEFAULT_MAX_WAIT_TIME,
+                 max_batch_samples: int = None):
+        """
+        Initialises the scheduler and starts the thread that measures the requests.
+
+        Parameters
+        ----------
+        driver : NationalInstrumentsSetup
+            Driver through which the requests are measured.
+        max_wait_time : float, optional
+            Maximum time, in seconds, that the first request of a measurement waits for other
+            requests to be coalesced with it, by default DEFAULT_MAX_WAIT_TIME. Higher values
+            increase the throughput of the setup, at the cost of the latency of each request.
+        max_batch_samples : int, optional
+            Maximum number of waveform samples (per channel) that are coalesced into a single
+            measurement. Each point of a waveform takes the samples of its plateau and of its
+            slope. A request that is longer than this is measured on its own. By default None,
+            which means that there is no limit.
+        """
+        assert max_wait_time >= 0, "The maximum wait time should not be negative"
+        assert max_batch_samples is None or (
+            type(max_batch_samples) == int and max_batch_samples > 0
+        ), "The maximum number of batch samples should be a positive integer"
+        self.driver = driver
+        self.max_wait_time = max_wait_time
+        self.max_batch_samples = max_batch_samples
+        self.users = 0
+        self.measurements = 0
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self._run,
+                                       name="RequestScheduler",
+                                       daemon=True)
+        self.thread.start()
+
+    def __getattr__(self, name):
+        # Only called for the attributes that the scheduler does not define
+        if name == "driver":
+            raise AttributeError(name)
+        return getattr(self.driver, name)
+
+    def forward_numpy(self, y):
+        """
+        Measures a waveform together with the requests of other callers. It blocks until the
+        output of the waveform is available.
+
+        Parameters
+        ----------
+        y : np.array or CompressedWaveform
+            Input waveform, with a shape of (data_point_no, device_input_channel_no), as for the
+            forward_numpy method of the driver.
+
+        Returns
+        -------
+        np.array
+            Output data of the waveform, as returned by the forward_numpy method of the driver.
+        """
+        return self.submit(y).result()
+
+    def submit(self, y) -> Future:
+        """
+        Puts a waveform in the queue of requests, without waiting for its measurement.
+
+        Parameters
+        ----------
+        y : np.array or CompressedWaveform
+            Input waveform, with a shape of (data_point_no, device_input_channel_no).
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Future that receives the output of the waveform, or the exception raised while
+            measuring it.
+        """
+        assert type(y) == np.ndarray or type(
+            y) == CompressedWaveform, "The input should be of type -numpy array"
+        assert self.thread.is_alive(), "The request scheduler has been stopped"
+        future = Future()
+        self.requests.put((future, y))
+        return future
+
+    def stop(self):
+        """
+        Stops the scheduler after the requests that have already been submitted are measured.
+        """
+        if self.thread.is_alive():
+            self.requests.put(None)
+            self.thread.join()
+
+    def close_tasks(self):
+        """
+        Releases the scheduler for one of its callers. When no caller uses it anymore, the
+        scheduler is stopped and the tasks of the driver are closed.
+        """
+        self.users = max(self.users - 1, 0)
+        if self.users > 0:
+            return
+        with _schedulers_lock:
+            for key, scheduler in list(_schedulers.items()):
+                if scheduler is self:
+                    del _schedulers[key]
+        self.stop()
+        self.driver.close_tasks()
+
+    def _run(self):
+        """
+        Main loop of the scheduler thread. It takes the first request of the queue, waits up to
+        the maximum wait time for more requests, and measures them together. A request that
+        would exceed the maximum number of batch samples is kept for the next measurement. The
+        loop ends when a None request is received.
+        """
+        request, stopping = None, False
+        while not stopping:
+            if request is None:
+                request = self.requests.get()
+                if request is None:
+                    return
+            batch, samples = [request], len(request[1])
+            request = None
+            deadline = time.monotonic() + self.max_wait_time
+            while self.max_batch_samples is None or samples < self.max_batch_samples:
+                try:
+                    next_request = self.requests.get(
+                        timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if next_request is None:
+                    stopping = True
+                    break
+                if (self.max_batch_samples is not None
+                        and samples + len(next_request[1]) > self.max_batch_samples):
+                    request = next_request
+                    break
+                batch.append(next_request)
+                samples += len(next_request[1])
+            self._measure(batch)
+        # Requests that were kept for the next measurement are still measured when stopping
+        if request is not None:
+            self._measure([request])
+
+    def _measure(self, batch):
+        """
+        Measures a batch of requests with a single call to the driver, and delivers the output
+        of each of them.
+
+        Parameters
+        ----------
+        batch : list[(concurrent.futures.Future, np.array or CompressedWaveform)]
+            Requests that are measured together.
+        """
+        batch = [(future, y) for future, y in batch if future.set_running_or_notify_cancel()]
+        if len(batch) == 0:
+            return
+        try:
+            if len(batch) == 1:
+                outputs = [self.driver.forward_numpy(batch[0][1])]
+            else:
+                waveforms = [
+                    y.to_numpy() if type(y) == CompressedWaveform else y for _, y in batch
+                ]
+                output = self.driver.forward_numpy(np.concatenate(waveforms))
+                outputs = np.split(output, np.cumsum([len(y) for y in waveforms])[:-1])
+            self.measurements += 1
+        except BaseException as e:
+            for future, _ in batch:
+                future.set_exception(e)
+            return
+        for (future, _), output in zip(batch, outputs):
+            future.set_result(output)
+
+
+def get_compatibility_key(configs: dict) -> str:
+    """
+    Gets the key that identifies the configurations of a driver whose requests can be measured
+    together: the same instruments, channels, voltage ranges, sampling rates, amplification and
+    offset, on the hardware or on the simulated backend, and with the same session log.
+
+    Parameters
+    ----------
+    configs : dict
+        Configurations of the driver, as described in NationalInstrumentsSetup.
+
+    Returns
+    -------
+    str
+        Key of the configurations.
+    """
+    setup = configs["instruments_setup"]
+    return json.dumps([
+        configs["instrument_type"],
+        setup.get("activation_instrument"),
+        list(setup["activation_channels"]),
+        np.asarray(setup.get("activation_voltage_ranges", [])).tolist(),
+        setup["activation_sampling_frequency"],
+        setup.get("readout_instrument"),
+        list(setup["readout_channels"]),
+        setup["readout_sampling_frequency"],
+        np.ravel(configs["amplification"]).tolist(),
+        configs.get("inverted_output", False),
+        configs.get("offset"),
+        "simulated_backend" in configs,
+        configs.get("session_log")
+    ])
+
+
+def get_scheduler(configs: dict) -> RequestScheduler:
+    """
+    Gets the request scheduler for the configurations of a driver. Callers with compatible
+    configurations (see get_compatibility_key) share the same scheduler and driver, which is
+    initialised by the first of them. The scheduler is configured with the 'request_scheduler'
+    key of the configurations, which can have the following keys:
+
+    1. max_wait_time : float, optional
+    Maximum time, in seconds, that a request waits for other requests, by default
+    DEFAULT_MAX_WAIT_TIME.
+
+    2. max_batch_samples : int, optional
+    Maximum number of waveform samples (per channel) of a measurement, by default None.
+
+    Parameters
+    ----------
+    configs : dict
+        Configurations of the driver, as described in NationalInstrumentsSetup.
+
+    Returns
+    -------
+    RequestScheduler
+        The shared scheduler. Each caller should call its close_tasks method when it no longer
+        uses it.
+    """
+    key = get_compatibility_key(configs)
+    with _schedulers_lock:
+        if key not in _schedulers:
+            scheduler_configs = configs.get("request_scheduler") or {}
+            # The driver gets a copy of the configs, as it sets keys that are part of the key,
+            # such as the offset, which would change the key of callers that reuse them
+            _schedulers[key] = RequestScheduler(
+                get_driver(dict(configs)),
+                max_wait_time=scheduler_configs.get("max_wait_time",
+                                                    DEFAULT_MAX_WAIT_TIME),
+                max_batch_samples=scheduler_configs.get("max_batch_samples"))
+        scheduler = _schedulers[key]
+        scheduler.users += 1
+    return scheduler
@@ -0,0 +1,363 @@
+"""
+File containing the recording and replay of the sessions of the national instruments setups.
+A SessionRecorder wraps the tasks driver of a setup and writes every waveform written to the
+activation task, every block of data read from the readout task, and their timings, to a
+compact binary log. A SessionReplay can be used in place of the tasks driver afterwards, without
+any hardware attached: it returns the recorded data for each read, so that the host-side
+processing of the drivers and processors (waveforms, synchronisation, averaging, ...) runs on
+real-world data, deterministically.
+
+The log starts with a header, followed by the records:
+
+1. Header: the MAGIC bytes, the length of the JSON metadata as a little-endian uint64, and the
+JSON metadata (the configurations of the driver, its voltage ranges and channel names), padded
+with spaces to a multiple of 8 bytes.
+
+2. Records: a RECORD_STRUCT header (kind, acquisition number, shape, time since the session
+started and duration of the call, in seconds), followed by the float64 data of the record in
+C order. The data of each record is aligned to 8 bytes, so that it can be memory-mapped.
+"""
+import json
+import time
+import struct
+import threading
+
+import numpy as np
+
+MAGIC = b"BPYSLOG1"
+LENGTH_STRUCT = struct.Struct("<Q")
+# kind, acquisition, rows, columns, time, duration
+RECORD_STRUCT = struct.Struct("<B3xIQQdd")
+
+WRITE_RECORD = 0
+READ_RECORD = 1
+CALLBACK_RECORD = 2
+
+
+def _to_json(value):
+    """
+    Converts the values of the configurations that are not JSON serialisable.
+    """
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return repr(value)
+
+
+class SessionRecorder:
+    """
+    Wrapper of a tasks driver (IOTasksManager) that records the data written to and read from
+    its tasks into a session log. It can be used in place of the tasks driver, as the
+    attributes that it does not define are taken from it.
+
+    Parameters
+    ----------
+    tasks_driver : IOTasksManager
+        Tasks driver whose session is recorded.
+    path : str
+        Path of the session log. An existing file is overwritten.
+    configs : dict
+        Configurations of the driver, which are stored in the header of the log.
+    """
+    def __init__(self, tasks_driver, path: str, configs: dict):
+        self.tasks_driver = tasks_driver
+        self.path = path
+        self.lock = threading.Lock()
+        self.acquisition = 0
+        self.start_time = time.perf_counter()
+        metadata = json.dumps(
+            {
+                "configs": configs,
+                "voltage_ranges": np.asarray(tasks_driver.voltage_ranges).tolist(),
+                "activation_channel_names": list(tasks_driver.activation_channel_names),
+                "readout_channel_names": list(tasks_driver.readout_channel_names)
+            },
+            default=_to_json).encode()
+        metadata += b" " * (-len(metadata) % 8)
+        self.file = open(path, "wb")
+        self.file.write(MAGIC + LENGTH_STRUCT.pack(len(metadata)) + metadata)
+
+    def __getattr__(self, name):
+        # Only called for the attributes that the recorder does not define
+        if name == "tasks_driver":
+            raise AttributeError(name)
+        return getattr(self.tasks_driver, name)
+
+    def record(self, kind: int, data, start: float):
+        """
+        Appends a record to the log.
+
+        Parameters
+        ----------
+        kind : int
+            WRITE_RECORD, READ_RECORD or CALLBACK_RECORD.
+        data : np.array
+            Data of the record, with a shape of (channel_no, sample_no).
+        start : float
+            Value of time.perf_counter when the recorded call started.
+        """
+        data = np.asarray(data, dtype=np.float64)
+        if data.ndim == 1:
+            data = data[np.newaxis, :]
+        data = np.ascontiguousarray(data)
+        now = time.perf_counter()
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(
+                RECORD_STRUCT.pack(kind, self.acquisition, data.shape[0], data.shape[1],
+                                   start - self.start_time, now - start))
+            self.file.write(data.tobytes())
+
+    def write(self, y, auto_start):
+        start = time.perf_counter()
+        self.tasks_driver.write(y, auto_start)
+        self.record(WRITE_RECORD, y, start)
+
+    def write_chunk(self, y):
+        start = time.perf_counter()
+        self.tasks_driver.write_chunk(y)
+        self.record(WRITE_RECORD, y, start)
+
+    def write_numpy(self, y, auto_start):
+        start = time.perf_counter()
+        self.tasks_driver.write_numpy(y, auto_start)
+        self.record(WRITE_RECORD, y, start)
+
+    def read(self, number_of_samples_per_channel, timeout=None):
+        start = time.perf_counter()
+        data = self.tasks_driver.read(number_of_samples_per_channel, timeout)
+        self.record(READ_RECORD, data, start)
+        return data
+
+    def read_numpy(self, number_of_samples_per_channel, timeout=None):
+        start = time.perf_counter()
+        data = self.tasks_driver.read_numpy(number_of_samples_per_channel, timeout)
+        self.record(READ_RECORD, data, start)
+        return data
+
+    def register_read_callback(self, samples_per_read: int, callback):
+        if callback is None:
+            self.tasks_driver.register_read_callback(samples_per_read, None)
+            return
+
+        def record_callback(data):
+            if isinstance(data, np.ndarray):
+                self.record(CALLBACK_RECORD, data, time.perf_counter())
+            callback(data)
+
+        self.tasks_driver.register_read_callback(samples_per_read, record_callback)
+
+    def stop_tasks(self):
+        self.tasks_driver.stop_tasks()
+        with self.lock:
+            self.acquisition += 1
+
+    def close_tasks(self):
+        """
+        Closes the tasks of the tasks driver, and the session log.
+        """
+        try:
+            self.tasks_driver.close_tasks()
+        finally:
+            with self.lock:
+                if self.file is not None:
+                    self.file.close()
+                    self.file = None
+
+
+class SessionLog:
+    """
+    Session log opened for reading. The file is memory-mapped, and only the headers of the
+    records are read when it is opened, so that logs larger than the memory can be replayed.
+
+    Parameters
+    ----------
+    path : str
+        Path of the session log.
+
+    Attributes
+    ----------
+    metadata : dict
+        Configurations, voltage ranges and channel names of the recorded driver.
+    records : np.array
+        Structured array with the kind, acquisition, rows, columns, time, duration and offset
+        (in bytes, of the data) of each record, in the order in which they were recorded.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.memory = np.memmap(path, dtype=np.uint8, mode="r")
+        assert bytes(self.memory[:len(MAGIC)]) == MAGIC, f"{path} is not a session log"
+        position = len(MAGIC) + LENGTH_STRUCT.size
+        length, = LENGTH_STRUCT.unpack(bytes(self.memory[len(MAGIC):position]))
+        self.metadata = json.loads(bytes(self.memory[position:position + length]))
+        position += length
+        records = []
+        while position + RECORD_STRUCT.size <= len(self.memory):
+            header = RECORD_STRUCT.unpack(
+                bytes(self.memory[position:position + RECORD_STRUCT.size]))
+            position += RECORD_STRUCT.size
+            records.append(header + (position, ))
+            position += 8 * header[2] * header[3]
+        assert position == len(self.memory), f"The session log {path} is truncated"
+        self.records = np.array(records,
+                                dtype=[("kind", np.uint8), ("acquisition", np.uint32),
+                                       ("rows", np.uint64), ("columns", np.uint64),
+                                       ("time", np.float64), ("duration", np.float64),
+                                       ("offset", np.uint64)])
+
+    @property
+    def configs(self):
+        return self.metadata["configs"]
+
+    def get_indices(self, kind: int):
+        """
+        Gets the indices of the records of a kind.
+        """
+        return np.flatnonzero(self.records["kind"] == kind)
+
+    def get_data(self, index: int):
+        """
+        Gets the data of a record, as a read-only view of the memory-mapped file.
+
+        Parameters
+        ----------
+        index : int
+            Index of the record.
+
+        Returns
+        -------
+        np.array
+            Data of the record, with a shape of (channel_no, sample_no).
+        """
+        record = self.records[index]
+        start = int(record["offset"])
+        shape = (int(record["rows"]), int(record["columns"]))
+        return self.memory[start:start + 8 * shape[0] * shape[1]].view(
+            np.float64).reshape(shape)
+
+    def close(self):
+        """
+        Releases the memory map of the file.
+        """
+        self.memory = None
+
+
+class SessionReplay:
+    """
+    Tasks driver that replays a session log instead of using the national instruments
+    hardware. Each read returns the data of the next recorded read, and each write is checked
+    against the next recorded write, so that a replay that diverges from the recorded session
+    is noticed. The data returned is a read-only view of the memory-mapped log, which the
+    drivers copy when processing it.
+
+    Parameters
+    ----------
+    path : str
+        Path of the session log.
+    check_writes : bool
+        Whether to check that the waveforms written are the same as the recorded ones.
+    """
+    def __init__(self, path: str, check_writes: bool = True):
+        self.log = SessionLog(path)
+        self.check_writes = check_writes
+        self.voltage_ranges = np.array(self.log.metadata["voltage_ranges"])
+        self.activation_channel_names = self.log.metadata["activation_channel_names"]
+        self.readout_channel_names = self.log.metadata["readout_channel_names"]
+        self.writes = iter(self.log.get_indices(WRITE_RECORD))
+        self.reads = iter(self.log.get_indices(READ_RECORD))
+        callbacks = self.log.get_indices(CALLBACK_RECORD)
+        self.callbacks = {
+            acquisition: iter(callbacks[self.log.records["acquisition"][callbacks] ==
+                                        acquisition])
+            for acquisition in np.unique(self.log.records["acquisition"][callbacks])
+        }
+        self.acquisition = 0
+        self.callback = None
+        self.callback_thread = None
+        self.running = threading.Event()
+
+    def write(self, y, auto_start):
+        self.write_numpy(y, auto_start)
+        if not auto_start:
+            self.start_callbacks()
+
+    def write_chunk(self, y):
+        self.write_numpy(y, False)
+
+    def write_numpy(self, y, auto_start):
+        index = next(self.writes, None)
+        assert index is not None, "The session log has no more recorded writes"
+        if self.check_writes:
+            y = np.asarray(y, dtype=np.float64)
+            if y.ndim == 1:
+                y = y[np.newaxis, :]
+            assert np.array_equal(y, self.log.get_data(index)), (
+                f"The waveform written does not match the recorded write {index}")
+
+    def read(self, number_of_samples_per_channel, timeout=None):
+        data = self.read_numpy(number_of_samples_per_channel, timeout)
+        if data.shape[0] == 1:
+            return data[0].tolist()
+        return data.tolist()
+
+    def read_numpy(self, number_of_samples_per_channel, timeout=None):
+        index = next(self.reads, None)
+        assert index is not None, "The session log has no more recorded reads"
+        data = self.log.get_data(index)
+        assert data.shape[1] == number_of_samples_per_channel, (
+            f"{number_of_samples_per_channel} samples were requested, but the recorded read "
+            + f"{index} has {data.shape[1]}")
+        return data
+
+    def register_read_callback(self, samples_per_read: int, callback):
+        self.callback = callback
+
+    def start_callbacks(self):
+        """
+        Delivers the recorded callback reads of the current acquisition to the read callback,
+        from a separate thread, as the nidaqmx driver does.
+        """
+        if self.callback is None or self.running.is_set():
+            return
+        self.running.set()
+        callback = self.callback
+        records = self.callbacks.get(self.acquisition, iter(()))
+
+        def deliver():
+            for index in records:
+                if not self.running.is_set():
+                    return
+                callback(self.log.get_data(index))
+
+        self.callback_thread = threading.Thread(target=deliver,
+                                                name="SessionReplayCallback",
+                                                daemon=True)
+        self.callback_thread.start()
+
+    def stop_tasks(self):
+        self.running.clear()
+        if (self.callback_thread is not None
+                and self.callback_thread is not threading.current_thread()):
+            self.callback_thread.join()
+        self.callback_thread = None
+        self.acquisition += 1
+
+    def close_tasks(self):
+        if self.running.is_set():
+            self.stop_tasks()
+        self.log.close()
+
+    def set_sampling_frequencies(self, *args, **kwargs):
+        pass
+
+    def set_continuous_sampling(self, *args, **kwargs):
+        pass
+
+    def set_regeneration(self, allow: bool):
+        pass
+
+    def start_trigger(self, trigger_source):
+        pass
+
+    def add_synchronisation_channels(self, *args, **kwargs):
+        pass
@@ -3,13 +3,22 @@ File containing the generic class for creating a driver of national instruments
 """
 import sys
 import math
+import queue
 import signal
 import threading
+import traceback
 import warnings
+import weakref
+import nidaqmx
 import numpy as np
-from threading import Thread
+from concurrent.futures import Future
 from brainspy.processors.hardware.drivers.ni.tasks import IOTasksManager
+from brainspy.processors.hardware.drivers.ni.simulated import SimulatedIOTasksManager
+from brainspy.processors.hardware.drivers.ni.session_log import SessionRecorder, SessionReplay
+from brainspy.processors.hardware.drivers.ni.worker import AcquisitionWorker, DEFAULT_MAX_REQUESTS
 from brainspy.processors.hardware.drivers.ni.channels import is_device_name
+from brainspy.utils.pytorch import TorchUtils
+from brainspy.utils.waveform import CompressedWaveform
 """
 This class includes the following security flags.
 
@@ -49,6 +58,87 @@ CDAQ_TO_NIDAQ_RAMPING_TIME_SECONDS = 0.001
 CDAQ_TO_CDAQ_RAMPING_TIME_SECONDS = 0.1
 SYNCHRONISATION_VALUE = 0.04  # Do not reduce to less than 0.02, only useful for nidaq
 
+# Modes of the security checks of the input data (see read_security_checks)
+SECURITY_CHECK_MODES = ("waveform", "template")
+
+# Setups of the process whose acquisitions are interrupted, and whose tasks are closed, when the
+# process receives an interruption or termination signal (see interrupt_setups)
+_setups = weakref.WeakSet()
+_setups_lock = threading.Lock()
+
+
+def interrupt_setups(signum, frame=None):
+    """
+    Process-level handler of the interruption and termination signals. It interrupts the
+    acquisitions of every live setup, waits for the measurements that are being read by each of
+    them to finish, and closes the NI tasks of all of them before exiting. A single handler is
+    installed for the whole process, as installing one per setup would only leave the handler of
+    the last created setup in place.
+
+    More information can be found at:
+    https://docs.python.org/3/library/signal.html
+
+    Parameters
+    ----------
+    signum : int
+        The signal number.
+    frame : int, optional
+        The current stack frame, by default None.
+    """
+    with _setups_lock:
+        setups = list(_setups)
+    for setup in setups:
+        setup.event.set()
+    print("Interruption/Termination signal received. Waiting for the readers to finish.")
+    for setup in setups:
+        setup.worker.cancel_pending()
+    for setup in setups:
+        setup.worker.wait()
+    print("Closing nidaqmx tasks")
+    for setup in setups:
+        setup.close_tasks()
+    sys.exit(0)
+
+
+def check_input_voltages(y, check_start=True, check_end=True):
+    """
+    Checks that the input data does not go above the INPUT_VOLTAGE_THRESHOLD, and that it starts
+    and ends at zero. The checks are vectorised over all of the electrodes and samples, and the
+    electrodes are only inspected one by one to report the first one that fails.
+
+    Parameters
+    ----------
+    y : np.array
+        Input data, with a shape of (device_input_channel_no, data_point_no).
+    check_start : bool
+        Whether to check that the first value of each electrode is zero. By default True.
+    check_end : bool
+        Whether to check that the last value of each electrode is zero. By default True.
+
+    Raises
+    ------
+    AssertionError
+        If any of the checks fails.
+    """
+    y = np.asarray(y)
+    if y.ndim == 1:
+        y = y[np.newaxis, :]
+    peaks = np.abs(y).max(axis=1, initial=0)
+    # Not-a-number values also fail the check
+    for n in np.flatnonzero(~(peaks < INPUT_VOLTAGE_THRESHOLD)):
+        assert (y[n] < INPUT_VOLTAGE_THRESHOLD).all(), (
+            f"Voltages in electrode {n} higher ({y[n].max()}) than the max."
+            + f" allowed value ({INPUT_VOLTAGE_THRESHOLD} V)")
+        assert (y[n] > -INPUT_VOLTAGE_THRESHOLD).all(), (
+            f"Voltages in electrode {n} lower ({y[n].min()}) than the min. "
+            + f"allowed value ({-INPUT_VOLTAGE_THRESHOLD} V)")
+    for check, index, name in [(check_start, 0, "First"), (check_end, -1, "Last")]:
+        if check:
+            non_zero = np.flatnonzero(y[:, index] != 0.0)
+            assert len(non_zero) == 0, (
+                f"{name} value of input stream in electrode {non_zero[0]} is non-zero " +
+                f"({y[non_zero[0], index]})")
+
 
 class NationalInstrumentsSetup:
 
@@ -133,12 +223,43 @@ class NationalInstrumentsSetup:
             only applicable for CDAQ to CDAQ setups (with or without real-time rack).
             E.g., cDAQ1/segment1 - More information at:
             https://nidaqmx-python.readthedocs.io/en/latest/start_trigger.html
+
+            4. simulated_backend: dict, optional
+            When present, the tasks are simulated instead of running on the national
+            instruments hardware, modelling their sample clocks, triggers, latencies and
+            buffers. The output of the device is computed by a surrogate model. It can be used
+            to run and benchmark the drivers offline. The keys of the dictionary are described
+            in brainspy.processors.hardware.drivers.ni.simulated.SimulatedIOTasksManager.
+
+            5. session_log: dict, optional
+            Records the session of the driver to a binary log, or replays a recorded log
+            without any hardware attached (see
+            brainspy/processors/hardware/drivers/ni/session_log.py). It has the following keys:
+            5.1 path: str
+            Path of the session log.
+            5.2 mode: str
+            'record' to record the session, or 'replay' to replay it. By default 'record'.
+            5.3 check_writes: bool, optional
+            Only for replays. Whether to check that the waveforms written are the same as the
+            recorded ones. By default True.
+
+            6. security_checks: str, optional
+            Mode of the security checks of the input data, one of SECURITY_CHECK_MODES (see
+            read_security_checks). By default 'waveform', which checks every waveform.
+
+            7. max_padded_points: int, optional
+            Maximum number of points of the waveforms for which the timing of the tasks is
+            configured, up to which the timing is reused for shorter waveforms (see
+            set_io_configs). Shorter waveforms are padded with zeros, and the output of the
+            padding is discarded. By default 0, which configures the timing again whenever the
+            number of points changes.
         """
         self.type_check(configs)
         self.init_configs(configs)
         self.init_tasks(configs)
         self.enable_os_signals()
         self.init_semaphore()
+        self.init_worker(configs)
 
     def type_check(self, configs):
         """
@@ -237,6 +358,19 @@ class NationalInstrumentsSetup:
 
         """
         self.configs = configs
+        self.security_checks = configs.get("security_checks", "waveform")
+        assert self.security_checks in SECURITY_CHECK_MODES, (
+            f"The security checks should be one of {SECURITY_CHECK_MODES}")
+        # Templates of the waveforms whose start and end have already been checked
+        self.checked_templates = set()
+        self.max_padded_points = configs.get("max_padded_points", 0)
+        assert type(self.max_padded_points) == int and self.max_padded_points >= 0, (
+            "The maximum number of padded points should be a non-negative integer")
+        # Zeros added to the waveform, so that it has the number of points of the timing
+        self.padding = 0
+        self.padding_buffer = np.empty(0)
+        # Number of times that the timing of the tasks has been configured
+        self.reconfigurations = 0
         self.last_points_to_write_val = -1
         self.data_results = None
         self.offsetted_points_to_write = None
@@ -343,14 +477,26 @@ class NationalInstrumentsSetup:
 
     def init_tasks(self, configs):
         """
-        Initializes the tasks driver and voltage ranges based on the configurations.
+        Initializes the tasks driver and voltage ranges based on the configurations. The tasks
+        are simulated when the configurations contain the 'simulated_backend' key, and they are
+        recorded or replayed when they contain the 'session_log' key.
 
         Parameters
         ----------
         configs : dict
             configurations of the model as a python dictionary
         """
-        self.tasks_driver = IOTasksManager(configs)
+        session_log = configs.get("session_log")
+        if session_log is not None and session_log.get("mode", "record") == "replay":
+            self.tasks_driver = SessionReplay(session_log["path"],
+                                              session_log.get("check_writes", True))
+        elif "simulated_backend" in configs:
+            self.tasks_driver = SimulatedIOTasksManager(configs)
+        else:
+            self.tasks_driver = IOTasksManager(configs)
+        if session_log is not None and session_log.get("mode", "record") == "record":
+            self.tasks_driver = SessionRecorder(self.tasks_driver, session_log["path"],
+                                                configs)
         self.voltage_ranges = (
             self.tasks_driver.voltage_ranges
         )  # To be improved, it should have the same form to be accessed by both
@@ -359,12 +505,41 @@ class NationalInstrumentsSetup:
     def init_semaphore(self):
         """
         Initializes the semaphore that will manage the main thread by synchronsing it with the
-        read/write of data.
+        read/write of data, and the event that interrupts the acquisitions. Both belong to the
+        setup, so that the setups of different racks can measure at the same time.
+        """
+        self.event = threading.Event()
+        self.semaphore = threading.Semaphore()
+        # Whether a streamed measurement holds the semaphore (see read_data_chunks)
+        self.streaming = False
+
+    def check_not_streaming(self):
+        """
+        Checks that no streamed measurement of this setup is in progress, as it holds the
+        semaphore until its generator is fully consumed or closed.
+        """
+        assert not self.streaming, (
+            "A streamed measurement is in progress. Its generator has to be fully consumed or "
+            + "closed before measuring again.")
+
+    def init_worker(self, configs):
+        """
+        Starts the long-lived worker thread that runs the acquisitions of the setup (see
+        AcquisitionWorker).
+
+        Parameters
+        ----------
+        configs : dict
+            configurations of the model as a python dictionary. The optional key
+            "max_acquisition_requests" sets the maximum number of measurements that can wait
+            in the queue of the worker, by default DEFAULT_MAX_REQUESTS.
         """
-        global event
-        global semaphore
-        event = threading.Event()
-        semaphore = threading.Semaphore()
+        self.worker = AcquisitionWorker(
+            configs.get("max_acquisition_requests", DEFAULT_MAX_REQUESTS))
+        # Whether the nidaqmx errors of the acquisitions are raised (see set_recoverable_errors)
+        self.recoverable_errors = False
+        with _setups_lock:
+            _setups.add(self)
 
     def process_output_data(self, data):
         """
@@ -374,11 +549,13 @@ class NationalInstrumentsSetup:
         correction factor is applied in software, in order to obtain the real current value again.
         This is done using the configs['driver']['amplification'] value. The function creates a
         numpy array from a list, ensuring it has  dimensions (channel_no, read_point_no) and
-        multiplies it by the amplification of the device.
+        multiplies it by the amplification of the device. Writeable float64 numpy arrays, such
+        as the data that read_data copies out of the read buffer of the tasks driver, are
+        amplified in place without being copied again. Lists and read-only arrays are copied.
 
         Parameters
         ----------
-        data : list
+        data : list or np.array
             output data
 
         Returns
@@ -388,14 +565,17 @@ class NationalInstrumentsSetup:
             (channel_no, read_point_no), and with the amplification correction factor
             applied.
         """
-        data = np.array(data)
+        in_place = type(data) == np.ndarray and data.dtype == np.float64 and data.flags.writeable
+        if not in_place:
+            data = np.array(data, dtype=np.float64)
 
         # If data has single dimension, create an extra dimension
         # for the main channel
         if len(data.shape) == 1:
             data = data[np.newaxis, :]
 
-        return (data.T * self.configs["amplification"]).T
+        np.multiply(data.T, self.configs["amplification"], out=data.T)
+        return data
 
     def average_point_difference(self, data):
         """
@@ -432,13 +612,13 @@ class NationalInstrumentsSetup:
 
     def read_data(self, y):
         """
-        Initializes the semaphore to read data from the device
-        if the data cannot be read, a signal is sent to the signal handler which blocks the calling
+        Sends a measurement request to the acquisition worker and waits for its result.
+        If the data cannot be read, a signal is sent to the signal handler which blocks the calling
         thread and closes the nidaqmx tasks
 
         Parameters
         ----------
-        y : np.array
+        y : np.array or CompressedWaveform
             Input data to be sent to the device.
             The data should have a shape of: (device_input_channel_no, data_point_no)
             Where device_input_channel_no is typically the number of activation
@@ -449,20 +629,325 @@ class NationalInstrumentsSetup:
         list
             Output data that has been read from the device when receiving the input y.
         """
-        global p
-        p = Thread(target=self._read_data, args=(y, ))
-        if not event.is_set():
-            semaphore.acquire()
-            p = Thread(target=self._read_data, args=(y, ))
-            p.start()
-            p.join()
+        if not self.event.is_set():
+            self.data_results = self.get_result(self.read_data_async(y))
             if self.data_results is None:
                 print("Nothing could be read. Stopping program")
                 self.os_signal_handler(None)
-            semaphore.release()
         return self.data_results
 
-    def set_io_configs(self, points_to_write: int, timeout: float = None):
+    def read_data_async(self, y):
+        """
+        Puts a measurement request in the queue of the acquisition worker, without waiting for
+        its result, so that the caller can prepare the next request meanwhile. Requests are
+        measured in the order in which they were submitted. The worker holds the semaphore while
+        measuring, and requests that start after an interruption signal was received are not
+        measured. It blocks while the queue of the worker is full.
+
+        Parameters
+        ----------
+        y : np.array or CompressedWaveform
+            Input data to be sent to the device, as in read_data.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Future that receives the output data read from the device, or None if the request
+            was not measured because of an interruption signal.
+        """
+        self.check_not_streaming()
+        if self.event.is_set():
+            future = Future()
+            future.set_result(None)
+            return future
+        return self.worker.submit(self._run_acquisition, self._read_data, y)
+
+    def set_recoverable_errors(self, recoverable=True):
+        """
+        Sets whether the nidaqmx errors raised during the measurements, such as read timeouts,
+        can be recovered from by measuring again. Recoverable errors are raised to the caller
+        once the tasks have been stopped, instead of stopping the program. It is used by the
+        HardwareProcessor when its acquisitions are measured again on failure.
+
+        Parameters
+        ----------
+        recoverable : bool, optional
+            Whether the nidaqmx errors are recoverable, by default True.
+        """
+        assert type(recoverable) == bool, "recoverable param should be of type - bool"
+        self.recoverable_errors = recoverable
+
+    def get_result(self, future):
+        """
+        Waits for the result of a measurement request. Errors raised during the measurement are
+        printed, and reported as a measurement that could not be read. The nidaqmx errors are
+        raised instead when they are recoverable (see set_recoverable_errors).
+
+        Parameters
+        ----------
+        future : concurrent.futures.Future
+            Future returned by read_data_async.
+
+        Returns
+        -------
+        np.array or None
+            Output data read from the device, or None if nothing could be read.
+
+        Raises
+        ------
+        nidaqmx.errors.DaqError
+            If the measurement failed with a recoverable error.
+        """
+        try:
+            return future.result()
+        except nidaqmx.errors.DaqError:
+            if self.recoverable_errors:
+                # The failed read leaves the tasks running, and they are restarted when measuring
+                # again
+                self.tasks_driver.stop_tasks()
+                raise
+            traceback.print_exc()
+            return None
+        except Exception:
+            traceback.print_exc()
+            return None
+
+    def _run_acquisition(self, function, *args):
+        """
+        Runs an acquisition function in the worker thread while holding the semaphore, unless an
+        interruption signal has been received.
+
+        Parameters
+        ----------
+        function : callable
+            Acquisition function.
+        *args
+            Arguments of the acquisition function.
+
+        Returns
+        -------
+        Any
+            The value returned by the function, or None if it was not run.
+        """
+        with self.semaphore:
+            if self.event.is_set():
+                return None
+            return function(*args)
+
+    def read_data_chunks(self, chunks, points_to_write: int):
+        """
+        Streaming version of read_data. The input waveform is written to the device chunk by
+        chunk, and the data read for each chunk is yielded as soon as it is available. This
+        allows measuring waveforms that do not fit in memory at once. The next chunk is always
+        appended to the device buffer before the current one is read, so that the generation
+        does not run out of samples. Regeneration of the activation task is disabled during the
+        streaming, so that a late chunk raises an error instead of repeating old samples.
+
+        The semaphore and the interruption event are honoured in the same way as in read_data.
+        The semaphore is held during the whole stream, as the tasks keep running between chunks,
+        so the generator has to be fully consumed, or closed (with its close method), before
+        measuring anything else. Measurements requested meanwhile raise an AssertionError
+        instead of waiting for the semaphore, which would never be released.
+
+        Parameters
+        ----------
+        chunks : iterable
+            Iterable of np.array chunks of the input waveform to be sent to the device.
+            Each chunk should have a shape of: (device_input_channel_no, chunk_point_no).
+        points_to_write : int
+            Total number of points of the waveform, summed over all of the chunks.
+
+        Yields
+        ------
+        list
+            Output data that has been read from the device for each of the chunks.
+        """
+        chunks = iter(chunks)
+        y = next(chunks, None)
+        if y is None or self.event.is_set():
+            return
+        self.check_not_streaming()
+        self.semaphore.acquire()
+        self.streaming = True
+        position = 0
+        try:
+            # The chunks are appended to the buffer of the device, so they cannot be padded
+            self.set_io_configs(points_to_write, allow_padding=False)
+            self.tasks_driver.set_regeneration(False)
+            while y is not None and not self.event.is_set():
+                next_y = next(chunks, None)
+                if next_y is None:
+                    assert position + y.shape[1] == points_to_write, (
+                        f"The chunks have {position + y.shape[1]} points in total"
+                        + f", but {points_to_write} were expected.")
+                # The semaphore is already held for the whole stream
+                self.data_results = self.get_result(
+                    self.worker.submit(self._read_data_chunk, y, next_y,
+                                       position, points_to_write))
+                if self.data_results is None:
+                    print("Nothing could be read. Stopping program")
+                    self.os_signal_handler(None)
+                position += y.shape[1]
+                yield self.data_results
+                y = next_y
+        finally:
+            if position < points_to_write:
+                self.tasks_driver.stop_tasks()
+            self.tasks_driver.set_regeneration(True)
+            self.streaming = False
+            self.semaphore.release()
+
+    def read_data_continuous(self,
+                             chunks,
+                             points_to_write: int,
+                             samples_per_read: int = None,
+                             buffer_size: int = None):
+        """
+        Continuous version of read_data_chunks. The tasks are configured to generate and acquire
+        samples continuously through on-board ring buffers, so they are armed, started and padded
+        with the offset of the setup only once for the whole waveform. The chunks of the input
+        waveform are written by the acquisition worker as soon as there is space in the buffer
+        of the activation task, without regeneration. The readout is delivered by a callback of
+        the readout task every samples_per_read samples, and each block is yielded as soon as it
+        arrives, independently of the chunks that were written. After the last chunk, the
+        activation task keeps generating zeros until all the samples have been read.
+
+        The semaphore and the interruption event are honoured in the same way as in read_data.
+        The semaphore is held during the whole stream, as the tasks keep running between chunks,
+        so the generator has to be fully consumed, or closed (with its close method), before
+        measuring anything else. Measurements requested meanwhile raise an AssertionError
+        instead of waiting for the semaphore, which would never be released.
+
+        Parameters
+        ----------
+        chunks : iterable
+            Iterable of np.array chunks of the input waveform to be sent to the device.
+            Each chunk should have a shape of: (device_input_channel_no, chunk_point_no).
+        points_to_write : int
+            Total number of points of the waveform, summed over all of the chunks.
+        samples_per_read : int, optional
+            Number of samples per channel of each block that is read. It is rounded up to a
+            multiple of the io point difference. By default None, which reads blocks of a tenth
+            of a second.
+        buffer_size : int, optional
+            Size of the ring buffer of the activation task, in samples per channel. The ring
+            buffer of the readout task has the equivalent size. By default None, which uses ten
+            blocks (or the first chunk, if it is longer).
+
+        Yields
+        ------
+        np.array
+            Blocks of output data read from the device, with a shape of
+            (device_output_channel_no, block_point_no). The blocks add up to the number of
+            points that read_data would read for the whole waveform.
+        """
+        chunks = iter(chunks)
+        y = next(chunks, None)
+        if y is None or self.event.is_set():
+            return
+        self.check_not_streaming()
+        self.semaphore.acquire()
+        self.streaming = True
+        stop = threading.Event()
+        registered = False
+        try:
+            self.set_io_configs(points_to_write, allow_padding=False)
+            points_to_read = self.offsetted_points_to_read
+            if samples_per_read is None:
+                samples_per_read = max(
+                    1, self.configs["instruments_setup"]["readout_sampling_frequency"] // 10)
+            samples_per_read = int(
+                math.ceil(samples_per_read / self.io_point_difference) *
+                self.io_point_difference)
+            write_block = samples_per_read // self.io_point_difference
+            if buffer_size is None:
+                buffer_size = 10 * write_block
+            buffer_size = max(buffer_size, y.shape[1])
+            # Zeros written after the waveform, so that the offset and the last block are
+            # acquired before the generation runs out of samples
+            padding = (self.offsetted_points_to_write - points_to_write) + int(
+                math.ceil(self.configs["offset"] / self.io_point_difference)) + write_block
+            results = queue.Queue()
+            self.tasks_driver.set_continuous_sampling(
+                self.configs["instruments_setup"]["activation_sampling_frequency"],
+                self.configs["instruments_setup"]["readout_sampling_frequency"],
+                buffer_size, buffer_size * self.io_point_difference)
+            self.tasks_driver.register_read_callback(samples_per_read, results.put)
+            registered = True
+            self.read_security_checks(y, check_end=y.shape[1] == points_to_write)
+            # Both tasks are started explicitly, as the readout is not started by reading
+            self.tasks_driver.write(y, False)
+            writer = self.worker.submit(self._write_continuous, chunks, y.shape[1],
+                                        points_to_write, padding, stop)
+            read = 0
+            while read < points_to_read and not self.event.is_set():
+                try:
+                    data = results.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise TimeoutError(
+                        f"No samples were read in {self.timeout} seconds") from None
+                if isinstance(data, BaseException):
+                    raise data
+                data = data[:, :points_to_read - read]
+                read += data.shape[1]
+                self.data_results = data
+                yield data
+            writer.result()
+        finally:
+            # A pending write fails once the tasks are stopped. The worker runs it before any
+            # other measurement, so it does not need to be waited for.
+            stop.set()
+            self.tasks_driver.stop_tasks()
+            if registered:
+                self.tasks_driver.register_read_callback(samples_per_read, None)
+            self.tasks_driver.set_regeneration(True)
+            # The finite sampling is configured again in the next measurement
+            self.last_points_to_write_val = -1
+            self.streaming = False
+            self.semaphore.release()
+
+    def _write_continuous(self, chunks, position, points_to_write, padding, stop):
+        """
+        Writes the chunks of a continuous measurement that follow the first one, followed by
+        zeros. Writing blocks while the ring buffer of the activation task is full. It is run by
+        the acquisition worker.
+
+        Parameters
+        ----------
+        chunks : iterator
+            Remaining chunks of the input waveform, with a shape of
+            (device_input_channel_no, chunk_point_no).
+        position : int
+            Number of points that have already been written.
+        points_to_write : int
+            Total number of points of the waveform.
+        padding : int
+            Number of zeros that are written after the waveform.
+        stop : threading.Event
+            Event that stops the writing when it is set.
+        """
+        channel_no = None
+        for y in chunks:
+            if stop.is_set():
+                return
+            channel_no = y.shape[0]
+            position += y.shape[1]
+            assert position <= points_to_write, (
+                f"The chunks exceed the {points_to_write} points to be written")
+            self.read_security_checks(y,
+                                      check_start=False,
+                                      check_end=position == points_to_write)
+            self.tasks_driver.write_numpy(y, False)
+        assert position == points_to_write, (
+            f"The chunks have {position} points in total, but {points_to_write} were expected.")
+        if not stop.is_set():
+            channel_no = channel_no or len(self.tasks_driver.activation_channel_names)
+            self.tasks_driver.write_numpy(np.zeros((channel_no, padding)), False)
+
+    def set_io_configs(self,
+                       points_to_write: int,
+                       timeout: float = None,
+                       allow_padding: bool = True):
         """
         Calculates and sets the I/O configuration variables related to the number of points
         the signal that is going to be writing and reading. This is only performed if there
@@ -485,6 +970,13 @@ class NationalInstrumentsSetup:
         5. points_to_read: Number of points that will be read given the number of points that
         are written and the activation/readout frequency relationship.
 
+        If the timing of the tasks was configured for a longer waveform, of up to the
+        max_padded_points of the configs, it is reused, and the number of zeros that complete
+        the waveform is set in the padding attribute. This avoids configuring the timing
+        again when alternating between waveforms of different lengths, such as the training
+        and validation batches. The timing is only configured for a longer waveform when a
+        waveform does not fit in the current one.
+
         Parameters
         ----------
         points_to_write : int
@@ -498,8 +990,13 @@ class NationalInstrumentsSetup:
             indefinitely. If you set timeout to 0, the method tries once to read
             the requested samples and returns an error if it is unable to.
             By default, None, which calculates the timeout based on the frequency.
+        allow_padding : bool
+            Whether the timing of a longer waveform can be reused. By default True.
         """
-        if self.last_points_to_write_val != points_to_write:
+        reuse = allow_padding and (points_to_write < self.last_points_to_write_val <=
+                                   self.max_padded_points)
+        if self.last_points_to_write_val != points_to_write and not reuse:
+            self.reconfigurations += 1
             self.last_points_to_write_val = points_to_write
             self.calculate_io_points(points_to_write)
             self.tasks_driver.set_sampling_frequencies(
@@ -509,6 +1006,7 @@ class NationalInstrumentsSetup:
                 ["readout_sampling_frequency"], self.offsetted_points_to_write,
                 self.offsetted_points_to_read)
             self.set_timeout(timeout)
+        self.padding = self.last_points_to_write_val - points_to_write
 
     def calculate_io_points(self, points_to_write: int):
         """
@@ -588,11 +1086,13 @@ class NationalInstrumentsSetup:
 
         Parameters
         -----------
-        y : np.array
+        y : np.array or CompressedWaveform
             Input data matrix to be sent to the device.
             The data should have a shape of: (device_input_channel_no, data_point_no)
             Where device_input_channel_no is typically the number of activation
-            electrodes of the DNPU.
+            electrodes of the DNPU. Compressed waveforms have a shape of
+            (data_point_no, device_input_channel_no) once expanded, and they are only
+            expanded when writing them to the device.
         Returns
         --------
         np.array
@@ -601,45 +1101,155 @@ class NationalInstrumentsSetup:
         """
         self.data_results = None
         self.read_security_checks(y)
-        self.set_io_configs(y.shape[1])
+        if type(y) == CompressedWaveform:
+            self.set_io_configs(len(y))
+            # Compressed waveforms are only expanded into the write buffer
+            y = y.to_numpy().T
+        else:
+            self.set_io_configs(y.shape[1])
 
+        if self.padding > 0:
+            y = self.pad_input_data(y)
         self.tasks_driver.write(y, self.configs["auto_start"])
-        read_data = self.tasks_driver.read(self.offsetted_points_to_read,
-                                           self.timeout)
+        read_data = self.tasks_driver.read_numpy(
+            self.offsetted_points_to_read, self.timeout)
         self.tasks_driver.stop_tasks()
+        if self.padding > 0:
+            # The output of the padding is discarded
+            read_data = read_data[:, :self.offsetted_points_to_read -
+                                  self.io_point_difference * self.padding]
+        # The read buffer of the tasks driver is overwritten by the next read, so the data is
+        # copied once here, and then amplified in place (see process_output_data)
+        read_data = read_data.copy()
+
+        self.data_results = read_data
+        return read_data
+
+    def pad_input_data(self, y):
+        """
+        Completes the input data with zeros, up to the number of points for which the timing of
+        the tasks is configured (see set_io_configs). As the input data ends at zero, the
+        padding does not add any step to the waveform. The padded data is written into a buffer
+        that is reused (and only grown) between calls.
+
+        Parameters
+        ----------
+        y : np.array
+            Input data, with a shape of (device_input_channel_no, data_point_no).
+
+        Returns
+        -------
+        np.array
+            Padded input data, with a shape of
+            (device_input_channel_no, data_point_no + padding).
+        """
+        shape = (y.shape[0], y.shape[1] + self.padding)
+        size = shape[0] * shape[1]
+        if len(self.padding_buffer) < size:
+            self.padding_buffer = np.empty(size, dtype=np.float64)
+        padded = self.padding_buffer[:size].reshape(shape)
+        padded[:, :y.shape[1]] = y
+        padded[:, y.shape[1]:] = 0
+        return padded
+
+    def _read_data_chunk(self, y, next_y, position, points_to_write):
+        """
+        Sends a chunk of the input waveform to the DNPU hardware and reads the output data
+        corresponding to it. The tasks are configured and started with the first chunk, the
+        next chunk is appended to the buffer of the device before reading the current one,
+        and the tasks are stopped after reading the last chunk.
+
+        Parameters
+        -----------
+        y : np.array
+            Chunk of the input waveform, with a shape of
+            (device_input_channel_no, chunk_point_no). When it is the first chunk, it is
+            expected to have already been written to the device.
+        next_y : np.array
+            Chunk that follows y, or None if y is the last chunk.
+        position : int
+            Index of the first point of y in the whole waveform.
+        points_to_write : int
+            Total number of points of the waveform.
+
+        Returns
+        --------
+        np.array
+            Data read from the device for the chunk y.
+        """
+        self.data_results = None
+        if position == 0:
+            self.read_security_checks(y,
+                                      check_end=y.shape[1] == points_to_write)
+            self.tasks_driver.write(y, self.configs["auto_start"])
+            # The offset of the setup is read together with the first chunk
+            points_to_read = self.offsetted_points_to_read - self.io_point_difference * (
+                points_to_write - y.shape[1])
+        else:
+            points_to_read = self.io_point_difference * y.shape[1]
+        if next_y is not None:
+            next_position = position + y.shape[1] + next_y.shape[1]
+            assert next_position <= points_to_write, (
+                f"The chunks exceed the {points_to_write} points to be written")
+            self.read_security_checks(next_y,
+                                      check_start=False,
+                                      check_end=next_position ==
+                                      points_to_write)
+            self.tasks_driver.write_chunk(next_y)
+        # The read buffer of the tasks driver is overwritten by the next read
+        read_data = self.tasks_driver.read_numpy(points_to_read, self.timeout).copy()
+        if next_y is None:
+            self.tasks_driver.stop_tasks()
 
         self.data_results = read_data
         return read_data
 
-    def read_security_checks(self, y):
+    def read_security_checks(self, y, check_start=True, check_end=True):
         """
         This method reads the security checks from the input data, and makes sure that the input
-        voltage does not go above certain threshhold.
+        voltage does not go above certain threshhold (see check_input_voltages).
+
+        When the security_checks of the configs are set to 'template', compressed waveforms that
+        were generated by the WaveformManager from a cached template (see the template attribute
+        of CompressedWaveform) are checked faster: their start and end only depend on the
+        template, as the slopes of the template ramp from and to zero, so they are checked once
+        per template. The voltages are checked on the values of the segments of the waveform,
+        as every sample lies between them and zero.
 
         Parameters
         ----------
-         y : np.array
+         y : np.array or CompressedWaveform
             It represents the input data as matrix where the shape is defined by the "number of
             inputs to the device" times "input points that you want to input to the device".
+        check_start : bool
+            Whether to check that the first value of the input stream is zero. It can be
+            disabled for chunks that are not at the start of a streamed waveform.
+            By default True.
+        check_end : bool
+            Whether to check that the last value of the input stream is zero. It can be
+            disabled for chunks that are not at the end of a streamed waveform.
+            By default True.
         """
-        for n, y_i in enumerate(y):
-            assert all(y_i < INPUT_VOLTAGE_THRESHOLD), (
-                f"Voltages in electrode {n} higher ({y_i.max()}) than the max."
-                + f" allowed value ({INPUT_VOLTAGE_THRESHOLD} V)")
-            assert all(y_i > -INPUT_VOLTAGE_THRESHOLD), (
-                f"Voltages in electrode {n} lower ({y_i.min()}) than the min. "
-                + "allowed value ({-INPUT_VOLTAGE_THRESHOLD} V)")
-            assert (
-                y_i[0] == 0.0
-            ), f"First value of input stream in electrode {n} is non-zero ({y_i[0]})"
-            assert (
-                y_i[-1] == 0.0
-            ), f"Last value of input stream in electrode {n} is non-zero ({y_i[-1]})"
+        if type(y) == CompressedWaveform:
+            if (self.security_checks == "template" and y.template is not None
+                    and y.template in self.checked_templates):
+                check_input_voltages(TorchUtils.to_numpy(y.values).T, False, False)
+                return
+            # Every sample of the waveform lies between its key samples
+            check_input_voltages(
+                TorchUtils.to_numpy(y.get_key_samples()).T, check_start, check_end)
+            if y.template is not None and check_start and check_end:
+                self.checked_templates.add(y.template)
+        else:
+            check_input_voltages(y, check_start, check_end)
 
     def close_tasks(self):
         """
-        To close all NI tasks currently running on this device
+        To close all NI tasks currently running on this device, and stop the acquisition worker
         """
+        with _setups_lock:
+            _setups.discard(self)
+        self.worker.stop()
         self.tasks_driver.close_tasks()
 
     def get_amplification_value(self):
@@ -665,11 +1275,9 @@ class NationalInstrumentsSetup:
     def os_signal_handler(self, signum, frame=None):
         """
         Used to handle the termination of the read task in such a way that enables the last read
-        call to the drivers to finish, and adequately closing the NI tasks afterwards.
-        A handler for a particular signal, once set, remains installed until it is explicitly reset.
-
-        More information can be found at:
-        https://docs.python.org/3/library/signal.html
+        call to the drivers to finish, and adequately closing the NI tasks afterwards. As the
+        program exits, the acquisitions of every other live setup are interrupted and their
+        tasks closed as well (see interrupt_setups).
 
         Parameters
         ----------
@@ -678,27 +1286,21 @@ class NationalInstrumentsSetup:
         frame : int, optional
             The current stack frame, by default None.
         """
-        event.set()
-        print(
-            "Interruption/Termination signal received. Waiting for the reader to finish."
-        )
-        p.join()
-        print("Closing nidaqmx tasks")
-        self.close_tasks()
-        sys.exit(0)
+        interrupt_setups(signum, frame)
 
     def enable_os_signals(self):
         """
         Enables the OS signals by adding an a signal HandlerRoutine to support read/write in both
-        linux and windows in Windows and Linux operating systems.
+        linux and windows in Windows and Linux operating systems. The handler is shared by all the
+        setups of the process (see interrupt_setups).
         """
         import win32api  # type: ignore
 
         if sys.platform == "win32":
-            win32api.SetConsoleCtrlHandler(self.os_signal_handler, True)
+            win32api.SetConsoleCtrlHandler(interrupt_setups, True)
         else:
-            signal.signal(signal.SIGTERM, self.os_signal_handler)
-            signal.signal(signal.SIGINT, self.os_signal_handler)
+            signal.signal(signal.SIGTERM, interrupt_setups)
+            signal.signal(signal.SIGINT, interrupt_setups)
 
     def disable_os_signals(self):
         """
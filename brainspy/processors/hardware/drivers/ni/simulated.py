@@ -0,0 +1,702 @@
+"""
+File containing a simulated backend for the tasks of the national instruments setups. It replaces
+the nidaqmx tasks, stream readers and writers, and instruments that are used by the
+IOTasksManager with objects that model their timing, so that the drivers, the processors and
+the algorithms that use them can be run, debugged and benchmarked offline, without a setup.
+
+The simulation models:
+
+1. The sample clocks of the activation and readout tasks, for finite and continuous sampling.
+Readings block until the requested samples would have been acquired, either in real time or in
+a scaled (accelerated) time.
+
+2. The start trigger of CDAQ to CDAQ setups, which delays the readout by one sample, and the
+latency between the start of the activation and readout tasks of CDAQ to NIDAQ setups, which is
+compensated by the synchronisation spike.
+
+3. The buffers of the tasks: writes that do not fit in the buffer of the activation task, the
+generation running out of samples when regeneration is disabled, and the readout buffer being
+overwritten before it is read.
+
+4. The response of the device, computed by a surrogate model from the activation voltages,
+and corrected by the amplification and inversion of the setup, with optional gaussian noise.
+
+The errors are raised as nidaqmx.errors.DaqError, with the error codes that NI-DAQmx reports
+in the same situations.
+"""
+import time
+import threading
+
+import numpy as np
+import nidaqmx
+import nidaqmx.constants as constants
+
+from brainspy.processors.hardware.drivers.ni.tasks import (IOTasksManager,
+                                                           SAMPLES_NOT_AVAILABLE_ERROR)
+
+# The application is not able to keep up with the hardware acquisition.
+SAMPLES_OVERWRITTEN_ERROR = -200279
+# The generation has stopped to prevent the regeneration of old samples.
+GENERATION_UNDERFLOW_ERROR = -200290
+# Some or all of the samples to write could not be written to the buffer yet.
+WRITE_TIMEOUT_ERROR = -200292
+# Memory full, the buffer cannot hold all the samples to write.
+MEMORY_FULL_ERROR = -50352
+
+# Latency, in seconds, between the start of the activation and readout tasks when they are not
+# connected by a start trigger.
+DEFAULT_START_LATENCY = (0.0, 0.01)
+# Delay, in readout samples, of the readout task when it is started by a start trigger.
+DEFAULT_TRIGGER_DELAY = 1
+# Time between checks of the clock when waiting in real time, in seconds.
+POLLING_INTERVAL = 0.001
+
+
+def default_surrogate(x):
+    """
+    Surrogate model used when none is specified. Every readout channel measures the mean of the
+    activation voltages.
+
+    Parameters
+    ----------
+    x : np.array
+        Activation voltages, with a shape of (point_no, activation_channel_no).
+
+    Returns
+    -------
+    np.array
+        Output current, with a shape of (point_no, 1).
+    """
+    return x.mean(axis=1, keepdims=True)
+
+
+class SimulatedSession:
+    """
+    Shared state of the simulated activation and readout tasks of an IOTasksManager. It keeps
+    the samples written to the activation task, the position of the readout task, and the
+    virtual clock of the acquisition, which starts when the first of the tasks is started.
+
+    The clock runs in real time multiplied by a time scale. With a time scale of zero, it only
+    advances when samples are read, as fast as the samples can be computed.
+
+    Parameters
+    ----------
+    configs : dict
+        Configurations of the driver, as described in NationalInstrumentsSetup. The
+        configurations of the simulation are taken from its 'simulated_backend' key, as
+        described in SimulatedIOTasksManager.
+    """
+    def __init__(self, configs: dict):
+        sim_configs = configs.get("simulated_backend") or {}
+        self.time_scale = sim_configs.get("time_scale", 1.0)
+        assert self.time_scale >= 0, "The time scale should not be negative"
+        self.noise = sim_configs.get("noise", 0.0)
+        self.buffer_size = sim_configs.get("buffer_size")
+        assert self.buffer_size is None or (
+            type(self.buffer_size) == int and self.buffer_size > 0
+        ), "The buffer size should be a positive integer"
+        self.trigger_delay = sim_configs.get("trigger_delay",
+                                             DEFAULT_TRIGGER_DELAY)
+        self.start_latency = sim_configs.get("start_latency",
+                                             DEFAULT_START_LATENCY)
+        if isinstance(self.start_latency, (int, float)):
+            self.start_latency = (self.start_latency, self.start_latency)
+        assert 0 <= self.start_latency[0] <= self.start_latency[1], (
+            "The start latency should be a non-negative (min, max) range in seconds")
+        surrogate = sim_configs.get("surrogate")
+        if surrogate is None:
+            surrogate = default_surrogate
+        elif hasattr(surrogate, "forward_numpy"):
+            surrogate = surrogate.forward_numpy
+        assert callable(surrogate), "The surrogate should be callable"
+        self.surrogate = surrogate
+        self.rng = np.random.default_rng(sim_configs.get("seed"))
+        self.amplification = np.asarray(configs["amplification"], dtype=np.float64)
+        self.inversion = -1 if configs["inverted_output"] else 1
+
+        self.condition = threading.Condition()
+        self.activation_task = None
+        self.readout_task = None
+        self.triggered = False
+        self.synchronised = False
+        self.callback = None
+        self.samples_per_callback = 0
+        self.callback_thread = None
+
+        # Counters of the simulation, for benchmarking
+        self.acquisitions = 0
+        self.samples_written = 0
+        self.samples_read = 0
+        self.simulated_time = 0.0
+        self.samples = np.empty((0, 0))
+        self.reset()
+
+    def reset(self):
+        """
+        Clears the samples and the clock of the current acquisition. The buffer of the samples
+        is kept for the next acquisition.
+        """
+        self.written = 0
+        self.read_position = 0
+        self.started = False
+        self.start_time = None
+        self.elapsed = 0.0
+        self.delay = 0
+
+    # Configuration of the tasks
+
+    @property
+    def activation_rate(self):
+        return self.activation_task.timing.samp_clk_rate
+
+    @property
+    def readout_rate(self):
+        return self.readout_task.timing.samp_clk_rate
+
+    @property
+    def io_point_difference(self):
+        return int(round(self.readout_rate / self.activation_rate))
+
+    def is_continuous(self, task):
+        return task.timing.samp_quant_samp_mode == constants.AcquisitionType.CONTINUOUS
+
+    def allows_regeneration(self):
+        return (self.activation_task.out_stream.regen_mode ==
+                constants.RegenerationMode.ALLOW_REGENERATION)
+
+    def get_generation_end(self):
+        """
+        Gets the number of activation samples that the activation task generates before
+        finishing. Continuous generation does not finish.
+        """
+        if self.is_continuous(self.activation_task):
+            return np.inf
+        return self.activation_task.timing.samp_quant_samp_per_chan
+
+    def get_write_capacity(self):
+        """
+        Gets the maximum number of samples per channel that can be in the buffer of the
+        activation task, or None if it is not limited.
+        """
+        if self.is_continuous(self.activation_task):
+            return self.activation_task.timing.samp_quant_samp_per_chan
+        if self.allows_regeneration():
+            # The whole waveform has to be kept in the buffer to be regenerated
+            return None
+        return self.buffer_size
+
+    # Clock
+
+    def start(self):
+        """
+        Starts the acquisition, when the first of the tasks is started. The delay of the readout
+        with respect to the activation is drawn for each acquisition.
+        """
+        if self.started:
+            return
+        self.started = True
+        self.start_time = time.monotonic()
+        self.elapsed = 0.0
+        if self.triggered:
+            self.delay = self.trigger_delay
+        else:
+            latency = self.rng.uniform(*self.start_latency)
+            self.delay = -int(round(latency * self.readout_rate))
+        self.acquisitions += 1
+        if self.callback is not None:
+            self.callback_thread = threading.Thread(target=self._run_callback,
+                                                    name="SimulatedReadCallback",
+                                                    daemon=True)
+            self.callback_thread.start()
+
+    def stop(self):
+        """
+        Stops the acquisition, when any of the tasks is stopped. Samples written afterwards
+        start a new waveform.
+        """
+        with self.condition:
+            if self.started:
+                self.simulated_time += self.get_time()
+            self.reset()
+            self.condition.notify_all()
+
+    def get_time(self):
+        """
+        Gets the time of the acquisition, in simulated seconds since it started.
+        """
+        if not self.started:
+            return 0.0
+        if self.time_scale == 0:
+            return self.elapsed
+        return max(self.elapsed,
+                   (time.monotonic() - self.start_time) / self.time_scale)
+
+    def get_generated(self, t):
+        """
+        Number of activation samples generated at a simulated time.
+        """
+        return int(t * self.activation_rate)
+
+    def get_acquired(self, t):
+        """
+        Number of readout samples acquired at a simulated time.
+        """
+        return max(int(t * self.readout_rate) + self.delay, 0)
+
+    def get_readout_time(self, sample_no):
+        """
+        Simulated time at which a number of readout samples have been acquired.
+        """
+        return max(sample_no - self.delay, 0) / self.readout_rate
+
+    def get_activation_index(self, readout_index):
+        """
+        Index of the activation sample that is generated while each readout sample is acquired.
+        """
+        return np.floor_divide(readout_index - self.delay, self.io_point_difference)
+
+    def wait(self, deadline):
+        """
+        Waits on the condition of the session, for at most the real time until a deadline.
+
+        Returns
+        -------
+        bool
+            False if the deadline has passed.
+        """
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        self.condition.wait(min(remaining, POLLING_INTERVAL)
+                            if self.time_scale > 0 else remaining)
+        return True
+
+    def check_generation(self):
+        """
+        Raises the errors of an activation task that run out of samples, or of a readout task
+        whose buffer has been overwritten before it was read. Only clocks running in real time
+        can fall behind.
+        """
+        if not self.started or self.time_scale == 0:
+            return
+        t = self.get_time()
+        if (not self.allows_regeneration()
+                and self.written < min(self.get_generated(t),
+                                       self.get_generation_end())):
+            raise nidaqmx.errors.DaqError(
+                "The generation has stopped to prevent the regeneration of old samples. "
+                + f"{self.written} samples were written, but {self.get_generated(t)} "
+                + "were needed.", GENERATION_UNDERFLOW_ERROR,
+                self.activation_task.name)
+        if (self.is_continuous(self.readout_task) and self.get_acquired(t) -
+                self.read_position > self.readout_task.timing.samp_quant_samp_per_chan):
+            raise nidaqmx.errors.DaqError(
+                "The application is not able to keep up with the hardware acquisition. "
+                + "Samples were overwritten before they were read.",
+                SAMPLES_OVERWRITTEN_ERROR, self.readout_task.name)
+
+    # Activation task
+
+    def write(self, data, auto_start, timeout):
+        """
+        Appends samples to the buffer of the activation task. When the buffer is limited and it
+        is full, it waits until the activation task has generated enough samples.
+
+        Parameters
+        ----------
+        data : np.array
+            Samples with a shape of (activation_channel_no, point_no).
+        auto_start : bool
+            Whether to start the activation task after writing.
+        timeout : float
+            Maximum real time, in seconds, to wait for space in the buffer.
+        """
+        assert data.shape[0] == self.activation_task.number_of_channels, (
+            f"The data has {data.shape[0]} channels, but the activation task has "
+            + f"{self.activation_task.number_of_channels}")
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            acquisition = self.acquisitions if self.started else None
+            capacity = self.get_write_capacity()
+            if (capacity is None and self.buffer_size is not None
+                    and self.written + data.shape[1] > self.buffer_size):
+                raise nidaqmx.errors.DaqError(
+                    f"Memory full. The buffer can hold {self.buffer_size} samples per "
+                    + f"channel, but {self.written + data.shape[1]} were written.",
+                    MEMORY_FULL_ERROR, self.activation_task.name)
+            position = 0
+            while position < data.shape[1]:
+                if acquisition is not None and (not self.started
+                                                or acquisition != self.acquisitions):
+                    raise nidaqmx.errors.DaqError(
+                        "The task was stopped while waiting to write the samples.",
+                        WRITE_TIMEOUT_ERROR, self.activation_task.name)
+                self.check_generation()
+                free = data.shape[1] - position
+                if capacity is not None:
+                    free = min(
+                        free, capacity -
+                        (self.written - self.get_generated(self.get_time())))
+                if free > 0:
+                    self._append(data[:, position:position + free])
+                    position += free
+                    self.condition.notify_all()
+                elif not self.started or not self.wait(deadline):
+                    raise nidaqmx.errors.DaqError(
+                        "Some or all of the samples to write could not be written to the "
+                        + "buffer yet.", WRITE_TIMEOUT_ERROR,
+                        self.activation_task.name)
+        if auto_start:
+            self.activation_task.start()
+
+    def _append(self, data):
+        """
+        Appends samples to the buffer, growing it geometrically.
+        """
+        if self.samples.shape[0] != data.shape[0]:
+            self.samples = np.empty((data.shape[0], max(data.shape[1], 1024)))
+        end = self.written + data.shape[1]
+        if end > self.samples.shape[1]:
+            samples = np.empty((data.shape[0], max(end, 2 * self.samples.shape[1])))
+            samples[:, :self.written] = self.samples[:, :self.written]
+            self.samples = samples
+        self.samples[:, self.written:end] = data
+        self.written = end
+        self.samples_written += data.shape[1]
+
+    # Readout task
+
+    def is_available(self, sample_no):
+        """
+        Whether the activation samples needed to compute a number of readout samples have been
+        written. The samples that are generated after the end of a finite generation are zero.
+        """
+        last = int(self.get_activation_index(sample_no - 1))
+        return (last < self.written or last >= self.get_generation_end()
+                or (self.allows_regeneration() and self.written > 0))
+
+    def read(self, data, sample_no, timeout):
+        """
+        Reads the next samples of the readout task, waiting until they have been acquired.
+
+        Parameters
+        ----------
+        data : np.array
+            Array of shape (readout_channel_no, sample_no) where the samples are written.
+        sample_no : int
+            Number of samples per channel to read.
+        timeout : float
+            Maximum real time, in seconds, to wait for the samples.
+        """
+        assert data.shape == (self.readout_task.number_of_channels, sample_no), (
+            "The shape of the data does not match the channels of the readout task")
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            if not self.started:
+                # Reading starts the readout task, as in nidaqmx
+                self.readout_task.start()
+            end = self.read_position + sample_no
+            end_time = self.get_readout_time(end)
+            while True:
+                self.check_generation()
+                if not self.started:
+                    raise nidaqmx.errors.DaqError(
+                        "The task was stopped while waiting for the samples.",
+                        SAMPLES_NOT_AVAILABLE_ERROR, self.readout_task.name)
+                if self.time_scale == 0:
+                    ready = self.is_available(end)
+                else:
+                    ready = self.get_time() >= end_time
+                if ready:
+                    break
+                if not self.wait(deadline):
+                    raise nidaqmx.errors.DaqError(
+                        "Some or all of the samples requested have not yet been acquired. "
+                        + f"{sample_no} samples were requested.",
+                        SAMPLES_NOT_AVAILABLE_ERROR, self.readout_task.name)
+            self.elapsed = max(self.elapsed, end_time)
+            data[:] = self.compute_output(np.arange(self.read_position, end))
+            self.read_position = end
+            self.samples_read += sample_no
+            self.condition.notify_all()
+
+    def compute_output(self, readout_index):
+        """
+        Computes the readout samples from the activation samples generated while they are
+        acquired. The surrogate model is evaluated once per activation sample.
+
+        Parameters
+        ----------
+        readout_index : np.array
+            Indices of the readout samples since the start of the acquisition.
+
+        Returns
+        -------
+        np.array
+            Readout samples with a shape of (readout_channel_no, len(readout_index)).
+        """
+        index = self.get_activation_index(readout_index)
+        valid = (index >= 0) & (index < min(self.written, self.get_generation_end()))
+        if self.allows_regeneration() and self.written > 0:
+            regenerated = (index >= self.written) & (index < self.get_generation_end())
+            index = np.where(regenerated, index % max(self.written, 1), index)
+            valid |= regenerated
+        unique, inverse = np.unique(np.where(valid, index, -1), return_inverse=True)
+        channel_no = self.activation_task.number_of_channels
+        activations = np.zeros((channel_no, len(unique)))
+        has_samples = unique >= 0
+        activations[:, has_samples] = self.samples[:, unique[has_samples]]
+        regular_no = channel_no - int(self.synchronised)
+        output = np.asarray(self.surrogate(activations[:regular_no].T),
+                            dtype=np.float64).reshape(len(unique), -1)
+        output = output[inverse].T
+        if self.noise:
+            output = output + self.rng.normal(0, self.noise, output.shape)
+        # The amplification and inversion are corrected again by the driver
+        output = self.inversion * output / self.amplification.reshape(-1, 1)
+        if self.synchronised:
+            # The synchronisation channel is read back directly
+            output = np.concatenate((output, activations[-1:, inverse]))
+        return output
+
+    # Read callback
+
+    def register_callback(self, samples_per_read, callback):
+        """
+        Sets the function that is called every time that a number of samples are acquired.
+        """
+        with self.condition:
+            self.callback = callback
+            self.samples_per_callback = samples_per_read
+            self.condition.notify_all()
+
+    def _run_callback(self):
+        """
+        Calls the read callback whenever the next samples_per_read samples have been acquired,
+        until the acquisition is stopped or the samples are not read by the callback.
+        """
+        while True:
+            with self.condition:
+                callback, sample_no = self.callback, self.samples_per_callback
+                if not self.started or callback is None:
+                    return
+                position = self.read_position
+                end = position + sample_no
+                if self.time_scale == 0:
+                    ready = self.is_available(end)
+                else:
+                    ready = self.get_time() >= self.get_readout_time(end)
+                if not ready:
+                    self.condition.wait(POLLING_INTERVAL if self.time_scale > 0 else None)
+                    continue
+            callback(None, constants.EveryNSamplesEventType.ACQUIRED_INTO_BUFFER.value,
+                     sample_no, None)
+            with self.condition:
+                if self.read_position == position:
+                    return
+
+
+class SimulatedTiming:
+    """
+    Sample clock timing of a simulated task, with the attributes of nidaqmx.task.Timing.
+    """
+    def __init__(self):
+        self.samp_clk_rate = 1000.0
+        self.samp_quant_samp_mode = constants.AcquisitionType.FINITE
+        self.samp_quant_samp_per_chan = 1000
+
+    def cfg_samp_clk_timing(self,
+                            rate,
+                            source="",
+                            active_edge=constants.Edge.RISING,
+                            sample_mode=constants.AcquisitionType.FINITE,
+                            samps_per_chan=1000):
+        self.samp_clk_rate = float(rate)
+        self.samp_quant_samp_mode = sample_mode
+        self.samp_quant_samp_per_chan = samps_per_chan
+
+
+class SimulatedStartTrigger:
+    """
+    Start trigger of a simulated task. When it is configured, the readout starts one trigger
+    delay before the activation instead of after a random latency.
+    """
+    def __init__(self, session):
+        self.session = session
+        self.source = None
+
+    def cfg_dig_edge_start_trig(self, trigger_source, trigger_edge=constants.Edge.RISING):
+        self.source = trigger_source
+        self.session.triggered = True
+
+
+class SimulatedTriggers:
+    def __init__(self, session):
+        self.start_trigger = SimulatedStartTrigger(session)
+
+
+class SimulatedStream:
+    """
+    Input or output stream of a simulated task.
+    """
+    def __init__(self, task):
+        self.task = task
+        self.regen_mode = constants.RegenerationMode.ALLOW_REGENERATION
+
+
+class SimulatedChannels:
+    """
+    Analog input or output channels of a simulated task.
+    """
+    def __init__(self, task):
+        self.task = task
+
+    def add_ao_voltage_chan(self, physical_channel, name_to_assign_to_channel="",
+                            min_val=-10.0, max_val=10.0, **kwargs):
+        self.task.channel_names.append(name_to_assign_to_channel or physical_channel)
+        self.task.channel_ranges.append((min_val, max_val))
+
+    add_ai_voltage_chan = add_ao_voltage_chan
+
+
+class SimulatedTask:
+    """
+    Simulated nidaqmx.Task, with the methods and attributes used by the IOTasksManager.
+    """
+    def __init__(self, name, session):
+        self.name = name
+        self.session = session
+        self.channel_names = []
+        self.channel_ranges = []
+        self.ao_channels = self.ai_channels = SimulatedChannels(self)
+        self.out_stream = self.in_stream = SimulatedStream(self)
+        self.timing = SimulatedTiming()
+        self.triggers = SimulatedTriggers(session)
+        self.running = False
+
+    @property
+    def number_of_channels(self):
+        return len(self.channel_names)
+
+    def start(self):
+        with self.session.condition:
+            self.running = True
+            self.session.start()
+
+    def stop(self):
+        self.running = False
+        self.session.stop()
+
+    def close(self):
+        self.stop()
+
+    def read(self, number_of_samples_per_channel=1, timeout=10.0):
+        data = np.empty((self.number_of_channels, number_of_samples_per_channel))
+        self.session.read(data, number_of_samples_per_channel, timeout)
+        if self.number_of_channels == 1:
+            return data[0].tolist()
+        return data.tolist()
+
+    def register_every_n_samples_acquired_into_buffer_event(self, sample_interval,
+                                                            callback_method):
+        self.session.register_callback(sample_interval, callback_method)
+
+
+class SimulatedReader:
+    """
+    Simulated nidaqmx.stream_readers.AnalogMultiChannelReader.
+    """
+    def __init__(self, session):
+        self.session = session
+
+    def read_many_sample(self, data, number_of_samples_per_channel, timeout=10.0):
+        self.session.read(data, number_of_samples_per_channel, timeout)
+        return number_of_samples_per_channel
+
+
+class SimulatedWriter:
+    """
+    Simulated nidaqmx.stream_writers.AnalogMultiChannelWriter.
+    """
+    def __init__(self, session):
+        self.session = session
+        self.auto_start = False
+
+    def write_many_sample(self, data, timeout=10.0):
+        self.session.write(data, self.auto_start, timeout)
+        return data.shape[1]
+
+
+class SimulatedDevice:
+    """
+    Simulated nidaqmx.system.device.Device.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def reset_device(self):
+        pass
+
+
+class SimulatedIOTasksManager(IOTasksManager):
+    """
+    IOTasksManager whose tasks are simulated instead of running on national instruments
+    hardware (see SimulatedSession). It is used by the NationalInstrumentsSetup drivers when
+    their configurations contain the 'simulated_backend' key, which is a dictionary that can
+    have the following keys:
+
+    1. time_scale : float, optional
+    Simulated seconds per real second. 1 simulates the acquisitions in real time, lower values
+    accelerate them, and 0 simulates them as fast as possible. By default 1.
+
+    2. surrogate : callable or SurrogateModel, optional
+    Model of the device, that receives the activation voltages with a shape of
+    (point_no, activation_channel_no) and returns the output currents with a shape of
+    (point_no, readout_channel_no). Objects with a forward_numpy method, such as the
+    SurrogateModel, are called through it. By default, the mean of the activation voltages.
+
+    3. noise : float, optional
+    Standard deviation of the gaussian noise added to the output currents. By default 0.
+
+    4. buffer_size : int, optional
+    Number of samples per channel that fit in the buffer of the activation task, for finite
+    sampling. By default None, which does not limit it.
+
+    5. trigger_delay : int, optional
+    Delay of the readout, in readout samples, when the tasks are synchronised with a start
+    trigger. By default DEFAULT_TRIGGER_DELAY.
+
+    6. start_latency : float or (float, float), optional
+    Range, in seconds, of the latency between the start of the activation and the readout
+    tasks when they are not connected by a start trigger, drawn for each acquisition. By
+    default DEFAULT_START_LATENCY.
+
+    7. seed : int, optional
+    Seed of the noise and the latencies.
+    """
+    def __init__(self, configs):
+        self.session = SimulatedSession(configs)
+        super().__init__(configs)
+
+    def create_task(self, name):
+        task = SimulatedTask(name, self.session)
+        if name.startswith("activation_task"):
+            self.session.activation_task = task
+        else:
+            self.session.readout_task = task
+        return task
+
+    def create_device(self, name):
+        return SimulatedDevice(name)
+
+    def create_reader(self):
+        return SimulatedReader(self.session)
+
+    def create_writer(self):
+        return SimulatedWriter(self.session)
+
+    def add_synchronisation_channels(self, readout_instrument, activation_instrument,
+                                     activation_channel_no=7, readout_channel_no=7):
+        super().add_synchronisation_channels(readout_instrument, activation_instrument,
+                                             activation_channel_no, readout_channel_no)
+        self.session.synchronised = True
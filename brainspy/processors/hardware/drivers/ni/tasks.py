@@ -17,12 +17,17 @@ import sys
 import nidaqmx
 import nidaqmx.constants as constants
 import nidaqmx.system.device as device
+from nidaqmx.stream_readers import AnalogMultiChannelReader
+from nidaqmx.stream_writers import AnalogMultiChannelWriter
 
 import numpy as np
 from datetime import datetime
 from brainspy.processors.hardware.drivers.ni.channels import init_channel_data
 
 RANGE_MARGIN = 0.01
+# NI-DAQmx error code of a read that times out: some or all of the samples requested have not
+# yet been acquired.
+SAMPLES_NOT_AVAILABLE_ERROR = -200284
 
 
 class IOTasksManager:
@@ -53,6 +58,9 @@ class IOTasksManager:
         self.acquisition_type = constants.AcquisitionType.FINITE
         self.activation_task = None
         self.readout_task = None
+        self.reader = None
+        self.writer = None
+        self.read_buffer = np.empty(0)
         try:
             self.init_tasks(configs)
         except Exception as e:
@@ -61,6 +69,63 @@ class IOTasksManager:
             self.close_tasks()
             raise e
 
+    def create_task(self, name):
+        """
+        Creates one of the tasks of the manager. The methods create_task, create_device,
+        create_reader and create_writer are the only ones that instantiate nidaqmx objects, so
+        that they can be replaced by a different backend (see SimulatedIOTasksManager).
+
+        Parameters
+        ----------
+        name : str
+            Name of the task.
+
+        Returns
+        -------
+        nidaqmx.Task
+            The new task.
+        """
+        return nidaqmx.Task(name)
+
+    def create_device(self, name):
+        """
+        Creates the object of one of the instruments used by the tasks, which is reset when
+        the tasks are closed.
+
+        Parameters
+        ----------
+        name : str
+            Name of the instrument as observed in the NI Max software. E.g., cDAQ1Mod3
+
+        Returns
+        -------
+        nidaqmx.system.device.Device
+            The instrument.
+        """
+        return device.Device(name=name)
+
+    def create_reader(self):
+        """
+        Creates the stream reader of the readout task.
+
+        Returns
+        -------
+        nidaqmx.stream_readers.AnalogMultiChannelReader
+            Reader of all the channels of the readout task.
+        """
+        return AnalogMultiChannelReader(self.readout_task.in_stream)
+
+    def create_writer(self):
+        """
+        Creates the stream writer of the activation task.
+
+        Returns
+        -------
+        nidaqmx.stream_writers.AnalogMultiChannelWriter
+            Writer of all the channels of the activation task.
+        """
+        return AnalogMultiChannelWriter(self.activation_task.out_stream)
+
     def init_activation_channels(self, channel_names, voltage_ranges=None):
         """
         Initialises the activation channels connected to the activation electrodes of the device.
@@ -102,7 +167,7 @@ class IOTasksManager:
                     voltage_range[1], (np.floating, float, int)
                 ), "Volatge range can contain only int or float type values"
 
-        self.activation_task = nidaqmx.Task(
+        self.activation_task = self.create_task(
             "activation_task_" +
             datetime.utcnow().strftime("%Y_%m_%d_%H%M%S_%f"))
         for i in range(len(channel_names)):
@@ -154,7 +219,7 @@ class IOTasksManager:
             assert type(
                 readout_channel
             ) == str, "Each readout_channel should be of type - str"
-        self.readout_task = nidaqmx.Task(
+        self.readout_task = self.create_task(
             "readout_task_" + datetime.utcnow().strftime("%Y_%m_%d_%H%M%S_%f"))
         for i in range(len(readout_channels)):
             channel = readout_channels[i]
@@ -204,6 +269,89 @@ class IOTasksManager:
             samps_per_chan=points_to_read,
         )
 
+    def set_continuous_sampling(self, activation_sampling_frequency: int,
+                                readout_sampling_frequency: int,
+                                write_buffer_size: int, read_buffer_size: int):
+        """
+        Configures both tasks to generate and acquire samples continuously, using on-board ring
+        buffers of the given sizes, instead of a finite number of samples. Regeneration is
+        disabled, so that the activation task never repeats samples that were already
+        generated: new samples have to be written before the buffer runs out. Calling
+        set_sampling_frequencies configures finite sampling again, and set_regeneration(True)
+        allows regeneration again.
+
+        Parameters
+        ----------
+        activation_sampling_frequency : int
+            The number of samples that the activation task will generate in one second.
+        readout_sampling_frequency : int
+            The number of samples that the readout task will obtain in one second.
+        write_buffer_size : int
+            Size of the ring buffer of the activation task, in samples per channel.
+        read_buffer_size : int
+            Size of the ring buffer of the readout task, in samples per channel.
+        """
+        assert type(write_buffer_size) == int and write_buffer_size > 0, (
+            "The write_buffer_size value should be a positive int")
+        assert type(read_buffer_size) == int and read_buffer_size > 0, (
+            "The read_buffer_size value should be a positive int")
+        self.activation_task.timing.cfg_samp_clk_timing(
+            activation_sampling_frequency,
+            sample_mode=constants.AcquisitionType.CONTINUOUS,
+            samps_per_chan=write_buffer_size,
+        )
+        self.readout_task.timing.cfg_samp_clk_timing(
+            readout_sampling_frequency,
+            sample_mode=constants.AcquisitionType.CONTINUOUS,
+            samps_per_chan=read_buffer_size,
+        )
+        self.set_regeneration(False)
+
+    def register_read_callback(self, samples_per_read: int, callback):
+        """
+        Registers a function that receives the samples of the readout task every time that
+        samples_per_read samples per channel have been acquired into its buffer, using
+        register_every_n_samples_acquired_into_buffer_event from nidaqmx. The samples are read
+        with the stream reader into a new array of shape (channel_no, samples_per_read). The
+        function is called from a thread of the nidaqmx driver, and it receives the exception
+        instead of the samples if they could not be read.
+
+        More information about the event can be found at:
+        https://nidaqmx-python.readthedocs.io/en/latest/task.html
+
+        Parameters
+        ----------
+        samples_per_read : int
+            Number of samples per channel between calls.
+        callback : callable or None
+            Function that receives the samples, or None to unregister the current one.
+        """
+        assert type(samples_per_read) == int and samples_per_read > 0, (
+            "The samples_per_read value should be a positive int")
+        if callback is None:
+            self.readout_task.register_every_n_samples_acquired_into_buffer_event(
+                samples_per_read, None)
+            return
+        if self.reader is None:
+            self.reader = self.create_reader()
+        channel_no = self.readout_task.number_of_channels
+
+        def every_n_samples(task_handle, event_type, number_of_samples,
+                            callback_data):
+            try:
+                data = np.empty((channel_no, number_of_samples))
+                self.reader.read_many_sample(
+                    data,
+                    number_of_samples_per_channel=number_of_samples,
+                    timeout=0)
+            except Exception as error:
+                data = error
+            callback(data)
+            return 0
+
+        self.readout_task.register_every_n_samples_acquired_into_buffer_event(
+            samples_per_read, every_n_samples)
+
     def add_synchronisation_channels(
         self,
         readout_instrument,
@@ -321,6 +469,55 @@ class IOTasksManager:
             number_of_samples_per_channel=number_of_samples_per_channel,
             timeout=timeout)
 
+    def read_numpy(self, number_of_samples_per_channel, timeout=None):
+        """
+        Reads samples from all the channels of the readout task directly into a preallocated
+        float64 buffer, using a nidaqmx AnalogMultiChannelReader. Unlike the read method, it
+        does not build a list of lists of Python floats. The buffer is reused (and only grown)
+        between calls, so the returned array is overwritten by the next read and should be
+        consumed or copied before that.
+
+        More information about stream readers can be found at:
+        https://nidaqmx-python.readthedocs.io/en/latest/stream_readers.html
+
+        Parameters
+        ----------
+        number_of_samples_per_channel : int
+            Number of samples to read from each channel.
+        timeout : Optional[float]
+            Amount of time in seconds to wait for samples to become available. By default
+            None, which waits for the default 10 seconds of nidaqmx.
+
+        Returns
+        -------
+        np.array
+            The samples read, with a shape of (channel_no, number_of_samples_per_channel).
+        """
+        assert type(number_of_samples_per_channel
+                    ) == int, "number_of_samples_per_channel should be of type - int"
+        assert (number_of_samples_per_channel >
+                0), "number_of_samples_per_channel value cannot be negative"
+        if timeout is not None:
+            assert type(timeout) == float or type(
+                timeout) == int, "timeout should be of type float or int"
+            assert timeout >= 0, "timeout value cannot be negative"
+        else:
+            timeout = 10.0
+
+        if self.reader is None:
+            self.reader = self.create_reader()
+        size = self.readout_task.number_of_channels * number_of_samples_per_channel
+        if len(self.read_buffer) < size:
+            self.read_buffer = np.empty(size, dtype=np.float64)
+        data = self.read_buffer[:size].reshape(
+            (self.readout_task.number_of_channels,
+             number_of_samples_per_channel))
+        self.reader.read_many_sample(
+            data,
+            number_of_samples_per_channel=number_of_samples_per_channel,
+            timeout=timeout)
+        return data
+
     def start_trigger(self, trigger_source):
         """
         To synchronise cdaq to cdaq modules a start trigger can be set,
@@ -389,9 +586,8 @@ class IOTasksManager:
         assert type(
             auto_start) == bool, "auto_start param should be of type - bool"
 
-        y = np.require(y, dtype=y.dtype, requirements=["C", "W"])
         try:
-            self.activation_task.write(y, auto_start=auto_start)
+            self.write_numpy(y, auto_start)
             if not auto_start:
                 self.activation_task.start()
                 self.readout_task.start()
@@ -401,6 +597,73 @@ class IOTasksManager:
             self.close_tasks()
             sys.exit(1)
 
+    def write_chunk(self, y):
+        """
+        Appends samples to the buffer of an activation task that has already been started with
+        the write method. It is used for streaming waveforms that are written chunk by chunk,
+        where the next chunk has to be in the buffer before the device finishes generating
+        the current one. It also catches DaqError exceptions.
+
+        Parameters
+        ----------
+        y : np.array
+            Contains the samples to be appended to the activation task, with a shape of
+            (activation_channel_no, chunk_point_no).
+        """
+        assert type(
+            y
+        ) == np.ndarray, "The sample data: y should be of type - numpy array"
+
+        try:
+            self.write_numpy(y, False)
+        except nidaqmx.errors.DaqError as error:
+            print("There was an error writing to the activation task: " +
+                  self.activation_task.name + "\n" + str(error))
+            self.close_tasks()
+            sys.exit(1)
+
+    def write_numpy(self, y, auto_start):
+        """
+        Writes a two dimensional array of samples to all the channels of the activation task,
+        using a nidaqmx AnalogMultiChannelWriter, which passes the memory of the array directly
+        to the driver. The samples are only copied when they are not already a C-contiguous
+        float64 array. DaqError exceptions are not caught.
+
+        More information about stream writers can be found at:
+        https://nidaqmx-python.readthedocs.io/en/latest/stream_writers.html
+
+        Parameters
+        ----------
+        y : np.array
+            Samples to be written, with a shape of (activation_channel_no, point_no).
+        auto_start : bool
+            True to start the activation task automatically after writing.
+        """
+        if y.ndim == 1:
+            y = y[np.newaxis, :]
+        y = np.require(y, dtype=np.float64, requirements=["C", "W"])
+        if self.writer is None:
+            self.writer = self.create_writer()
+        self.writer.auto_start = auto_start
+        self.writer.write_many_sample(y)
+
+    def set_regeneration(self, allow: bool):
+        """
+        Sets whether the activation task is allowed to regenerate samples that are already in
+        its buffer. Regeneration has to be disabled while streaming chunks, so that the
+        device raises an error instead of repeating old samples if the next chunk arrives late.
+
+        Parameters
+        ----------
+        allow : bool
+            True to allow regeneration (default nidaqmx behaviour), False to disallow it.
+        """
+        assert type(allow) == bool, "allow param should be of type - bool"
+        if allow:
+            self.activation_task.out_stream.regen_mode = constants.RegenerationMode.ALLOW_REGENERATION
+        else:
+            self.activation_task.out_stream.regen_mode = constants.RegenerationMode.DONT_ALLOW_REGENERATION
+
     def stop_tasks(self):
         """
         To stop the all tasks on this device namely - the activation tasks and the readout tasks to
@@ -525,7 +788,7 @@ class IOTasksManager:
         ) = init_channel_data(configs)
         devices = []
         for instrument in instruments:
-            devices.append(device.Device(name=instrument))
+            devices.append(self.create_device(instrument))
         self.devices = devices
         # TODO: add a maximum and a minimum to the activation channels
         self.init_activation_channels(self.activation_channel_names,
@@ -539,6 +802,8 @@ class IOTasksManager:
         Note - This method is different from the stop_tasks() method which only stops the current
         tasks temporarily.
         """
+        self.reader = None
+        self.writer = None
         if self.readout_task is not None:
             self.readout_task.close()
             del self.readout_task
@@ -0,0 +1,128 @@
+"""
+File containing a long-lived worker thread that runs the acquisitions of a national instruments
+setup. Measurement requests are put in a bounded queue, and their results are delivered through
+futures, so that no thread has to be created per measurement and callers can prepare further
+requests while a measurement is running.
+"""
+import queue
+import threading
+from concurrent.futures import Future
+
+# Maximum number of requests that can wait in the queue of an acquisition worker by default.
+DEFAULT_MAX_REQUESTS = 2
+
+
+class AcquisitionWorker:
+    """
+    Worker thread that runs acquisition requests one after the other, in the order in which they
+    were submitted. Requests are put in a bounded queue, so submitting blocks while the queue is
+    full, and each of them returns a concurrent.futures.Future with its result.
+
+    More information about futures can be found at:
+    https://docs.python.org/3/library/concurrent.futures.html#future-objects
+
+    Parameters
+    ----------
+    max_requests : int
+        Maximum number of requests waiting in the queue.
+    """
+    def __init__(self, max_requests: int = DEFAULT_MAX_REQUESTS):
+        """
+        Creates the request queue and starts the worker thread. The thread is a daemon thread, so
+        it does not prevent the program from exiting.
+
+        Parameters
+        ----------
+        max_requests : int, optional
+            Maximum number of requests waiting in the queue, by default DEFAULT_MAX_REQUESTS.
+        """
+        assert type(max_requests) == int and max_requests > 0, (
+            "The maximum number of requests should be a positive integer")
+        self.max_requests = max_requests
+        self.requests = queue.Queue(maxsize=max_requests)
+        self.thread = threading.Thread(target=self._run,
+                                       name="AcquisitionWorker",
+                                       daemon=True)
+        self.thread.start()
+
+    def submit(self, function, *args) -> Future:
+        """
+        Puts a request in the queue of the worker. It blocks while the queue is full.
+
+        Parameters
+        ----------
+        function : callable
+            Function that will be run by the worker thread.
+        *args
+            Arguments of the function.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Future that receives the value returned by the function, or the exception that it
+            raised.
+        """
+        assert self.is_alive(), "The acquisition worker has been stopped"
+        future = Future()
+        self.requests.put((future, function, args))
+        return future
+
+    def cancel_pending(self):
+        """
+        Cancels the requests that are waiting in the queue. The request that is currently being
+        run is not affected.
+        """
+        while True:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                return
+            if request is not None:
+                request[0].cancel()
+            self.requests.task_done()
+
+    def wait(self):
+        """
+        Blocks until all the requests that have been submitted are finished.
+        """
+        self.requests.join()
+
+    def stop(self):
+        """
+        Stops the worker thread after the requests that have already been submitted are
+        finished.
+        """
+        if self.is_alive():
+            self.requests.put(None)
+            self.thread.join()
+
+    def is_alive(self) -> bool:
+        """
+        Checks if the worker thread is running.
+
+        Returns
+        -------
+        bool
+            True if the worker thread is running.
+        """
+        return self.thread.is_alive()
+
+    def _run(self):
+        """
+        Main loop of the worker thread, which runs the requests of the queue until a None
+        request is received.
+        """
+        while True:
+            request = self.requests.get()
+            try:
+                if request is None:
+                    return
+                future, function, args = request
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(function(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+            finally:
+                self.requests.task_done()
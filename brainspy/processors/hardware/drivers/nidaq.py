@@ -1,13 +1,47 @@
 """
 File containing the class for CDAQ to NiDAQ drivers.
 """
-import numpy as np
+import copy
+import traceback
 import warnings
+import numpy as np
+import nidaqmx
+from brainspy.utils.waveform import CompressedWaveform
 from brainspy.processors.hardware.drivers.ni.setup import (
     NationalInstrumentsSetup,
     SYNCHRONISATION_VALUE,
     CDAQ_TO_NIDAQ_RAMPING_TIME_SECONDS,
 )
+from brainspy.processors.hardware.drivers.ni.tasks import SAMPLES_NOT_AVAILABLE_ERROR
+
+# Minimum height of the synchronisation spike, below which it is not recognised
+SPIKE_THRESHOLD = 0.05
+
+# Classes of the failures of a readout trial
+SPIKE_NOT_FOUND = "spike_not_found"  # No spike in the synchronisation channel
+CUT_AT_ZERO = "cut_at_zero"  # The spike was at the first sample, the readout started late
+SHORT_READ = "short_read"  # Fewer samples than expected after the spike
+TIMEOUT = "timeout"  # The samples were not acquired in time
+
+# Actions that can be taken after each class of failure
+RETRY_ACTIONS = (
+    "retry",  # Measure again
+    "rearm",  # Stop the tasks and reprogramme their timing, then measure again
+    "rescan",  # Search the spike in the whole readout, and only measure again if not found
+    "widen",  # Double the offset, so that the spike has more time to arrive, and measure again
+    "raise",  # Raise the error without measuring again
+)
+
+DEFAULT_RETRY_POLICY = {
+    "max_attempts": 5,
+    "max_offset_factor": 4,
+    "actions": {
+        SPIKE_NOT_FOUND: "rescan",
+        CUT_AT_ZERO: "widen",
+        SHORT_READ: "widen",
+        TIMEOUT: "rearm"
+    }
+}
 
 
 class CDAQtoNiDAQ(NationalInstrumentsSetup):
@@ -48,6 +82,18 @@ class CDAQtoNiDAQ(NationalInstrumentsSetup):
                 brainspy/processors/hardware/drivers/ni/setup.py. Do not tamper with it,
                 as it could disable security checks designed to avoid breaking devices.
 
+            The following key is optional:
+
+            retry_policy : dict
+                Policy followed when the input and output cannot be synchronised (see
+                measure). It can have the following keys, which default to the values of
+                DEFAULT_RETRY_POLICY:
+                1. max_attempts : int - Maximum number of readout trials of a measurement.
+                2. max_offset_factor : int - Maximum factor by which the 'widen' action can
+                increase the offset.
+                3. actions : dict - Action taken after each class of failure (SPIKE_NOT_FOUND,
+                CUT_AT_ZERO, SHORT_READ or TIMEOUT). The actions are described in RETRY_ACTIONS.
+
         """
         if configs['instruments_setup'][
                 'average_io_point_difference'] is not True:
@@ -77,7 +123,10 @@ class CDAQtoNiDAQ(NationalInstrumentsSetup):
             SYNCHRONISATION_VALUE)
         configs[
             "max_ramping_time_seconds"] = CDAQ_TO_NIDAQ_RAMPING_TIME_SECONDS
+        self.init_retry_policy(configs)
         super().__init__(configs)
+        # Buffer into which the input data is synchronised (see synchronise_input_data)
+        self.write_buffer = np.empty(0)
         self.tasks_driver.add_synchronisation_channels(
             self.configs["instruments_setup"]["readout_instrument"],
             self.configs["instruments_setup"]["activation_instrument"],
@@ -93,11 +142,12 @@ class CDAQtoNiDAQ(NationalInstrumentsSetup):
 
         Parameters
         ----------
-        y : np.array
+        y : np.array or CompressedWaveform
             Input data matrix to be sent to the device.
             The data should have a shape of: (device_input_channel_no, data_point_no)
             Where device_input_channel_no is typically the number of activation
-            electrodes of the DNPU.
+            electrodes of the DNPU. Compressed waveforms are only expanded when
+            writing them to the device.
 
         Returns
         -------
@@ -105,31 +155,219 @@ class CDAQtoNiDAQ(NationalInstrumentsSetup):
             Output data that has been read from the device when receiving the input y.
         """
 
-        assert type(
-            y) == np.ndarray, "Input data should be of type - numpy array"
+        assert type(y) == np.ndarray or type(
+            y) == CompressedWaveform, "Input data should be of type - numpy array"
         self.original_shape = y.shape[0]
-        y = y.T
+        if type(y) == np.ndarray:
+            y = y.T
 
         # assert (self.configs["data"]["shape"] == y.shape[1]
         #         ), f"configs value with key 'shape' must be {y.shape[1]}"
-        y = self.synchronise_input_data(y)
-        max_attempts = 5
-        attempts = 1
-        finished = False
-        while not finished and (attempts < max_attempts):
-            data, finished = self.readout_trial(y)
-            attempts += 1
-        data *= self.inversion
-        assert finished, (
-            "Error: unable to synchronise input and output. Output: " +
-            str(data.shape[1]) + " points.")
+        data = self.measure(y)
+        # The result is a new array, as the data read is kept in a reused buffer
+        data = data * self.inversion
         return data.T
 
+    def init_retry_policy(self, configs):
+        """
+        Initialises the policy followed when the input and output cannot be synchronised, and
+        the counters of the failures.
+
+        Parameters
+        ----------
+        configs : dict
+            Configurations of the driver. The keys of DEFAULT_RETRY_POLICY that are set in
+            its optional retry_policy key are overridden.
+        """
+        retry_policy = configs.get("retry_policy")
+        policy = copy.deepcopy(DEFAULT_RETRY_POLICY)
+        if retry_policy is not None:
+            assert type(retry_policy) == dict, "The retry policy should be of type - dict"
+            policy["actions"].update(retry_policy.get("actions", {}))
+            policy.update({k: v for k, v in retry_policy.items() if k != "actions"})
+        assert type(policy["max_attempts"]) == int and policy["max_attempts"] > 0, (
+            "The maximum number of attempts should be a positive integer")
+        assert policy["max_offset_factor"] >= 1, (
+            "The maximum offset factor should be at least 1")
+        for failure, action in policy["actions"].items():
+            assert failure in DEFAULT_RETRY_POLICY["actions"], (
+                f"Unknown failure class {failure}")
+            assert action in RETRY_ACTIONS, (
+                f"Unknown retry action {action}, it should be one of {RETRY_ACTIONS}")
+        self.retry_policy = policy
+        self.initial_offset = configs["offset"]
+        self.retry_counters = {
+            "measurements": 0,
+            "remeasurements": 0,
+            "rescans": 0,
+            SPIKE_NOT_FOUND: 0,
+            CUT_AT_ZERO: 0,
+            SHORT_READ: 0,
+            TIMEOUT: 0
+        }
+
+    def measure(self, y):
+        """
+        Measures the input data until its output can be synchronised, following the retry
+        policy. Each failed readout trial is classified, counted in retry_counters, and handled
+        with the action that the policy sets for its class. The 'rescan' action only measures
+        again when the spike cannot be found in the whole readout either, and the 'widen'
+        action keeps the wider offset for the following measurements, as the latency of the
+        setup is larger than expected.
+
+        Parameters
+        ----------
+        y : np.array or CompressedWaveform
+            Input data, with a shape of (device_input_channel_no, data_point_no), or a
+            compressed waveform.
+
+        Returns
+        -------
+        np.array
+            Synchronised and averaged output data, with a shape of
+            (device_output_channel_no, data_point_no).
+        """
+        self.retry_counters["measurements"] += 1
+        actions = self.retry_policy["actions"]
+        y_corr = self.synchronise_input_data(y)
+        failure = None
+        for attempt in range(self.retry_policy["max_attempts"]):
+            if attempt > 0:
+                self.retry_counters["remeasurements"] += 1
+            read_data = self.read_output(y_corr)
+            if read_data is None:
+                failure = TIMEOUT
+            else:
+                data, failure = self.synchronise_trial(read_data)
+                if failure is not None and actions[failure] == "rescan":
+                    data, rescan_failure = self.synchronise_trial(read_data, full_window=True)
+                    if rescan_failure is None:
+                        self.retry_counters["rescans"] += 1
+                    failure = rescan_failure
+            if failure is None:
+                return data
+            self.retry_counters[failure] += 1
+            action = actions[failure]
+            warnings.warn(f"Readout trial {attempt + 1} failed ({failure}). " +
+                          f"Action: {action}.")
+            if action == "raise":
+                break
+            elif action == "rearm":
+                self.rearm_tasks()
+            elif action == "widen" and self.widen_offset():
+                y_corr = self.synchronise_input_data(y)
+        raise AssertionError(
+            "Error: unable to synchronise input and output after " +
+            f"{attempt + 1} readout trials. Last failure: {failure}.")
+
+    def read_output(self, y):
+        """
+        Measures the synchronised input data, and applies the amplification correction to the
+        data read. Reads that time out are reported instead of stopping the program, and the
+        tasks are stopped, as they were left running. Other nidaqmx errors are raised once the
+        tasks have been stopped when they are recoverable (see set_recoverable_errors).
+
+        Parameters
+        ----------
+        y : np.array
+            Synchronised input data (see synchronise_input_data).
+
+        Returns
+        -------
+        np.array or None
+            Processed output data, or None if the read timed out.
+
+        Raises
+        ------
+        nidaqmx.errors.DaqError
+            If the read failed with a recoverable error.
+        """
+        try:
+            data = self.read_data_async(y).result()
+        except nidaqmx.errors.DaqError as error:
+            if error.error_code == SAMPLES_NOT_AVAILABLE_ERROR:
+                self.tasks_driver.stop_tasks()
+                return None
+            if self.recoverable_errors:
+                self.tasks_driver.stop_tasks()
+                raise
+            traceback.print_exc()
+            data = None
+        except Exception:
+            traceback.print_exc()
+            data = None
+        if data is None:
+            print("Nothing could be read. Stopping program")
+            self.os_signal_handler(None)
+        self.data_results = data
+        return self.process_output_data(data)
+
+    def rearm_tasks(self):
+        """
+        Stops the tasks, and makes the next measurement reprogramme their timing.
+        """
+        self.tasks_driver.stop_tasks()
+        self.last_points_to_write_val = -1
+
+    def widen_offset(self):
+        """
+        Doubles the offset of the setup, up to the maximum offset factor of the retry policy.
+
+        Returns
+        -------
+        bool
+            Whether the offset was widened.
+        """
+        max_offset = int(self.initial_offset * self.retry_policy["max_offset_factor"])
+        offset = min(2 * self.configs["offset"], max_offset)
+        if offset <= self.configs["offset"]:
+            return False
+        self.configs["offset"] = offset
+        # The timing of the tasks is configured again with the new offset
+        self.last_points_to_write_val = -1
+        return True
+
+    def synchronise_trial(self, read_data, full_window=False):
+        """
+        Synchronises the processed output data of a readout trial with the input, at the
+        resolution of the readout instrument, and averages the readout samples of each
+        activation point. The output is synchronised before averaging so that the averaged
+        points are aligned with the activation points even when the synchronisation spike
+        arrives between two of them.
+
+        Parameters
+        ----------
+        read_data : np.array
+            Processed output data, including the synchronisation channel.
+        full_window : bool
+            Whether to search the spike in the whole readout, instead of only where it is
+            expected, by default False.
+
+        Returns
+        -------
+        np.array, str or None
+            Synchronised output data, and the class of the failure of the trial, or None if it
+            succeeded.
+        """
+        point_size = self.io_point_difference
+        cut_value, found = self.find_spike(read_data, point_size, full_window)
+        data = read_data[:-1, cut_value:self.original_shape * point_size + cut_value]
+        if not found:
+            return data, SPIKE_NOT_FOUND
+        if cut_value == 0:
+            return data, CUT_AT_ZERO
+        if data.shape[1] != self.original_shape * point_size:
+            return data, SHORT_READ
+        return self.average_point_difference(data), None
+
     def readout_trial(self, y):
         """
         Attempts to perform a readout from the device given an input array.
         Reads the data, processes it and synchronises the output with regard
-        to the input data.
+        to the input data. The output is synchronised at the resolution of the readout
+        instrument, before averaging the readout samples of each activation point, so that
+        the averaged points are aligned with the activation points even when the
+        synchronisation spike arrives between two of them.
 
         Parameters
         ----------
@@ -146,21 +384,13 @@ class CDAQtoNiDAQ(NationalInstrumentsSetup):
         """
         assert type(
             y) == np.ndarray, "input data should be of type - numpy-array"
-        data = self.read_data(y)
-        data = self.process_output_data(data)
-        data = self.average_point_difference(data)
-        data, cut_value_is_zero = self.synchronise_output_data(data)
-
-        # Perform checks to determine if the measurement trial was successful
-        # or not (finished).
-        if self.io_point_difference == 1 or self.configs['instruments_setup'][
-                'average_io_point_difference']:
-            finished = data.shape[1] == self.original_shape
-        else:
-            finished = data.shape[
-                1] == self.original_shape * self.io_point_difference
-
-        return data, finished and not cut_value_is_zero
+        data = self.read_output(y)
+        if data is None:
+            # The read timed out
+            readout_channel_no = len(self.configs["instruments_setup"]["readout_channels"])
+            return np.empty((readout_channel_no, 0)), False
+        data, failure = self.synchronise_trial(data)
+        return data, failure is None
 
     def synchronise_input_data(self, y):
         """
@@ -169,67 +399,116 @@ class CDAQtoNiDAQ(NationalInstrumentsSetup):
         added to the input data up until the point where the spike should have been received. This
         is done by adding an offset.
 
+        The input data, the offset and the synchronisation channel are written directly into a
+        write buffer that is reused (and only grown) between calls, so the returned array is
+        overwritten by the next call and it should be consumed before that.
+
         Parameters
         ----------
-        y : np.array
-            Input data to be sent to the device.
+        y : np.array or CompressedWaveform
+            Input data to be sent to the device, with a shape of
+            (device_input_channel_no, data_point_no). Compressed waveforms are expanded
+            directly into the write buffer.
 
         Returns
         -------
         np.array
             Synchronised input data based on the offset value, where the synchronisation spike
-            should have been received.
+            should have been received, with a shape of
+            (device_input_channel_no + 1, data_point_no + offset).
         """
-        assert type(y) == list or type(
-            y) == np.ndarray, "Input data should be of type - numpy array"
-        # TODO: Are the following three lines really necessary?
+        assert type(y) == list or type(y) == np.ndarray or type(
+            y) == CompressedWaveform, "Input data should be of type - numpy array"
+        if type(y) == CompressedWaveform:
+            y = y.to_numpy().T
         y = np.asarray(y)
         if len(y.shape) == 1:
             y = y[np.newaxis, :]
 
-        # Append some zeros to the initial signal such that no input data is lost
-        # This should be handled with proper synchronization
-        y_corr = np.zeros(
-            (y.shape[0], y.shape[1] + self.configs["offset"]
-             ))  # Add the offset time in ms of reaction in terms of zeros
-        y_corr[:, self.configs["offset"]:] = y[:]
-
-        if len(y_corr.shape) == 1:
-            y_corr = np.concatenate(
-                (y_corr[np.newaxis], np.zeros(
-                    (1, y_corr.shape[1]))))  # Set the trigger
-        else:
-            y_corr = np.concatenate((y_corr, np.zeros(
-                (1, y_corr.shape[1]))))  # Set the trigger
-        y_corr[-1, self.configs["offset"]] = 1  # Start input data
-
+        offset = self.configs["offset"]
+        shape = (y.shape[0] + 1, y.shape[1] + offset)
+        size = shape[0] * shape[1]
+        if len(self.write_buffer) < size:
+            self.write_buffer = np.empty(size, dtype=np.float64)
+        y_corr = self.write_buffer[:size].reshape(shape)
+        # Add the offset time in ms of reaction in terms of zeros, so that no input data is lost
+        y_corr[:, :offset] = 0
+        y_corr[:-1, offset:] = y
+        # Set the trigger, which starts the input data
+        y_corr[-1, offset:] = 0
+        y_corr[-1, offset] = 1
         return y_corr
 
-    def get_output_cut_value(self, read_data):
+    def get_output_cut_value(self, read_data, point_size=1, full_window=False):
         """
         The input signal is synchronised with the output sending a spike through a synchronisation
         channel. This method gets the value where the output data should be cut in order to make
-        the output signal be synchronised with regard to the input signal.
+        the output signal be synchronised with regard to the input signal (see find_spike).
 
         Parameters
         ----------
         read_data : np.array
             Processed output data computed from the amplification value.
+        point_size : int
+            Number of samples of read_data per activation point, by default 1.
+        full_window : bool
+            Whether to search the spike in the whole readout, by default False.
 
         Returns
         -------
         int
             Output cut value
         """
+        cut_value, found = self.find_spike(read_data, point_size, full_window)
+        if not found:
+            warnings.warn("initialize spike not recognised")
+        return cut_value
+
+    def find_spike(self, read_data, point_size=1, full_window=False):
+        """
+        Locates the synchronisation spike in the synchronisation channel of the output data.
+
+        The spike is only searched for in the window of the synchronisation channel where it can
+        appear, which spans twice the offset of the setup, unless full_window is set. The samples
+        below half of the height of the spike are discarded, and the spike is located by
+        cross-correlating the window with the expected shape of the spike, which lasts a whole
+        activation point (point_size samples). This makes the cut value robust to noise on the
+        synchronisation channel and to the edges of the spike.
+
+        Parameters
+        ----------
+        read_data : np.array
+            Processed output data computed from the amplification value.
+        point_size : int
+            Number of samples of read_data per activation point, by default 1.
+        full_window : bool
+            Whether to search the spike in the whole readout, by default False.
+
+        Returns
+        -------
+        int, bool
+            Output cut value, and whether the spike was recognised.
+        """
         assert type(
             read_data
         ) == np.ndarray, "read-data should be of type - numpy array"
-        cut_value = np.argmax(read_data[-1, :])
-        if read_data[-1, cut_value] < 0.05:
-            warnings.warn("initialize spike not recognised")
-        return cut_value
+        if full_window:
+            window = read_data[-1]
+        else:
+            window = read_data[-1, :(2 * self.configs["offset"] + 1) * point_size]
+        if len(window) == 0:
+            return 0, False
+        cut_value = np.argmax(window)
+        peak = window[cut_value]
+        if peak < SPIKE_THRESHOLD:
+            return cut_value, False
+        if point_size > 1 and len(window) >= point_size:
+            window = np.where(window >= peak / 2, window, 0)
+            cut_value = np.argmax(
+                np.correlate(window, np.ones(point_size), mode="valid"))
+        return cut_value, True
 
-    def synchronise_output_data(self, read_data):
+    def synchronise_output_data(self, read_data, point_size=1, full_window=False):
         """
         The input signal is synchronised with the output sending a spike through a synchronisation
         channel. All the data before the output reading instrument receives the spike is discarded.
@@ -240,6 +519,10 @@ class CDAQtoNiDAQ(NationalInstrumentsSetup):
         ----------
         read_data : np.array
             processed output data computed from the amplification value
+        point_size : int
+            Number of samples of read_data per activation point, by default 1.
+        full_window : bool
+            Whether to search the spike in the whole readout, by default False.
 
         Returns
         -------
@@ -251,7 +534,7 @@ class CDAQtoNiDAQ(NationalInstrumentsSetup):
         assert type(
             read_data
         ) == np.ndarray, "read-data should be of type - numpy array"
-        cut_value = self.get_output_cut_value(read_data)
+        cut_value = self.get_output_cut_value(read_data, point_size, full_window)
         # Add check that the cut_value is not 0
-        return read_data[:-1, cut_value:self.original_shape +
+        return read_data[:-1, cut_value:self.original_shape * point_size +
                          cut_value], cut_value == 0
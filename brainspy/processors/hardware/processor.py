@@ -3,11 +3,40 @@ File containing the main class for Hardware Processor, which goes inside the Pro
 """
 import torch
 import warnings
+import collections
+from concurrent.futures import ThreadPoolExecutor
 from torch import nn
 import numpy as np
 from brainspy.utils.manager import get_driver
+from brainspy.processors.hardware.drivers.ni.scheduler import get_scheduler
+from brainspy.processors.hardware.drivers.ni.channels import is_device_name, get_mask
+from brainspy.processors.hardware.cache import MeasurementCache, get_context
 from brainspy.utils.pytorch import TorchUtils
-from brainspy.utils.waveform import WaveformManager
+from brainspy.utils.waveform import WaveformManager, CompressedWaveform
+
+
+def load_driver(instrument_configs):
+    """
+    Gets the driver of a rack, which can be given by its configs or as a driver that has
+    already been initialised.
+
+    Parameters
+    ----------
+    instrument_configs : dict or driver
+        Configs of the driver, as described in HardwareProcessor, or a driver.
+
+    Returns
+    -------
+    driver
+        The driver of the rack. If the configs have a 'request_scheduler' key, it is the
+        request scheduler that is shared with the other processors with compatible configs.
+    """
+    if not isinstance(instrument_configs, dict):
+        return instrument_configs
+    if "request_scheduler" in instrument_configs:
+        # The driver is shared with other processors that have compatible configs
+        return get_scheduler(instrument_configs)
+    return get_driver(instrument_configs)
 
 
 class HardwareProcessor(nn.Module):
@@ -34,13 +63,18 @@ class HardwareProcessor(nn.Module):
     def __init__(self,
                  instrument_configs,
                  slope_length,
-                 plateau_length):
+                 plateau_length,
+                 waveform_configs=None):
         """
         To intialise the hardware processor
 
         Parameters
         ----------
-        instruments_configs : dict or SurrogateModel
+        instruments_configs : dict, SurrogateModel or list
+
+        A list of dicts or SurrogateModel instances declares several racks. The batches are
+        then sharded across the racks, which measure their shards concurrently (see
+        forward_racks). All of the racks should have the same activation channels.
 
         If a SurrogateModel instance is provided, it will simulate a hardware processor
         for debugging purposes, without connecting to real hardware.
@@ -96,7 +130,8 @@ class HardwareProcessor(nn.Module):
         3. instruments_setup:
         3.1 multiple_devices: boolean
         False will initialise the drivers to read from a single hardware DNPU.
-        True, will enable to read from more than one DNPU device at the same time.
+        True, will enable to read from more than one DNPU device at the same time. DNPU nodes
+        are then measured in parallel on the devices (see nodes_to_devices).
 
         3.2 activation_instrument: str
         Name of the activation instrument as observed in the NI Max software.
@@ -144,6 +179,48 @@ class HardwareProcessor(nn.Module):
         3.10.2 slope_length : float - Length of the slopes in the waveforms sent to the device through
         the drivers
 
+        4. request_scheduler : dict, optional
+        If given, the driver is shared, through a RequestScheduler, with the other processors
+        that have compatible instruments, channels, voltage ranges, sampling rates,
+        amplification and offset. The requests of all of them that arrive close in time are
+        coalesced into a single measurement. It can have the keys max_wait_time and
+        max_batch_samples (see get_scheduler
+        in brainspy/processors/hardware/drivers/ni/scheduler.py).
+
+        5. session_log : dict, optional
+        If given, the session of the driver is recorded to a binary log, with the keys
+        path and mode 'record'. A recorded log is replayed through the same forward pass, with
+        no hardware attached, with the mode 'replay' (see
+        brainspy/processors/hardware/drivers/ni/session_log.py).
+
+        waveform_configs : dict, optional
+        Further configurations of the WaveformManager of the processor, such as the
+        plateau_reduction or the settling_samples (see brainspy.utils.waveform). The slope and
+        plateau lengths given separately take precedence. By default None. It can also have
+        the following keys, which are used by the HardwareProcessor itself:
+
+        1. max_acquisition_points : int, optional
+        Maximum number of points measured in a single acquisition. Larger batches are split
+        into several acquisitions, each with its own waveform, which starts and ends with zero
+        ramps. By default None, which only splits the batches that exceed the acquisition limits
+        of the driver configs (see get_points_per_acquisition).
+
+        2. acquisition_retries : int, optional
+        Number of times that a failed acquisition is measured again before raising its error.
+        Only the failed acquisition is measured again. The nidaqmx errors of the drivers, such
+        as read timeouts, are then raised instead of stopping the program (see
+        set_recoverable_errors in brainspy/processors/hardware/drivers/ni/setup.py). By
+        default 0.
+
+        3. measurement_cache : dict, optional
+        If given, the outputs of forward and forward_points are cached, keyed by the quantised
+        input batch and the configurations of the drivers and the waveform, including the
+        current plateau and slope lengths and offsets of the drivers, so that repeated inputs
+        are not measured again. The keys of the dictionary, such as the memory budget,
+        the maximum age of the outputs and the path where they are persisted, are described
+        in MeasurementCache (see brainspy/processors/hardware/cache.py). By default None,
+        which measures every batch.
+
         The input data to the hardware drivers has to be given with a waveform. The waveform is
         composed of slopes and plateaus.
         Please check https://github.com/BraiNEdarwin/brains-py/wiki/A.-Introduction for more
@@ -157,28 +234,78 @@ class HardwareProcessor(nn.Module):
         assert type(slope_length) == int or type(
             slope_length
         ) == float, "The slope length should be of type - int or float"
-        if not isinstance(instrument_configs, dict):
-            self.driver = instrument_configs
+        if isinstance(instrument_configs, (list, tuple)):
+            assert len(instrument_configs) > 0, "At least one rack should be given"
+            racks = list(instrument_configs)
+        else:
+            racks = [instrument_configs]
+        self.drivers = [load_driver(rack) for rack in racks]
+        self.driver = self.drivers[0]
+        if not isinstance(racks[0], dict):
             #if self.driver.is_hardware():
             self.voltage_ranges = self.driver.get_voltage_ranges()
             # else:
             #     self.voltage_ranges = None
             self.clipping_value = self.driver.get_clipping_value()
         else:
-            self.driver = get_driver(instrument_configs)
             self.register_buffer(
                 "voltage_ranges",
                 torch.tensor(self.driver.voltage_ranges,
                              dtype=torch.get_default_dtype()))
             self.clipping_value = None
-            assert ( (slope_length / self.driver.configs["instruments_setup"][
-                    "activation_sampling_frequency"]) <= self.driver.configs[
-                        "max_ramping_time_seconds"]), "The ratio of the slope length and the activation sampling frequency cannot be less than the max ramping time"
+        self.check_slope_length(slope_length)
+        if len(self.drivers) > 1:
+            # The points of a batch can be measured on any of the racks
+            voltage_ranges = torch.stack([
+                torch.as_tensor(driver.voltage_ranges, dtype=self.voltage_ranges.dtype)
+                for driver in self.drivers
+            ])
+            assert voltage_ranges.shape[1:] == self.voltage_ranges.shape, (
+                "All of the racks should have the same activation channels")
+            # The slopes of the waveforms are the same for all of the racks (see
+            # get_max_slope_delta)
+            frequencies = {
+                getattr(driver, "configs", {}).get("instruments_setup", {}).get(
+                    "activation_sampling_frequency")
+                for driver in self.drivers
+            }
+            assert len(frequencies) == 1, (
+                "All of the racks should have the same activation sampling frequency")
+            self.voltage_ranges = torch.stack(
+                (voltage_ranges[..., 0].max(dim=0)[0], voltage_ranges[..., 1].min(dim=0)[0]),
+                dim=-1).to(self.voltage_ranges.device)
+        # Threads that measure the shards of a batch on each of the racks
+        self.rack_executor = None
 
-        self.waveform_mgr = WaveformManager({
-            "slope_length": slope_length,
-            "plateau_length": plateau_length
-        })
+        waveform_configs = {} if waveform_configs is None else dict(
+            waveform_configs)
+        waveform_configs["slope_length"] = slope_length
+        waveform_configs["plateau_length"] = plateau_length
+        self.waveform_mgr = WaveformManager(waveform_configs)
+        self.max_acquisition_points = waveform_configs.get(
+            "max_acquisition_points", None)
+        assert self.max_acquisition_points is None or (
+            type(self.max_acquisition_points) == int and self.max_acquisition_points > 0
+        ), "The maximum number of points per acquisition should be a positive integer"
+        self.acquisition_retries = waveform_configs.get("acquisition_retries", 0)
+        assert type(self.acquisition_retries) == int and self.acquisition_retries >= 0, (
+            "The number of acquisition retries should be a non-negative integer")
+        if self.acquisition_retries > 0:
+            for driver in self.drivers:
+                if hasattr(driver, "set_recoverable_errors"):
+                    # The drivers raise the errors of the failed acquisitions instead of
+                    # stopping the program, so that they can be measured again
+                    driver.set_recoverable_errors(True)
+        # Buffer where forward_points writes the averaged points, reused between batches
+        self.points_buffer = None
+        self.measurement_cache = None
+        if waveform_configs.get("measurement_cache") is not None:
+            self.measurement_cache = MeasurementCache(
+                waveform_configs["measurement_cache"],
+                get_context([getattr(driver, "configs", None) for driver in self.drivers], {
+                    k: v
+                    for k, v in waveform_configs.items() if k != "measurement_cache"
+                }))
 
     def forward(self, x):
         """
@@ -208,18 +335,572 @@ class HardwareProcessor(nn.Module):
         """
         assert type(
             x) == torch.Tensor, "The input should be of type - torch.Tensor"
-        assert x.shape[-1] == len(
-            self.driver.configs['instruments_setup']['activation_channels'])
+        assert x.shape[-1] == self.get_activation_channel_no()
         with torch.no_grad():
             device, dtype = x.device, x.dtype
-            x, mask = self.waveform_mgr.plateaus_to_waveform(
-                x, return_pytorch=False)
             if len(x.shape) > 2:
                 x = x.squeeze()
-            x = self.forward_numpy(x)
-        return TorchUtils.format(x[mask], device=device, data_type=dtype)
+            key, output = self.get_cached_output(x, "plateaus")
+            if output is None:
+                if len(self.drivers) > 1:
+                    output = self.forward_racks(x)
+                else:
+                    output = self.forward_rack(x, self.driver)
+                self.cache_output(key, output)
+        return TorchUtils.format(output, device=device, data_type=dtype)
+
+    def forward_points(self, x):
+        """
+        Forward pass for data that is represented as points, which returns the averaged output
+        of each point. It gives the same result as converting the points to plateaus, running the
+        forward pass, and averaging the plateaus of the output, but without creating the input
+        plateaus, and averaging the plateaus directly on a strided view of the output of the
+        driver into a preallocated buffer.
+
+        Parameters
+        ----------
+        x : torch.Tensor
+            input data in 'point' format. The expected shape is
+            (batch_size, activation_electrode_no)
+
+        Returns
+        -------
+        torch.Tensor
+            output data, with one averaged value per point.
+        """
+        assert type(
+            x) == torch.Tensor, "The input should be of type - torch.Tensor"
+        assert x.shape[-1] == self.get_activation_channel_no()
+        with torch.no_grad():
+            device, dtype, point_no = x.device, x.dtype, len(x)
+            key, output = self.get_cached_output(x, "points")
+            if output is not None:
+                return TorchUtils.format(output, device=device, data_type=dtype)
+            if len(self.drivers) > 1:
+                output = self.forward_racks(x, points=True)
+            else:
+                # The buffer of the previous batch is reused when it has the same number of
+                # points
+                out = self.points_buffer
+                if out is not None and len(out) != point_no:
+                    out = None
+                output = self.points_buffer = self.forward_rack(x, self.driver, True, out)
+            self.cache_output(key, output)
+        return TorchUtils.format(output, device=device, data_type=dtype)
+
+    def get_cached_output(self, x, data_format):
+        """
+        Gets the output of an input batch from the measurement cache, if the processor has one.
 
-    def forward_numpy(self, x):
+        Parameters
+        ----------
+        x : torch.Tensor
+            input data.
+        data_format : str
+            Format of the input data, 'plateaus' for forward or 'points' for forward_points.
+
+        Returns
+        -------
+        (str or None, np.array or None)
+            Key of the input batch in the cache, or None if there is no cache, and its cached
+            output, or None if it has to be measured.
+        """
+        if self.measurement_cache is None:
+            return None, None
+        # The context of the cache is taken when the processor is initialised, but the lengths of
+        # the waveform can be tuned and the offset of the drivers widened afterwards
+        key = self.measurement_cache.get_key(
+            x, data_format, self.waveform_mgr.plateau_length, self.waveform_mgr.slope_length,
+            [getattr(driver, "configs", {}).get("offset") for driver in self.drivers])
+        return key, self.measurement_cache.get(key)
+
+    def cache_output(self, key, output):
+        """
+        Stores the measured output of an input batch in the measurement cache, if the processor
+        has one.
+
+        Parameters
+        ----------
+        key : str or None
+            Key of the input batch, as given by get_cached_output.
+        output : np.array
+            Measured output.
+        """
+        if key is not None:
+            self.measurement_cache.put(key, output)
+
+    def forward_rack(self, x, driver, points=False, out=None):
+        """
+        Measures a batch on a single rack, in as many acquisitions as its acquisition limits
+        require (see split_batch).
+
+        Parameters
+        ----------
+        x : torch.Tensor
+            input data in 'plateau' format, or in 'point' format if points is True. The expected
+            shape is (batch_size, activation_electrode_no).
+        driver : driver
+            Driver of the rack.
+        points : bool, optional
+            Whether the input data is in 'point' format, and the plateaus of the output are
+            averaged, by default False.
+        out : np.array, optional
+            Preallocated buffer where the averaged points are written when points is True,
+            with shape (batch_size, readout_electrode_no) and the data type of the output of
+            the driver. By default None, which allocates a new one.
+
+        Returns
+        -------
+        np.array
+            output data, as returned by forward_points if points is True, or by the forward pass
+            otherwise.
+        """
+        outputs, start = [], 0
+        # Batches that exceed the acquisition limits are measured in several
+        # acquisitions, split at plateau boundaries
+        for chunk in self.split_batch(x, 1 if points else self.waveform_mgr.plateau_length,
+                                      driver):
+            # The waveform is kept compressed until the driver writes it
+            if points:
+                waveform, mask = self.points_to_waveform(chunk)
+            else:
+                waveform = self.waveform_mgr.plateaus_to_compressed_waveform(
+                    chunk, slope_lengths=self.get_slope_lengths(chunk, plateaus=True))
+                mask = self.get_output_mask(waveform)
+            output = np.asarray(self.forward_acquisition(waveform, driver))
+            if points:
+                # The points of each acquisition are reduced into their rows of the buffer
+                outputs.append(
+                    self.waveform_mgr.waveform_to_points(
+                        output, mask, out=None if out is None else out[start:start + len(chunk)]))
+                start += len(chunk)
+            else:
+                outputs.append(np.asarray(self.waveform_mgr.waveform_to_plateaus(output, mask)))
+        if out is not None and points:
+            return out
+        return outputs[0] if len(outputs) == 1 else np.concatenate(outputs)
+
+    def forward_racks(self, x, points=False):
+        """
+        Shards a batch across all of the racks of the processor, measures the shards
+        concurrently, each on its own worker thread, and merges the outputs in the order of the
+        batch. Each rack applies its own calibration (amplification and inversion), as given in
+        its driver configs.
+
+        Parameters
+        ----------
+        x : torch.Tensor
+            input data in 'plateau' format, or in 'point' format if points is True. The expected
+            shape is (batch_size, activation_electrode_no).
+        points : bool, optional
+            Whether the input data is in 'point' format, and the plateaus of the output are
+            averaged, by default False.
+
+        Returns
+        -------
+        np.array
+            output data of the whole batch.
+        """
+        rows_per_point = 1 if points else self.waveform_mgr.plateau_length
+        point_no = len(x) // rows_per_point
+        shard_size = -(-point_no // len(self.drivers)) * rows_per_point
+        if self.rack_executor is None:
+            self.rack_executor = ThreadPoolExecutor(max_workers=len(self.drivers))
+        futures = [
+            self.rack_executor.submit(self.forward_rack, shard, driver, points)
+            for shard, driver in zip(torch.split(x, max(shard_size, 1)), self.drivers)
+        ]
+        outputs = [future.result() for future in futures]
+        return outputs[0] if len(outputs) == 1 else np.concatenate(outputs)
+
+    def split_batch(self, x, rows_per_point=1, driver=None):
+        """
+        Splits a batch into the parts that are measured in separate acquisitions, so that the
+        waveform of each part fits within the acquisition limits (see
+        get_points_per_acquisition).
+
+        Parameters
+        ----------
+        x : torch.Tensor
+            input data, with shape (batch_size, activation_electrode_no).
+        rows_per_point : int, optional
+            Number of rows of the input data that represent a point, by default 1. For data in
+            'plateau' format, it is the plateau length, so that plateaus are not split.
+        driver : driver, optional
+            Driver of the rack that measures the data, by default None, which uses the driver
+            of the first rack.
+
+        Returns
+        -------
+        Sequence[torch.Tensor]
+            Consecutive parts of the input data.
+        """
+        point_no = self.get_points_per_acquisition(driver)
+        if point_no is None or len(x) <= point_no * rows_per_point:
+            return [x]
+        return torch.split(x, point_no * rows_per_point)
+
+    def get_points_per_acquisition(self, driver=None):
+        """
+        Gets the maximum number of points that are measured in a single acquisition. It is the
+        smallest of the max_acquisition_points of the waveform configs and the number of points
+        whose waveform fits within the following optional keys of the driver configs:
+
+        1. max_acquisition_samples : int
+        Maximum number of samples per channel written in a single acquisition, usually the
+        size of the buffer of the activation device.
+
+        2. max_acquisition_seconds : float
+        Maximum duration of a single acquisition, at the activation sampling frequency.
+
+        The offset of the driver, if any, is subtracted from these limits. The slopes are
+        assumed to have the full slope length, so adaptive slopes never exceed them.
+
+        Parameters
+        ----------
+        driver : driver, optional
+            Driver of the rack whose limits are used, by default None, which uses the driver of
+            the first rack.
+
+        Returns
+        -------
+        int or None
+            Maximum number of points per acquisition, or None if there is no limit.
+        """
+        limits = []
+        if self.max_acquisition_points is not None:
+            limits.append(self.max_acquisition_points)
+        configs = (self.driver if driver is None else driver).configs
+        samples = []
+        if configs.get("max_acquisition_samples") is not None:
+            samples.append(configs["max_acquisition_samples"])
+        if configs.get("max_acquisition_seconds") is not None:
+            samples.append(
+                int(configs["max_acquisition_seconds"] *
+                    configs["instruments_setup"]["activation_sampling_frequency"]))
+        if len(samples) > 0:
+            slope_length = self.waveform_mgr.slope_length
+            point_length = self.waveform_mgr.plateau_length + slope_length
+            point_no = (min(samples) - configs.get("offset", 0) - slope_length) // point_length
+            assert point_no > 0, "The acquisition limits do not fit the waveform of a single point"
+            limits.append(int(point_no))
+        return min(limits) if len(limits) > 0 else None
+
+    def forward_acquisition(self, x, driver=None):
+        """
+        Measures a waveform through forward_numpy, measuring it again when the acquisition fails,
+        up to the acquisition_retries of the waveform configs.
+
+        Parameters
+        ----------
+        x : np.array or CompressedWaveform
+            input waveform.
+        driver : driver, optional
+            Driver of the rack that measures the waveform, by default None, which uses the
+            driver of the first rack.
+
+        Returns
+        -------
+        np.array
+            output data
+
+        Raises
+        ------
+        Exception
+            The error of the last attempt, if all of them failed.
+        """
+        for attempt in range(self.acquisition_retries + 1):
+            try:
+                return self.forward_numpy(x, driver)
+            except Exception as e:
+                if attempt == self.acquisition_retries:
+                    raise
+                warnings.warn(f"Acquisition failed ({e}). Measuring it again, attempt "
+                              f"{attempt + 1} of {self.acquisition_retries}.")
+
+    def forward_pipelined(self, batches, average_plateaus=True):
+        """
+        Pipelined forward pass for a sequence of batches represented as points. The
+        measurements run one after the other in a background thread, while the calling thread
+        generates the waveform of the next batch and reduces the output of the previous one, so
+        that the setup does not wait for the waveform preparation and the post-processing. The
+        outputs are yielded in the same order as the batches, and each batch goes through the
+        same acquisition path as in the forward pass (see submit_batch).
+
+        Parameters
+        ----------
+        batches : iterable
+            Iterable of torch.Tensor batches in 'point' format. The expected shape of each is
+            (batch_size, activation_electrode_no).
+        average_plateaus : bool, optional
+            Whether each plateau of the output is averaged, by default True. Otherwise, the
+            whole plateaus are returned, as in the forward pass.
+
+        Yields
+        ------
+        torch.Tensor
+            output data of each batch, as returned by forward_points when averaging the plateaus,
+            or by the forward pass of the plateaus of the batch otherwise.
+        """
+        # Gradients are not needed, as the waveforms are detached and the outputs come from
+        # numpy arrays. A no_grad context would leak to the caller at every yield.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = collections.deque()
+            for x in batches:
+                pending.append(self.submit_batch(executor, x, average_plateaus))
+                # The measurement of this batch is queued behind the previous one, so it
+                # starts while the output of the previous one is being reduced.
+                if len(pending) > 1:
+                    yield self.reduce_output(*pending.popleft())
+            while pending:
+                yield self.reduce_output(*pending.popleft())
+
+    def submit_batch(self, executor, x, average_plateaus=True):
+        """
+        Queues the measurement of a batch represented as points in an executor, going through
+        the same acquisition path as the forward pass: the measurement cache, the sharding
+        across racks (see forward_racks), the acquisition limits (see split_batch) and the
+        retries of forward_acquisition. On a single rack, the waveforms are generated by the
+        calling thread, and only their acquisitions are queued.
+
+        Parameters
+        ----------
+        executor : concurrent.futures.Executor
+            Executor that runs the measurements.
+        x : torch.Tensor
+            input data in 'point' format. The expected shape is
+            (batch_size, activation_electrode_no)
+        average_plateaus : bool, optional
+            Whether the plateaus of the output are averaged, by default True.
+
+        Returns
+        -------
+        tuple
+            Arguments of reduce_output for the batch.
+        """
+        assert type(
+            x) == torch.Tensor, "The input should be of type - torch.Tensor"
+        assert x.shape[-1] == self.get_activation_channel_no()
+        key, output = self.get_cached_output(x, "points" if average_plateaus else "point plateaus")
+        if output is not None:
+            return None, output, x, average_plateaus
+        if len(self.drivers) > 1:
+            if not average_plateaus:
+                # The racks measure the plateaus of the batch, as in the forward pass
+                return key, executor.submit(self.forward_racks,
+                                            self.waveform_mgr.points_to_plateaus(x)), x, False
+            return key, executor.submit(self.forward_racks, x, True), x, True
+        parts = []
+        for chunk in self.split_batch(x):
+            waveform, mask = self.points_to_waveform(chunk)
+            parts.append((executor.submit(self.forward_acquisition, waveform), mask))
+        return key, parts, x, average_plateaus
+
+    def points_to_waveform(self, x):
+        """
+        Generates the compressed waveform that is sent to the driver for data represented as
+        points, and the mask that removes its slopes from the output.
+
+        Parameters
+        ----------
+        x : torch.Tensor
+            input data in 'point' format. The expected shape is
+            (batch_size, activation_electrode_no)
+
+        Returns
+        -------
+        (CompressedWaveform, CompressedMask or None)
+            Waveform and output mask (see get_output_mask).
+        """
+        assert type(
+            x) == torch.Tensor, "The input should be of type - torch.Tensor"
+        assert x.shape[-1] == self.get_activation_channel_no()
+        waveform = self.waveform_mgr.points_to_compressed_waveform(
+            x, slope_lengths=self.get_slope_lengths(x))
+        return waveform, self.get_output_mask(waveform)
+
+    def reduce_output(self, key, output, x, average_plateaus=True):
+        """
+        Waits for the measurement of a batch queued by submit_batch, removes the slopes from
+        the output of each of its acquisitions, optionally averaging their plateaus, and stores
+        the result in the measurement cache.
+
+        Parameters
+        ----------
+        key : str or None
+            Key of the batch in the measurement cache, or None if it is not cached.
+        output : np.array, concurrent.futures.Future or list
+            Output that was already reduced, a future that receives it, or a list of the future
+            outputs of each acquisition of the batch together with their output masks.
+        x : torch.Tensor
+            input data in 'point' format that was measured.
+        average_plateaus : bool, optional
+            Whether the plateaus of the output are averaged, by default True.
+
+        Returns
+        -------
+        torch.Tensor
+            output data, in the same device and with the same data type as the input data.
+        """
+        if isinstance(output, list):
+            outputs = []
+            for future, mask in output:
+                part = np.asarray(future.result())
+                if average_plateaus:
+                    outputs.append(self.waveform_mgr.waveform_to_points(part, mask))
+                else:
+                    outputs.append(np.asarray(self.waveform_mgr.waveform_to_plateaus(part, mask)))
+            output = outputs[0] if len(outputs) == 1 else np.concatenate(outputs)
+        elif not isinstance(output, np.ndarray):
+            output = output.result()
+        self.cache_output(key, output)
+        return TorchUtils.format(output, device=x.device, data_type=x.dtype)
+
+    def get_output_mask(self, waveform):
+        """
+        Gets the mask used to remove the slopes from the output of the driver. When the waveform
+        has slopes of a fixed length, no mask is needed, as the plateaus are taken from a strided
+        view of the output.
+
+        Parameters
+        ----------
+        waveform : CompressedWaveform
+            Waveform sent to the driver.
+
+        Returns
+        -------
+        CompressedMask or None
+            Mask of the waveform, or None if it is not needed.
+        """
+        if self.waveform_mgr.slope_length > 0 and not self.waveform_mgr.adaptive_slopes:
+            return None
+        return waveform.get_mask()
+
+    def get_slope_lengths(self, x, plateaus=False):
+        """
+        Gets the length of each slope of the waveform of the input data when the waveform manager
+        has adaptive slopes, where each slope is shortened in proportion to its voltage jump (see
+        get_slope_lengths in waveform.py). The slope length of the waveform manager remains the
+        length of the longest slope, so slopes never exceed the maximum ramping time of the
+        drivers.
+
+        Parameters
+        ----------
+        x : torch.Tensor
+            input data, with shape (batch_size, activation_electrode_no).
+        plateaus : bool, optional
+            Whether the input data is in 'plateau' format, by default False, which means that it
+            is in 'point' format.
+
+        Returns
+        -------
+        torch.Tensor or None
+            Length of each slope, with shape (point_no + 1,), or None if the slopes are not
+            adaptive.
+        """
+        if not self.waveform_mgr.adaptive_slopes or self.waveform_mgr.slope_length <= 0:
+            return None
+        if plateaus:
+            plateau_length = self.waveform_mgr.plateau_length
+            return self.waveform_mgr.get_slope_lengths(x[::plateau_length],
+                                                       self.get_max_slope_delta(),
+                                                       tails=x[plateau_length - 1::plateau_length])
+        return self.waveform_mgr.get_slope_lengths(x, self.get_max_slope_delta())
+
+    def get_max_slope_delta(self):
+        """
+        Gets the voltage jump that requires a slope with the full slope length of the waveform
+        manager. If the waveform manager has a maximum slew rate, it is the voltage change that it
+        allows during a full slope, at the activation sampling frequency of the drivers, which is
+        the same for all of the racks. Otherwise, it is the largest jump that is possible within
+        the voltage ranges of the processor, as the full slope length is already limited by the
+        maximum ramping time of the drivers.
+
+        Returns
+        -------
+        float
+            The voltage jump that requires the full slope length.
+        """
+        if self.waveform_mgr.max_slew_rate is not None:
+            frequency = self.driver.configs["instruments_setup"]["activation_sampling_frequency"]
+            return self.waveform_mgr.max_slew_rate * self.waveform_mgr.slope_length / frequency
+        voltage_ranges = self.get_voltage_ranges()
+        return float((voltage_ranges[..., 1] - voltage_ranges[..., 0]).max())
+
+    def forward_chunks(self, x, chunk_size, continuous=False):
+        """
+        Streaming version of the forward pass, for inputs whose waveform is too long to be
+        kept in memory at once. The waveform is generated lazily, in chunks of chunk_size
+        points, and each chunk is sent to the driver as soon as it has been generated. The
+        slopes are removed from the output of each chunk as soon as it has been read, so only
+        the plateau results are kept in memory.
+
+        Parameters
+        ----------
+        x : torch.Tensor
+            input data in 'plateau' format (the forward pass will add/remove the slopes to the data).
+            The expected shape is (batch_size, activation_electrode_no)
+        chunk_size : int
+            Number of waveform points that are sent to the driver at once.
+        continuous : bool, optional
+            Whether hardware drivers measure the chunks with a continuous acquisition (see
+            forward_numpy_continuous in the drivers), where the tasks are not stopped between
+            chunks and the output arrives in blocks that do not correspond to the chunks. By
+            default False. Only the CDAQ to CDAQ drivers support streamed measurements.
+
+        Returns
+        -------
+        torch.Tensor
+            output data, identical to the one that would be returned by the forward pass.
+        """
+        assert type(
+            x) == torch.Tensor, "The input should be of type - torch.Tensor"
+        assert x.shape[-1] == self.get_activation_channel_no()
+        # Only the CDAQ to CDAQ setups can stream, as the synchronisation of the CDAQ to NIDAQ
+        # setups requires the whole readout
+        assert not self.is_hardware() or hasattr(self.driver, "forward_numpy_chunks"), (
+            "Streamed measurements are not supported by the driver of this setup")
+        with torch.no_grad():
+            device, dtype = x.device, x.dtype
+            points_to_write = self.waveform_mgr.get_waveform_length(
+                len(x) // self.waveform_mgr.plateau_length)
+            chunks = self.waveform_mgr.plateaus_to_waveform_chunks(
+                x, chunk_size)
+            masks = []
+
+            def numpy_chunks():
+                for chunk, mask in chunks:
+                    masks.append(TorchUtils.to_numpy(mask))
+                    yield TorchUtils.to_numpy(chunk)
+
+            if self.is_hardware() and continuous:
+                x = []
+                mask = np.zeros(0, dtype=bool)
+                for output in self.driver.forward_numpy_continuous(
+                        numpy_chunks(), points_to_write):
+                    # The samples of a block have always been written, together with
+                    # their masks, before the block is read.
+                    while len(mask) < len(output):
+                        mask = np.concatenate((mask, masks.pop(0)))
+                    x.append(output[mask[:len(output)]])
+                    mask = mask[len(output):]
+                return TorchUtils.format(np.concatenate(x),
+                                         device=device,
+                                         data_type=dtype)
+            if self.is_hardware():
+                outputs = self.driver.forward_numpy_chunks(
+                    numpy_chunks(), points_to_write)
+            else:
+                outputs = (self.forward_numpy(chunk)
+                           for chunk in numpy_chunks())
+            # Drivers can request the next chunk before returning the output
+            # of the current one, so the masks are matched by position.
+            x = [output[masks[i]] for i, output in enumerate(outputs)]
+        return TorchUtils.format(np.concatenate(x),
+                                 device=device,
+                                 data_type=dtype)
+
+    def forward_numpy(self, x, driver=None):
         """
         It enables to use directly the driver, without any transformation to the data. The input
         should already be in the form of a waveform.
@@ -229,8 +910,13 @@ class HardwareProcessor(nn.Module):
 
         Parameters
         ----------
-        x : np.array
-            input data
+        x : np.array or CompressedWaveform
+            input data. Compressed waveforms are passed as they are to hardware drivers, which
+            expand them when writing them to the device, and expanded before being passed to
+            simulation drivers.
+        driver : driver, optional
+            Driver of the rack that measures the data, by default None, which uses the driver of
+            the first rack.
 
         Returns
         -------
@@ -238,21 +924,75 @@ class HardwareProcessor(nn.Module):
             output data
 
         """
-        assert type(
-            x) == np.ndarray, "The input data should be of type - numpy array"
-        return self.driver.forward_numpy(x)
+        assert type(x) == np.ndarray or type(
+            x
+        ) == CompressedWaveform, "The input data should be of type - numpy array"
+        if driver is None:
+            driver = self.driver
+        if type(x) == CompressedWaveform and not driver.is_hardware():
+            x = x.to_numpy()
+        return driver.forward_numpy(x)
+
+    def check_slope_length(self, slope_length):
+        """
+        Checks that the slopes of the waveform are not longer than the maximum ramping time of
+        the hardware drivers of all the racks.
+
+        Parameters
+        ----------
+        slope_length : float
+            Length of the slopes of the waveform.
+
+        Raises
+        ------
+        AssertionError
+            If the slopes take longer than the maximum ramping time of any of the racks.
+        """
+        for driver in self.drivers:
+            # Surrogate models given as drivers have no ramping limits
+            if driver.is_hardware():
+                assert ( (slope_length / driver.configs["instruments_setup"][
+                    "activation_sampling_frequency"]) <= driver.configs[
+                        "max_ramping_time_seconds"]), "The ratio of the slope length and the activation sampling frequency cannot be less than the max ramping time"
+
+    def set_waveform_manager(self, waveform_configs):
+        """
+        Replaces the waveform manager of the processor, e.g., after tuning the plateau and slope
+        lengths (see brainspy.processors.hardware.tuning). The slope length is validated as in
+        the init method, and the measurement cache and the security checks of the waveform
+        templates are cleared, as they belong to the previous waveform.
+
+        Parameters
+        ----------
+        waveform_configs : dict
+            Waveform configs, as documented in the init method. The plateau_length and
+            slope_length keys are required.
+        """
+        self.check_slope_length(waveform_configs["slope_length"])
+        self.waveform_mgr = WaveformManager(waveform_configs)
+        if self.measurement_cache is not None:
+            self.measurement_cache.clear()
+        for driver in self.drivers:
+            if hasattr(driver, "checked_templates"):
+                driver.checked_templates.clear()
 
     def close(self):
         """
-        Closes the driver if specified in the driver directory or raise a warning if the driver has
-        not been closed after use.
+        Closes the drivers of all the racks if specified in the driver directory or raise a
+        warning if a driver has not been closed after use.
         """
-        if "close_tasks" in dir(self.driver):
-            self.driver.close_tasks()
-        else:
-            warnings.warn(
-                "It was not possible to close the NI Tasks from the driver." +
-                "This should be fine if you are running a simulation.")
+        if self.rack_executor is not None:
+            self.rack_executor.shutdown()
+            self.rack_executor = None
+        if self.measurement_cache is not None:
+            self.measurement_cache.save()
+        for driver in self.drivers:
+            if "close_tasks" in dir(driver):
+                driver.close_tasks()
+            else:
+                warnings.warn(
+                    "It was not possible to close the NI Tasks from the driver." +
+                    "This should be fine if you are running a simulation.")
 
     def is_hardware(self):
         """
@@ -269,14 +1009,128 @@ class HardwareProcessor(nn.Module):
 
     def get_voltage_ranges(self):
         """
-        Gets the voltage ranges declared on the hardware processor.
+        Gets the voltage ranges declared on the hardware processor. When the setup has multiple
+        devices, they are the voltage ranges that are valid for the activation electrodes of all
+        of them, as DNPU nodes can be measured on any of the devices.
 
         Returns
         -------
         voltage_ranges
             torch.tensor
         """
-        return self.voltage_ranges
+        device_no = self.get_device_no()
+        if device_no == 1:
+            return self.voltage_ranges
+        voltage_ranges = self.voltage_ranges.reshape(device_no, -1, 2)
+        return torch.stack((voltage_ranges[..., 0].max(dim=0)[0],
+                            voltage_ranges[..., 1].min(dim=0)[0]),
+                           dim=-1)
+
+    def get_device_names(self):
+        """
+        Gets the names of the devices of the setup that have at least one activation channel,
+        in the order in which their channels are sent to the driver. It is only applicable when
+        the instruments setup has multiple devices.
+
+        Returns
+        -------
+        list[str]
+            Names of the devices.
+        """
+        setup = self.driver.configs["instruments_setup"]
+        if not setup.get("multiple_devices", False):
+            return []
+        return [
+            name for name, device in setup.items()
+            if isinstance(device, dict) and is_device_name(name) and (
+                get_mask(device) is None or sum(get_mask(device)) > 0)
+        ]
+
+    def get_device_no(self):
+        """
+        Gets the number of DNPU devices that are measured in parallel by the setup.
+
+        Returns
+        -------
+        int
+            Number of devices, 1 unless the instruments setup has multiple devices.
+        """
+        return max(len(self.get_device_names()), 1)
+
+    def get_activation_channel_no(self):
+        """
+        Gets the number of activation channels to which the driver writes, for all of the
+        devices of the setup.
+
+        Returns
+        -------
+        int
+            Number of activation channels.
+        """
+        setup = self.driver.configs["instruments_setup"]
+        if self.get_device_no() == 1 and "activation_channels" in setup:
+            return len(setup["activation_channels"])
+        return sum(
+            len(setup[name]["activation_channels"]) for name in self.get_device_names())
+
+    def nodes_to_devices(self, x):
+        """
+        Maps the inputs of several DNPU nodes onto the devices of the setup, so that they are
+        measured in parallel. Node i is always measured on device i % device_no, and the
+        nodes that share a device are measured one after the other. Devices without a node in
+        a round of measurements receive zeros.
+
+        Parameters
+        ----------
+        x : torch.Tensor
+            Input data with shape (batch_size, node_no, activation_electrode_no).
+
+        Returns
+        -------
+        torch.Tensor
+            Input data with shape (batch_size * round_no, device_no * activation_electrode_no),
+            where round_no is the number of nodes per device, rounded up.
+        """
+        device_no = self.get_device_no()
+        batch_size, node_no, electrode_no = x.shape
+        assert device_no * electrode_no == self.get_activation_channel_no(), (
+            "All of the devices should have the same number of activation electrodes")
+        round_no = -(-node_no // device_no)
+        if round_no * device_no > node_no:
+            x = torch.cat((x,
+                           x.new_zeros((batch_size, round_no * device_no - node_no,
+                                        electrode_no))),
+                          dim=1)
+        return x.reshape(batch_size * round_no, device_no * electrode_no)
+
+    def devices_to_nodes(self, x, node_no, plateau_length=1):
+        """
+        Maps the outputs of a measurement of nodes_to_devices back to the DNPU nodes, in the
+        same order that a time-multiplexed measurement of the nodes on a single device gives.
+
+        Parameters
+        ----------
+        x : torch.Tensor
+            Output data with shape (batch_size * round_no * plateau_length,
+            device_no * readout_electrode_no).
+        node_no : int
+            Number of DNPU nodes.
+        plateau_length : int, optional
+            Number of outputs per point, by default 1, which is the case when the plateaus are
+            averaged.
+
+        Returns
+        -------
+        torch.Tensor
+            Output data with shape (batch_size * node_no * plateau_length, readout_electrode_no).
+        """
+        device_no = self.get_device_no()
+        round_no = -(-node_no // device_no)
+        readout_no = x.shape[-1] // device_no
+        x = x.reshape(-1, round_no, plateau_length, device_no, readout_no)
+        x = x.permute(0, 1, 3, 2, 4).reshape(len(x), round_no * device_no, plateau_length,
+                                            readout_no)
+        return x[:, :node_no].reshape(-1, readout_no)
 
     def get_clipping_value(self):
         """
@@ -0,0 +1,318 @@
+"""
+Calibration routine that helps choosing the plateau and slope lengths of the waveform configs of a
+hardware processor. Long plateaus and slopes make the measurements more reliable, but they are
+also the main throughput cost of a hardware setup. The routine measures a set of points with
+different plateau and slope lengths, and recommends the shortest waveform that meets a given
+noise, accuracy and/or overshoot target. It works both with hardware processors and with
+'simulation_debug' processors.
+"""
+import warnings
+import itertools
+
+import torch
+import numpy as np
+
+from brainspy.processors.processor import Processor
+from brainspy.processors.hardware.processor import HardwareProcessor
+from brainspy.utils.waveform import WaveformManager
+
+
+def measure_waveform(processor, points, plateau_length, slope_length, repetitions=2):
+    """
+    Measures a set of points several times with the given plateau and slope lengths, using the
+    plateau reduction configured in the waveform manager of the processor.
+
+    Parameters
+    ----------
+    processor : Processor or HardwareProcessor
+        Processor used for the measurements. It should be a hardware or 'simulation_debug'
+        processor.
+    points : torch.Tensor
+        Points that will be measured, with shape (point_no, activation_electrode_no).
+    plateau_length : int
+        Length of the plateaus of the measured waveform.
+    slope_length : int
+        Length of the slopes of the measured waveform.
+    repetitions : int, optional
+        Number of times that the waveform is measured, by default 2. At least two repetitions
+        are required to estimate the noise of the points.
+
+    Returns
+    -------
+    dict
+        Dictionary with the following keys, each with shape (point_no, readout_electrode_no):
+
+        1. points : np.array
+        Mean over the repetitions of the reduced output of each point.
+
+        2. noise : np.array
+        Standard deviation over the repetitions of the reduced output of each point.
+
+        3. variance : np.array
+        Variance of the samples of the second half of each plateau, where the output is
+        expected to have settled, averaged over the repetitions.
+
+        4. overshoot : np.array
+        Maximum absolute deviation of the samples of each plateau from the mean of its second
+        half, which is caused by the output transient after each slope.
+    """
+    processor = get_hardware_processor(processor)
+    assert type(repetitions) == int and repetitions >= 2, "At least two repetitions are required"
+    waveform_mgr = get_waveform_manager(processor, plateau_length, slope_length)
+    waveform = waveform_mgr.points_to_compressed_waveform(points)
+    mask = None if slope_length > 0 else waveform.get_mask()
+    reduced, variance, overshoot = [], [], []
+    with torch.no_grad():
+        for _ in range(repetitions):
+            output = np.asarray(processor.forward_numpy(waveform))
+            plateaus = waveform_mgr.waveform_to_plateaus(output, mask)
+            plateaus = plateaus.reshape((len(points), plateau_length, -1))
+            settled = plateaus[:, plateau_length // 2:]
+            settled_mean = settled.mean(axis=1, keepdims=True)
+            reduced.append(waveform_mgr.reduce_plateaus(np.ascontiguousarray(plateaus)))
+            variance.append(settled.var(axis=1))
+            overshoot.append(np.abs(plateaus - settled_mean).max(axis=1))
+    reduced = np.stack(reduced)
+    return {
+        "points": reduced.mean(axis=0),
+        "noise": reduced.std(axis=0, ddof=1),
+        "variance": np.mean(variance, axis=0),
+        "overshoot": np.max(overshoot, axis=0)
+    }
+
+
+def tune_waveform(processor,
+                  plateau_lengths,
+                  slope_lengths,
+                  max_noise=None,
+                  max_error=None,
+                  max_overshoot=None,
+                  points=None,
+                  point_no=20,
+                  repetitions=2):
+    """
+    Sweeps the given plateau and slope lengths, and recommends the combination with the shortest
+    waveform (the smallest plateau_length + slope_length per point) that meets all the given
+    targets. The targets are evaluated as follows:
+
+    1. Noise: root mean square of the standard deviation of each point over the repetitions.
+    2. Error: root mean square difference between the points and the reference points, which
+    are measured with the longest plateau and slope lengths of the sweep.
+    3. Overshoot: maximum overshoot of all the plateaus.
+
+    Plateau lengths that are not longer than the settling samples of the waveform manager of
+    the processor, and slope lengths that exceed the maximum ramping time of the hardware
+    drivers, are not measured.
+
+    Example
+    -------
+    >>> tuning = tune_waveform(processor, [10, 20, 40], [10, 30], max_noise=0.5)
+    >>> set_waveform_configs(configs, tuning)
+
+    Parameters
+    ----------
+    processor : Processor or HardwareProcessor
+        Processor used for the measurements. It should be a hardware or 'simulation_debug'
+        processor.
+    plateau_lengths : Sequence[int]
+        Plateau lengths that will be measured.
+    slope_lengths : Sequence[int]
+        Slope lengths that will be measured.
+    max_noise : float, optional
+        Target noise of the points, in the units of the output of the processor. By default
+        None, which does not set any target for it.
+    max_error : float, optional
+        Target error with respect to the reference points, in the units of the output of the
+        processor. By default None.
+    max_overshoot : float, optional
+        Target overshoot, in the units of the output of the processor. By default None.
+    points : torch.Tensor, optional
+        Points used for the measurements, with shape (point_no, activation_electrode_no). By
+        default None, which draws point_no random points within the voltage ranges of the
+        processor.
+    point_no : int, optional
+        Number of random points used for the measurements when no points are given, by default
+        20.
+    repetitions : int, optional
+        Number of times that each waveform is measured, by default 2.
+
+    Returns
+    -------
+    dict
+        Dictionary with the following keys:
+
+        1. plateau_length : int or None
+        Recommended plateau length, or None if no combination meets the targets.
+
+        2. slope_length : int or None
+        Recommended slope length, or None if no combination meets the targets.
+
+        3. results : list[dict]
+        The plateau_length, slope_length, noise, error and overshoot measured for each of the
+        combinations of the sweep, and whether they meet the targets (valid).
+
+    Raises
+    ------
+    AssertionError
+        If no target is given, or if none of the plateau and slope lengths can be measured.
+    """
+    assert (max_noise is not None or max_error is not None
+            or max_overshoot is not None), "At least one target should be given"
+    hardware_processor = get_hardware_processor(processor)
+    if points is None:
+        voltage_ranges = hardware_processor.get_voltage_ranges()
+        points = torch.rand((point_no, len(voltage_ranges)),
+                            device=voltage_ranges.device,
+                            dtype=voltage_ranges.dtype)
+        points = voltage_ranges[:, 0] + points * (voltage_ranges[:, 1] - voltage_ranges[:, 0])
+    settling_samples = hardware_processor.waveform_mgr.settling_samples
+    plateau_lengths = sorted(p for p in plateau_lengths if p > settling_samples)
+    slope_lengths = sorted(s for s in slope_lengths if is_allowed_slope(hardware_processor, s))
+    assert len(plateau_lengths) > 0 and len(
+        slope_lengths) > 0, "None of the plateau and slope lengths can be measured"
+
+    reference = measure_waveform(hardware_processor, points, plateau_lengths[-1],
+                                 slope_lengths[-1], repetitions)["points"]
+    results = []
+    for plateau_length, slope_length in itertools.product(plateau_lengths, slope_lengths):
+        measurement = measure_waveform(hardware_processor, points, plateau_length, slope_length,
+                                       repetitions)
+        result = {
+            "plateau_length": plateau_length,
+            "slope_length": slope_length,
+            "noise": float(np.sqrt(np.mean(measurement["noise"]**2))),
+            "error": float(np.sqrt(np.mean((measurement["points"] - reference)**2))),
+            "overshoot": float(measurement["overshoot"].max())
+        }
+        result["valid"] = ((max_noise is None or result["noise"] <= max_noise)
+                           and (max_error is None or result["error"] <= max_error)
+                           and (max_overshoot is None or result["overshoot"] <= max_overshoot))
+        results.append(result)
+
+    valid = [r for r in results if r["valid"]]
+    if len(valid) == 0:
+        warnings.warn("None of the plateau and slope lengths meets the targets.")
+        return {"plateau_length": None, "slope_length": None, "results": results}
+    best = min(valid, key=lambda r: (r["plateau_length"] + r["slope_length"], r["slope_length"]))
+    return {
+        "plateau_length": best["plateau_length"],
+        "slope_length": best["slope_length"],
+        "results": results
+    }
+
+
+def set_waveform_configs(configs, tuning, processor=None):
+    """
+    Writes the plateau and slope lengths recommended by tune_waveform into the waveform configs.
+    If a processor is given, its waveform managers are also updated, so that it can be used with
+    the new lengths without initialising it again. The new slope length is validated against the
+    maximum ramping time of the hardware, and the measurement cache of the processor is cleared.
+
+    Parameters
+    ----------
+    configs : dict
+        Configs of the processor, as documented in the init method of Processor. The
+        'waveform' key is updated.
+    tuning : dict
+        Result of tune_waveform.
+    processor : Processor or HardwareProcessor, optional
+        Processor whose waveform managers will be updated, by default None.
+
+    Returns
+    -------
+    dict
+        The updated configs.
+
+    Raises
+    ------
+    AssertionError
+        If the tuning has no recommendation, or if the recommended slopes are longer than the
+        maximum ramping time of the hardware.
+    """
+    assert tuning["plateau_length"] is not None and tuning[
+        "slope_length"] is not None, "The tuning has no recommended plateau and slope lengths"
+    waveform_configs = dict(configs["waveform"])
+    waveform_configs["plateau_length"] = tuning["plateau_length"]
+    waveform_configs["slope_length"] = tuning["slope_length"]
+    # The hardware processor validates the new lengths before anything is updated
+    if processor is not None:
+        get_hardware_processor(processor).set_waveform_manager(waveform_configs)
+    if isinstance(processor, Processor):
+        processor.waveform_mgr = WaveformManager(waveform_configs)
+    configs["waveform"]["plateau_length"] = tuning["plateau_length"]
+    configs["waveform"]["slope_length"] = tuning["slope_length"]
+    return configs
+
+
+def get_hardware_processor(processor):
+    """
+    Gets the hardware processor of a processor.
+
+    Parameters
+    ----------
+    processor : Processor or HardwareProcessor
+        A hardware or 'simulation_debug' processor.
+
+    Returns
+    -------
+    HardwareProcessor
+        The hardware processor.
+    """
+    if isinstance(processor, Processor):
+        processor = processor.processor
+    assert isinstance(
+        processor, HardwareProcessor
+    ), "The waveform can only be tuned for hardware or simulation_debug processors"
+    return processor
+
+
+def get_waveform_manager(processor, plateau_length, slope_length):
+    """
+    Creates a waveform manager with the given plateau and slope lengths, and the same plateau
+    reduction as the waveform manager of a hardware processor.
+
+    Parameters
+    ----------
+    processor : HardwareProcessor
+        The hardware processor.
+    plateau_length : int
+        Length of the plateaus.
+    slope_length : int
+        Length of the slopes.
+
+    Returns
+    -------
+    WaveformManager
+        The waveform manager.
+    """
+    return WaveformManager({
+        "plateau_length": plateau_length,
+        "slope_length": slope_length,
+        "plateau_reduction": processor.waveform_mgr.plateau_reduction,
+        "settling_samples": processor.waveform_mgr.settling_samples,
+        "trim_proportion": processor.waveform_mgr.trim_proportion
+    })
+
+
+def is_allowed_slope(processor, slope_length):
+    """
+    Checks if a slope length does not exceed the maximum ramping time of the driver of a
+    hardware processor. Slopes are always allowed for 'simulation_debug' processors.
+
+    Parameters
+    ----------
+    processor : HardwareProcessor
+        The hardware processor.
+    slope_length : int
+        Length of the slopes.
+
+    Returns
+    -------
+    bool
+        True if the slope length can be used with the processor.
+    """
+    configs = processor.driver.configs
+    if not processor.is_hardware() or "max_ramping_time_seconds" not in configs:
+        return True
+    return (slope_length / configs["instruments_setup"]["activation_sampling_frequency"]
+            ) <= configs["max_ramping_time_seconds"]
@@ -73,8 +73,61 @@ class Processor(nn.Module):
             3.2 plateau_length : int
             Length of the plateaus, see waveform.py.
 
+            3.3 reorder_points : bool, optional
+            Only for hardware and simulation_debug processors. Whether the
+            points of each batch are measured in an order that reduces the
+            voltage jumps between consecutive points (see get_point_order in
+            waveform.py). The outputs are returned in the original order. By
+            default False.
+
+            3.4 adaptive_slopes : bool, optional
+            Only for hardware and simulation_debug processors. Whether each
+            slope is shortened in proportion to its voltage jump, with the
+            slope_length as the longest slope. By default False.
+
+            3.5 max_slew_rate : float, optional
+            Maximum voltage change per second of adaptive slopes, by default
+            None, which gives the full slope length to a jump over the whole
+            voltage range.
+
+            3.6 plateau_reduction : str, optional
+            How each measured plateau is reduced to a point when averaging
+            plateaus: "mean" (default), "trimmed_mean", "median" or
+            "exponential_fit". See WaveformManager in waveform.py.
+
+            3.7 settling_samples : int, optional
+            Samples discarded at the start of each plateau before reducing
+            it, by default 0.
+
+            3.8 trim_proportion : float, optional
+            Proportion cut from each end of a plateau by the trimmed mean,
+            by default 0.1.
+
+            3.9 max_acquisition_points : int, optional
+            Only for hardware and simulation_debug processors. Maximum number
+            of points measured in a single acquisition. Larger batches are
+            measured in several acquisitions, each with its own zero ramps,
+            and their outputs are concatenated. By default None, which only
+            uses the acquisition limits of the driver configs (see
+            get_points_per_acquisition in HardwareProcessor).
+
+            3.10 acquisition_retries : int, optional
+            Only for hardware and simulation_debug processors. Number of times
+            that a failed acquisition is measured again, by default 0.
+
+            3.11 measurement_cache : dict, optional
+            Only for hardware and simulation_debug processors. If given, the
+            outputs of repeated input batches are returned from a cache
+            instead of being measured again (see MeasurementCache in
+            brainspy/processors/hardware/cache.py). By default None.
+
             4. driver:
             Only for hardware, refer to HardwareProcessor for a description of the keys.
+            It can also have a 'racks' key, with a list of dictionaries, one per rack. The
+            batches are then sharded across the racks (see forward_racks in
+            HardwareProcessor). The keys of each rack, such as the instruments, the
+            amplification or the inverted_output, override the ones of the driver configs
+            (see get_rack_configs).
         info : dict
             A dictionary that contains the following keys:
             
@@ -99,6 +152,10 @@ class Processor(nn.Module):
         self.load_processor(configs, info, model_state_dict)
         self.waveform_mgr = WaveformManager(configs['waveform'])
         self.average_plateaus = average_plateaus
+        self.reorder_points = configs['waveform'].get('reorder_points', False)
+        # Slope samples that the last reordering saved, for slopes shortened
+        # in proportion to their voltage jumps
+        self.saved_waveform_length = 0
 
     def load_processor(self,
                        configs: dict,
@@ -188,7 +245,8 @@ class Processor(nn.Module):
             # check if activation voltage ranges is in configs;
             # if not, take it from electrode info
             if "activation_voltage_ranges" not in configs["driver"][
-                    "instruments_setup"]:
+                    "instruments_setup"] and not configs["driver"][
+                        "instruments_setup"].get("multiple_devices", False):
                 configs["driver"]["instruments_setup"][
                     "activation_voltage_ranges"] = self.info["electrode_info"][
                         "activation_electrodes"]["voltage_ranges"]
@@ -205,9 +263,10 @@ class Processor(nn.Module):
                     "electrode_info"]["output_electrodes"]["amplification"]
 
             self.processor = HardwareProcessor(
-                configs["driver"],
+                get_rack_configs(configs["driver"]),
                 configs["waveform"]["slope_length"],
                 configs["waveform"]["plateau_length"],
+                waveform_configs=configs["waveform"],
             )
 
         # create simulation processor for debugging
@@ -234,7 +293,8 @@ class Processor(nn.Module):
             self.processor = HardwareProcessor(
                 instrument_configs=driver,
                 slope_length=configs["waveform"]["slope_length"],
-                plateau_length=configs["waveform"]["plateau_length"])
+                plateau_length=configs["waveform"]["plateau_length"],
+                waveform_configs=configs["waveform"])
 
         # processor type not recognized
         else:
@@ -259,6 +319,138 @@ class Processor(nn.Module):
         torch.Tensor
             Output data.
         """
+        if self.reorder_points and isinstance(self.processor,
+                                              HardwareProcessor):
+            return self.forward_reordered(x)
+        return self.forward_ordered(x)
+
+    def forward_pipelined(self, batches):
+        """
+        Runs the forward pass for a sequence of batches. On hardware and simulation_debug
+        processors, the measurement of each batch overlaps with the waveform generation of the
+        next one and the post-processing of the previous one (see forward_pipelined in
+        HardwareProcessor). On simulation processors, and hardware setups with multiple devices,
+        the batches are run one after the other. The points are measured in the given order,
+        even if reorder_points is set.
+
+        Parameters
+        ----------
+        batches : iterable
+            Iterable of input batches, each of them with a shape of
+            [batch_size, activation_electrode_no].
+
+        Yields
+        ------
+        torch.Tensor
+            Output data of each batch, in the same order, as returned by the forward pass.
+        """
+        if isinstance(self.processor, HardwareProcessor) and self.get_device_no() == 1:
+            yield from self.processor.forward_pipelined(batches,
+                                                        self.average_plateaus)
+        else:
+            for x in batches:
+                yield self.forward_ordered(x)
+
+    def forward_reordered(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        Measures the points of the batch in the order given by get_point_order of the
+        waveform manager, which reduces the voltage jumps between consecutive points, and
+        returns the outputs in the original order of the batch. The number of slope samples
+        that the new order saves, when slopes are shortened in proportion to their voltage
+        jumps (see get_max_slope_delta in HardwareProcessor), is stored in
+        saved_waveform_length. It is zero if the waveform does not have adaptive slopes.
+
+        Parameters
+        ----------
+        x : torch.Tensor
+            Input data. It is expected to have a shape of [batch_size, activation_electrode_no].
+
+        Returns
+        -------
+        torch.Tensor
+            Output data, in the same order as the input data.
+        """
+        order = self.waveform_mgr.get_point_order(x)
+        inverse = torch.argsort(order)
+        if self.waveform_mgr.adaptive_slopes:
+            max_delta = self.processor.get_max_slope_delta()
+            self.saved_waveform_length = (
+                self.waveform_mgr.get_ramp_length(x, max_delta) -
+                self.waveform_mgr.get_ramp_length(x[order], max_delta))
+        else:
+            # Fixed slopes have the same length regardless of the order
+            self.saved_waveform_length = 0
+        x = self.forward_ordered(x[order])
+        if self.average_plateaus:
+            return x[inverse]
+        # Each point is represented by a plateau of outputs
+        return x.reshape((len(order), -1) +
+                         x.shape[1:])[inverse].reshape(x.shape)
+
+    def forward_ordered(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        Runs a forward pass on the processor, measuring the points in the given order. When the
+        hardware setup has multiple devices, the points are measured on the first device.
+
+        Parameters
+        ----------
+        x : torch.Tensor
+            Input data. It is expected to have a shape of [batch_size, activation_electrode_no].
+
+        Returns
+        -------
+        torch.Tensor
+            Output data.
+        """
+        if self.get_device_no() > 1:
+            return self.forward_nodes(x.unsqueeze(1))
+        return self.forward_channels(x)
+
+    def forward_nodes(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        Runs a forward pass for several DNPU nodes. On hardware setups with multiple devices,
+        the nodes are measured in parallel on the devices (see nodes_to_devices in
+        HardwareProcessor). Otherwise, they are measured one after the other, in
+        time-multiplexing.
+
+        Parameters
+        ----------
+        x : torch.Tensor
+            Input data. It is expected to have a shape of
+            [batch_size, node_no, activation_electrode_no].
+
+        Returns
+        -------
+        torch.Tensor
+            Output data, in the same order as measuring the input reshaped to
+            [batch_size * node_no, activation_electrode_no] on a single device.
+        """
+        if self.get_device_no() == 1:
+            return self.forward(x.reshape(x.shape[0] * x.shape[1], -1))
+        node_no = x.shape[1]
+        x = self.forward_channels(self.processor.nodes_to_devices(x))
+        plateau_length = 1 if self.average_plateaus else self.waveform_mgr.plateau_length
+        return self.processor.devices_to_nodes(x, node_no, plateau_length)
+
+    def forward_channels(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        Runs a forward pass on the processor, where each row of the input data is written to
+        all of the activation channels of the setup.
+
+        Parameters
+        ----------
+        x : torch.Tensor
+            Input data. It is expected to have a shape of [batch_size, activation_channel_no].
+
+        Returns
+        -------
+        torch.Tensor
+            Output data.
+        """
+        if self.average_plateaus and isinstance(self.processor,
+                                                HardwareProcessor):
+            # Goes from points to averaged points without creating plateaus
+            return self.processor.forward_points(x)
         if not (self.waveform_mgr.plateau_length == 1
                 and self.waveform_mgr.slope_length == 0):
             x = self.waveform_mgr.points_to_plateaus(x)
@@ -301,8 +493,23 @@ class Processor(nn.Module):
         torch.Tensor
             Voltage ranges.
         """
+        if isinstance(self.processor, HardwareProcessor):
+            return self.processor.get_voltage_ranges()
         return self.processor.voltage_ranges
 
+    def get_device_no(self) -> int:
+        """
+        Get the number of DNPU devices that the processor measures in parallel.
+
+        Returns
+        -------
+        int
+            Number of devices. It is 1 for simulation processors.
+        """
+        if isinstance(self.processor, HardwareProcessor):
+            return self.processor.get_device_no()
+        return 1
+
     def get_activation_electrode_no(self):
         """
         Get the number of activation electrodes of the processor.
@@ -448,3 +655,34 @@ def get_electrode_info(configs):
     ]
 
     return electrode_info
+
+
+def get_rack_configs(configs):
+    """
+    Gets the driver configs of each of the racks declared in the 'racks' key of the driver
+    configs. The keys of each rack override the ones of the driver configs, and the keys of its
+    'instruments_setup' override the ones of the 'instruments_setup' of the driver configs.
+
+    Parameters
+    ----------
+    configs : dict
+        Driver configs, as described in HardwareProcessor, with an optional 'racks' key.
+
+    Returns
+    -------
+    dict or list[dict]
+        The driver configs if there is no 'racks' key, or the driver configs of each rack.
+    """
+    if not configs.get("racks"):
+        return configs
+    rack_configs = []
+    for rack in configs["racks"]:
+        rack_config = copy.deepcopy(
+            {key: value for key, value in configs.items() if key != "racks"})
+        for key, value in rack.items():
+            if key == "instruments_setup":
+                rack_config["instruments_setup"].update(copy.deepcopy(value))
+            else:
+                rack_config[key] = copy.deepcopy(value)
+        rack_configs.append(rack_config)
+    return rack_configs
@@ -11,16 +11,33 @@ A waveform transform is defined by its plateau length and slope length,
 in the case above 3 and 3 respectively. There are methods in this module
 that define the transformations between these three forms.
 
+Waveforms can also be kept in a run-length compressed form (see
+CompressedWaveform), which is only expanded into dense samples when they are
+finally needed.
+
 The goal of the waveform representation of data is so that it can be applied
 to DNPUs without sudden changes in input, so that the hardware is not damaged.
 """
-from typing import Union, Tuple, List
+from typing import Union, Tuple
 
 import torch
+import collections
 import numpy as np
 import warnings
 from brainspy.utils.pytorch import TorchUtils
 
+# Maximum number of waveform templates (masks and slope weights) that are
+# kept in memory by each WaveformManager.
+TEMPLATE_CACHE_SIZE = 16
+
+# Maximum number of points that get_point_order reorders together. Larger
+# batches are reordered in consecutive chunks, as the cost of the nearest
+# neighbour search is quadratic in the number of points reordered together.
+REORDER_CHUNK_SIZE = 1024
+
+# Reducers that can be used to turn each plateau into a single point.
+PLATEAU_REDUCTIONS = ("mean", "trimmed_mean", "median", "exponential_fit")
+
 
 class WaveformManager:
     """
@@ -45,6 +62,20 @@ class WaveformManager:
         slope, True where there is a plateau.
     final_mask : List[bool]
         A mask that covers one plateau - consists entirely of False.
+    plateau_reduction : str
+        Reducer used to turn each measured plateau into a single point. One of
+        PLATEAU_REDUCTIONS.
+    settling_samples : int
+        Number of samples at the start of each measured plateau that are
+        discarded before reducing it, to skip the settling transient.
+    trim_proportion : float
+        Proportion of samples cut from each end of a sorted plateau by the
+        trimmed mean.
+    adaptive_slopes : bool
+        Whether the length of each slope is adapted to its voltage jump,
+        with slope_length as the length of the longest possible slope.
+    max_slew_rate : float or None
+        Maximum voltage change per second of adaptive slopes.
     """
     def __init__(self, configs):
         """
@@ -59,6 +90,31 @@ class WaveformManager:
                  The lengh of the plateaus of the waveform.
             :param slope_length: int
                  The length of the slopes of the waveform.
+            :param plateau_reduction: str, optional
+                 How each measured plateau is reduced to a single point, by
+                 default "mean". One of:
+                    - "mean": Plain mean of the plateau.
+                    - "trimmed_mean": Mean of the plateau after discarding
+                      the trim_proportion lowest and highest samples.
+                    - "median": Median of the plateau.
+                    - "exponential_fit": Asymptote of an exponential settling
+                      curve fitted to the plateau. Falls back to the mean
+                      where the plateau does not settle exponentially.
+            :param settling_samples: int, optional
+                 Samples at the start of each plateau that are discarded
+                 before applying the reducer (the settling transient), by
+                 default 0.
+            :param trim_proportion: float, optional
+                 Proportion cut from each end by the trimmed mean, by
+                 default 0.1.
+            :param adaptive_slopes: bool, optional
+                 Whether hardware processors shorten each slope in
+                 proportion to its voltage jump (see get_slope_lengths), by
+                 default False.
+            :param max_slew_rate: float, optional
+                 Maximum voltage change per second of adaptive slopes. By
+                 default None, in which case a jump over the whole voltage
+                 range of the processor requires the full slope length.
 
         Example
         --------
@@ -78,6 +134,20 @@ class WaveformManager:
             warnings.warn("Slope Length is 0")
         self.plateau_length = configs["plateau_length"]
         self.slope_length = configs["slope_length"]
+        self.plateau_reduction = configs.get("plateau_reduction", "mean")
+        self.settling_samples = configs.get("settling_samples", 0)
+        self.trim_proportion = configs.get("trim_proportion", 0.1)
+        self.adaptive_slopes = configs.get("adaptive_slopes", False)
+        self.max_slew_rate = configs.get("max_slew_rate", None)
+        assert self.plateau_reduction in PLATEAU_REDUCTIONS, (
+            f"Plateau reduction {self.plateau_reduction} not recognised. "
+            f"Use one of {PLATEAU_REDUCTIONS}.")
+        assert type(self.settling_samples) is int and (
+            self.settling_samples >= 0
+        ), "The settling samples should be a non-negative integer"
+        assert 0 <= self.trim_proportion < 0.5, (
+            "The trim proportion should be in the range [0, 0.5)")
+        self._templates = collections.OrderedDict()
         self.generate_mask_base()
 
     def generate_mask_base(self):
@@ -133,15 +203,179 @@ class WaveformManager:
         assert isinstance(parameter, int)
         return [parameter] * length
 
-    def points_to_waveform(self, data):
+    def _get_template(self,
+                      plateau_no: int,
+                      plateau_length: int,
+                      device: torch.device,
+                      dtype: torch.dtype,
+                      first: bool = True,
+                      last: bool = True) -> dict:
+        """
+        Gets the template of a waveform with a given number of plateaus. The
+        template contains the plateau mask and the interpolation weights of
+        the slopes, which only depend on the number of plateaus, the slope
+        length and the plateau length. Templates are cached, so that they are
+        only computed the first time that a waveform of a given shape is
+        requested. The least recently used templates are discarded once there
+        are more than TEMPLATE_CACHE_SIZE of them.
+
+        Templates can also describe a block in the middle of a waveform, which
+        is used when generating it in chunks. A block has a slope before each
+        of its plateaus, and only the last block has a final slope.
+
+        Parameters
+        ----------
+        plateau_no : int
+            Number of plateaus (or points) in the waveform.
+        plateau_length : int
+            Length of each plateau.
+        device : torch.device
+            Device on which the template will be used.
+        dtype : torch.dtype
+            Data type in which the slopes will be computed.
+        first : bool, optional
+            Whether the block starts the waveform (with a slope from zero).
+            By default True.
+        last : bool, optional
+            Whether the block ends the waveform (with a final slope to zero).
+            By default True.
+
+        Returns
+        -------
+        dict
+            Dictionary with the following keys:
+            1. mask: torch.Tensor
+            Boolean mask with True at plateaus and False at slopes.
+            2. steps: torch.Tensor
+            Position of each sample inside its slope, with shape
+            (slope_no, slope_length).
+            3. divisions: torch.Tensor
+            Number of divisions of each slope, with shape (slope_no, 1).
+            4. last: bool
+            Whether the last slope ends the waveform.
+
+        Raises
+        ------
+        ValueError
+            If the slope length is negative.
+        """
+        if self.slope_length < 0:
+            raise ValueError(
+                f"Number of samples, {self.slope_length}, must be non-negative."
+            )
+        key = (plateau_no, self.slope_length, plateau_length, device, dtype,
+               first, last)
+        template = self._templates.get(key)
+        if template is not None:
+            self._templates.move_to_end(key)
+            return template
+
+        slope_no = plateau_no + int(last)
+        period = self.slope_length + plateau_length
+        mask = torch.zeros(plateau_no * period + self.slope_length * last,
+                           dtype=torch.bool,
+                           device=device)
+        mask[:plateau_no * period].view(plateau_no,
+                                        period)[:, self.slope_length:] = True
+
+        # Inner slopes skip the value of the previous plateau, and have one
+        # more division than the first and the last slope.
+        steps = torch.arange(1, self.slope_length + 1,
+                             device=device).repeat(slope_no, 1)
+        divisions = torch.full((slope_no, 1),
+                               self.slope_length + 1,
+                               device=device)
+        if first:
+            steps[0] -= 1
+            divisions[0] = self.slope_length
+        if last:
+            divisions[-1] = self.slope_length
+
+        template = {
+            "mask": mask,
+            "steps": steps.to(dtype),
+            "divisions": divisions.to(dtype),
+            "last": last
+        }
+        self._templates[key] = template
+        if len(self._templates) > TEMPLATE_CACHE_SIZE:
+            self._templates.popitem(last=False)
+        return template
+
+    def _slopes(self, starts: torch.Tensor, ends: torch.Tensor,
+                template: dict) -> torch.Tensor:
+        """
+        Computes all the slopes of a waveform in a single vectorised pass.
+        Slope i goes from starts[i] to ends[i]. The first slope starts on its
+        initial value and the last one finishes on its final value, while the
+        slopes in between exclude both extremes (which already belong to the
+        plateaus). The values are computed in the same way, and in the same
+        precision, as numpy.linspace does, so that they are bit-identical to
+        those obtained from it.
+
+        Parameters
+        ----------
+        starts : torch.Tensor
+            Initial values of each slope, with shape (slope_no, electrode_no).
+        ends : torch.Tensor
+            Final values of each slope, with shape (slope_no, electrode_no).
+        template : dict
+            Waveform template with the interpolation weights of the slopes.
+            See _get_template.
+
+        Returns
+        -------
+        torch.Tensor
+            The slopes, with shape (slope_no, slope_length, electrode_no).
+        """
+        extra_dims = (1, ) * (starts.dim() - 1)
+        steps = template["steps"].view(template["steps"].shape + extra_dims)
+        divisions = template["divisions"].view(template["divisions"].shape +
+                                               extra_dims)
+
+        starts = starts.unsqueeze(1)
+        delta = ends.unsqueeze(1) - starts
+        step = delta / divisions
+        output = steps * step + starts
+
+        # As in numpy.linspace, slopes where some step underflows to zero
+        # are computed dividing first, to support denormal numbers.
+        zero_step = (step == 0).flatten(1).any(dim=1)
+        if zero_step.any():
+            output = torch.where(
+                zero_step.view((len(starts), 1) + extra_dims),
+                (steps / divisions) * delta + starts, output)
+
+        # The last slope of the waveform ends exactly on its final value.
+        if template["last"] and self.slope_length > 0:
+            output[-1, -1] = ends[-1]
+        return output
+
+    def points_to_waveform(self,
+                           data,
+                           plateau_lengths=None,
+                           slope_lengths=None):
         """
         Generates a waveform (voltage input over time) with constant intervals
-        of value amplitudes[i] for interval i of length[i].
+        of value amplitudes[i] for interval i of length[i]. All the plateaus
+        and slopes are computed in a single vectorised pass, and written into
+        a single preallocated tensor on the same device as the input data.
+
+        The plateau and slope lengths of the object can be overriden per
+        point, so that only the points that need a longer settling time get
+        longer plateaus or slopes.
 
         Parameters
         ----------
         data : torch.tensor
             points for which waveform is generated as a torch tensor
+        plateau_lengths : Sequence[int], optional
+            Length of the plateau of each point, with shape (point_no,).
+            By default None, which uses the plateau length of the object.
+        slope_lengths : Sequence[int], optional
+            Length of each slope, with shape (point_no + 1,). Slope i goes
+            before point i, and the last one goes back to zero. By default
+            None, which uses the slope length of the object.
 
         Returns
         -------
@@ -161,35 +395,33 @@ class WaveformManager:
         assert len(
             data.shape
         ) >= 2, "Data requires to be in at least two dimensions (data, electrode_no)"
-        data_size = len(data) - 1
-        tmp = TorchUtils.to_numpy(data)
-        output = TorchUtils.format(np.linspace(0,
-                                               tmp[0],
-                                               num=self.slope_length,
-                                               endpoint=False),
-                                   device=data.device,
-                                   data_type=data.dtype)
-        for i in range(data_size):
-            output = torch.cat((output, data[i].repeat(self.plateau_length,
-                                                       1)))
-            output = torch.cat((
-                output,
-                TorchUtils.format(np.linspace(tmp[i],
-                                              tmp[i + 1],
-                                              num=self.slope_length + 1,
-                                              endpoint=False)[1:],
-                                  device=data.device,
-                                  data_type=data.dtype),
-            ))
-        output = torch.cat((output, data[-1].repeat(self.plateau_length, 1)))
-        output = torch.cat(
-            (output,
-             TorchUtils.format(np.linspace(tmp[-1],
-                                           0,
-                                           num=self.slope_length + 1)[1:],
-                               device=data.device,
-                               data_type=data.dtype)))
-        del tmp
+        if plateau_lengths is not None or slope_lengths is not None:
+            return self.points_to_compressed_waveform(data, plateau_lengths,
+                                                      slope_lengths).expand()
+        if self.plateau_length < 0:
+            raise RuntimeError(
+                f"Plateau length ({self.plateau_length}) cannot be negative.")
+        point_no = len(data)
+        period = self.slope_length + self.plateau_length
+
+        # Slopes go from zero to the first point, between consecutive points,
+        # and from the last point back to zero.
+        points = data.detach().to(get_slope_dtype(data.dtype))
+        template = self._get_template(point_no, self.plateau_length,
+                                      data.device, points.dtype)
+        zero = torch.zeros_like(points[:1])
+        slopes = self._slopes(torch.cat((zero, points)),
+                              torch.cat((points, zero)), template)
+
+        output = torch.empty((point_no * period + self.slope_length, ) +
+                             data.shape[1:],
+                             device=data.device,
+                             dtype=data.dtype)
+        body = output[:point_no * period].view((point_no, period) +
+                                               data.shape[1:])
+        body[:, :self.slope_length] = slopes[:-1]
+        body[:, self.slope_length:] = data.unsqueeze(1)
+        output[point_no * period:] = slopes[-1]
         return output
 
     def points_to_plateaus(self, data):
@@ -219,15 +451,20 @@ class WaveformManager:
     def plateaus_to_waveform(
         self,
         data: torch.Tensor,
-        return_pytorch=True
-    ) -> Tuple[Union[np.ndarray, torch.Tensor], Union[List[bool],
+        return_pytorch=True,
+        plateau_lengths=None,
+        slope_lengths=None
+    ) -> Tuple[Union[np.ndarray, torch.Tensor], Union[np.ndarray,
                                                       torch.Tensor]]:
         """
         Transform plateau data into full waveform data by adding
         slopes inbetween the plateaus.
-        Creates new array and alternates between adding slopes and
-        plateaus. Simultaneously makes a mask that indicates the
-        positions of the plateaus.
+        All the slopes are computed in a single vectorised pass, and written
+        together with the plateaus into a single preallocated output. The
+        mask that indicates the positions of the plateaus, and the weights
+        used to interpolate the slopes, are taken from a template that is
+        cached per number of plateaus (see _get_template), so that repeated
+        calls with the same shape do not need to rebuild them.
         Will throw error if data size is not multiple of set plateau length
         of the object (self.plateau_length).
 
@@ -255,6 +492,13 @@ class WaveformManager:
         return_pytorch : bool, optional
             Indicates whether to return a pytorch tensor (true) or a numpy
             array (false). Default is true.
+        plateau_lengths : Sequence[int], optional
+            Length of each of the plateaus, with shape (plateau_no,). Their
+            sum has to be the length of the data. By default None, which uses
+            the plateau length of the object.
+        slope_lengths : Sequence[int], optional
+            Length of each slope, with shape (plateau_no + 1,). By default
+            None, which uses the slope length of the object.
 
         Returns
         -------
@@ -267,67 +511,628 @@ class WaveformManager:
         Raises
         ------
         AssertionError
-            If the lenght of the input data is not a multiple of the plateau
-            length of the object.
+            If the input data is empty, if the plateau length of the object
+            is not positive, or if the length of the data is not a multiple
+            of it.
         """
+        assert len(data) > 0, "The input data should contain at least one plateau"
+        if plateau_lengths is not None or slope_lengths is not None:
+            waveform = self.plateaus_to_compressed_waveform(
+                data, plateau_lengths, slope_lengths)
+            mask = waveform.get_mask().expand()
+            if return_pytorch:
+                return waveform.expand(), mask
+            return waveform.to_numpy(), TorchUtils.to_numpy(mask).tolist()
+
         # Check input format.
+        assert self.plateau_length > 0, (
+            f"The plateau length should be positive, got {self.plateau_length}")
         assert (len(data) % self.plateau_length == 0
                 ), f"Length of input data {data.shape} is not multiple of "
         f"plateau length {self.plateau_length}."
 
-        data_size = int(len(data) / self.plateau_length)  # number of plateaus
-        input_copy = TorchUtils.to_numpy(
-            data)  # numpy copy of input data (numpy linspace works for
-        # multidimensional data while torch does not)
-        start = 0  # starting position of current plateau in input data
-
-        # Initiate output.
-        output_data = np.linspace(0,
-                                  input_copy[start],
-                                  num=self.slope_length,
-                                  endpoint=False)
-        output_mask = [False] * self.slope_length
-
-        # Go through all data except last plateau.
-        for i in range(data_size - 1):
-            end = start + self.plateau_length
-            output_mask += [True] * self.plateau_length
-            output_data = np.concatenate((output_data, input_copy[start:end]))
-            output_mask += [False] * self.slope_length
-            output_data = np.concatenate((
-                output_data,
-                np.linspace(input_copy[end - 1],
-                            input_copy[end],
-                            num=self.slope_length + 1,
-                            endpoint=False)[1:],
-            ))
-            start = end
-
-        # Go through last plateau and final slope.
-        output_mask += [True] * self.plateau_length
-        output_data = np.concatenate((output_data, input_copy[start:]))
-        output_mask += [False] * self.slope_length
-        output_data = np.concatenate(
-            (output_data,
-             np.linspace(input_copy[-1], 0, num=self.slope_length + 1)[1:]))
+        plateaus = data.detach().to(get_slope_dtype(data.dtype))
+        plateau_length = self.plateau_length
+        plateau_no = len(data) // plateau_length
+        period = self.slope_length + plateau_length
+        template = self._get_template(plateau_no, plateau_length, data.device,
+                                      plateaus.dtype)
+
+        # Slopes go from zero to the first plateau, from the end of each
+        # plateau to the beginning of the next one, and from the end of the
+        # last plateau back to zero.
+        zero = torch.zeros_like(plateaus[:1])
+        slopes = self._slopes(
+            torch.cat((zero, plateaus[plateau_length - 1::plateau_length])),
+            torch.cat((plateaus[::plateau_length], zero)), template)
+
+        output_data = torch.empty(
+            (len(template["mask"]), ) + data.shape[1:],
+            device=data.device,
+            dtype=data.dtype if return_pytorch else plateaus.dtype)
+        body = output_data[:plateau_no * period].view((plateau_no, period) +
+                                                      data.shape[1:])
+        body[:, :self.slope_length] = slopes[:-1]
+        body[:, self.slope_length:] = data.reshape((plateau_no,
+                                                    plateau_length) +
+                                                   data.shape[1:])
+        output_data[plateau_no * period:] = slopes[-1]
+        output_mask = template["mask"].clone()
 
         if return_pytorch:
-            return (
-                TorchUtils.format(output_data,
-                                  device=data.device,
-                                  data_type=data.dtype),
-                TorchUtils.format(output_mask,
-                                  device=data.device,
-                                  data_type=bool),
-            )
-        else:
             return output_data, output_mask
+        else:
+            return TorchUtils.to_numpy(output_data), TorchUtils.to_numpy(
+                output_mask).tolist()
+
+    def get_waveform_length(self, point_no: int) -> int:
+        """
+        Gets the length that the waveform of a given number of points has.
+
+        Parameters
+        ----------
+        point_no : int
+            Number of points (or plateaus) represented in the waveform.
+
+        Returns
+        -------
+        int
+            Number of samples of the waveform.
+        """
+        return point_no * (self.slope_length +
+                           self.plateau_length) + self.slope_length
+
+    def get_transition_deltas(self,
+                              data: torch.Tensor,
+                              tails: torch.Tensor = None) -> torch.Tensor:
+        """
+        Gets the largest voltage jump over all electrodes of each slope of
+        the waveform of a set of points, including the slopes from and to
+        zero at the start and end of the waveform.
 
-    def plateaus_to_points(self, data: torch.Tensor) -> torch.Tensor:
+        Parameters
+        ----------
+        data : torch.Tensor
+            Points with shape (point_no, electrode_no). When tails are given,
+            the first value of each plateau.
+        tails : torch.Tensor, optional
+            Last value of each plateau, with the same shape as the data. By
+            default None, which uses the data.
+
+        Returns
+        -------
+        torch.Tensor
+            Voltage jump of each slope, with shape (point_no + 1,).
+        """
+        if tails is None:
+            tails = data
+        zeros = data.new_zeros((1, ) + tuple(data.shape[1:]))
+        deltas = torch.cat((data, zeros)) - torch.cat((zeros, tails))
+        return deltas.abs().reshape(len(deltas), -1).amax(dim=1)
+
+    def get_slope_lengths(self,
+                          data: torch.Tensor,
+                          max_delta: float,
+                          tails: torch.Tensor = None) -> torch.Tensor:
+        """
+        Gets the length of each slope of the waveform of a set of points, when
+        each slope is shortened in proportion to its voltage jump, so that only
+        a jump of max_delta requires the full slope length of the object. The
+        lengths are rounded up, so the voltage change per sample of a slope is
+        never larger than max_delta / slope_length. Slopes between equal
+        values have no samples.
+
+        Example
+        -------
+        >>> manager = WaveformManager({"plateau_length": 1, "slope_length": 10})
+        >>> data = torch.tensor([[0.5], [0.25]])
+        >>> manager.get_slope_lengths(data, 1.)
+        torch.tensor([5, 3, 3])
+
+        Parameters
+        ----------
+        data : torch.Tensor
+            Points with shape (point_no, electrode_no). When tails are given,
+            the first value of each plateau.
+        max_delta : float
+            Voltage jump that requires the full slope length. If it is zero,
+            all of the slopes between different values have the full slope
+            length.
+        tails : torch.Tensor, optional
+            Last value of each plateau, with the same shape as the data. By
+            default None, which uses the data.
+
+        Returns
+        -------
+        torch.Tensor
+            Length of each slope, with shape (point_no + 1,).
+        """
+        assert max_delta >= 0, "The maximum voltage jump cannot be negative"
+        deltas = self.get_transition_deltas(data, tails)
+        if max_delta == 0:
+            # Any voltage jump requires the full slope length
+            deltas = (deltas > 0).to(deltas.dtype)
+        else:
+            deltas = (deltas / max_delta).clamp(max=1)
+        return torch.ceil(deltas * self.slope_length).long()
+
+    def get_ramp_length(self, data: torch.Tensor, max_delta: float) -> int:
+        """
+        Gets the total length of the slopes of the waveform of a set of
+        points, if each slope was shortened in proportion to its voltage jump
+        (see get_slope_lengths).
+
+        Parameters
+        ----------
+        data : torch.Tensor
+            Points with shape (point_no, electrode_no).
+        max_delta : float
+            Voltage jump that requires the full slope length.
+
+        Returns
+        -------
+        int
+            Total number of samples of the slopes.
+        """
+        return int(self.get_slope_lengths(data, max_delta).sum())
+
+    def get_point_order(self, data: torch.Tensor) -> torch.Tensor:
+        """
+        Gets an order of a set of points that reduces the voltage jumps
+        between consecutive points of their waveform, using a nearest
+        neighbour heuristic. Starting from zero, where the waveform starts,
+        the next point is always the closest of the remaining ones. Distances
+        are the largest voltage difference over all electrodes, which is what
+        limits how fast the slope between two points can be. Batches with more
+        than REORDER_CHUNK_SIZE points are reordered in consecutive chunks,
+        each one starting from the last point of the previous chunk.
+
+        Example
+        -------
+        >>> manager = WaveformManager({"plateau_length": 1, "slope_length": 2})
+        >>> data = torch.tensor([[0.9], [0.1], [0.5]])
+        >>> manager.get_point_order(data)
+        torch.tensor([1, 2, 0])
+
+        Parameters
+        ----------
+        data : torch.Tensor
+            Points with shape (point_no, electrode_no).
+
+        Returns
+        -------
+        torch.Tensor
+            Permutation of the indices of the points, with shape (point_no,).
+        """
+        assert type(
+            data) is torch.Tensor, "Data provided is not a pytorch Tensor"
+        data = data.detach().reshape(len(data), -1)
+        order = torch.empty(len(data), dtype=torch.long, device=data.device)
+        last = torch.zeros(data.shape[1], dtype=data.dtype, device=data.device)
+        for start in range(0, len(data), REORDER_CHUNK_SIZE):
+            chunk = data[start:start + REORDER_CHUNK_SIZE]
+            # The distances between the points of the chunk are computed at once
+            pairwise_distances = torch.cdist(chunk, chunk, p=float("inf"))
+            visited = torch.zeros(len(chunk), dtype=torch.bool, device=data.device)
+            distances = (chunk - last).abs().amax(dim=1)
+            for i in range(len(chunk)):
+                index = torch.argmin(distances.masked_fill(visited, float("inf")))
+                order[start + i] = start + index
+                visited[index] = True
+                distances = pairwise_distances[index]
+            last = chunk[index]
+        return order
+
+    def points_to_waveform_chunks(self, data: torch.Tensor, chunk_size: int):
+        """
+        Generates the same waveform as points_to_waveform, but yielding it in
+        consecutive chunks of a fixed size, together with the corresponding
+        chunks of the plateau mask. Only the points needed for the current
+        chunk are transformed at a time, so the memory required is bounded by
+        the chunk size rather than by the length of the whole waveform. The
+        slopes are joined across chunk boundaries, so concatenating all the
+        chunks gives exactly the output of points_to_waveform.
+
+        Example
+        -------
+        >>> manager = WaveformManager({"plateau_length": 2, "slope_length": 2})
+        >>> data = torch.tensor([[1.], [3.]])
+        >>> for chunk, mask in manager.points_to_waveform_chunks(data, 4):
+        >>>     print(chunk.flatten(), mask)
+        tensor([0.0000, 0.5000, 1.0000, 1.0000]) tensor([False, False, True, True])
+        tensor([1.6667, 2.3333, 3.0000, 3.0000]) tensor([False, False, True, True])
+        tensor([1.5000, 0.0000]) tensor([False, False])
+
+        Parameters
+        ----------
+        data : torch.Tensor
+            Points from which the waveform is generated, with shape
+            (point_no, electrode_no).
+        chunk_size : int
+            Number of waveform samples in each chunk. The last chunk can be
+            shorter.
+
+        Yields
+        ------
+        torch.Tensor
+            Chunk of the waveform.
+        torch.Tensor
+            Chunk of the mask, with True at plateaus and False at slopes.
+        """
+        assert type(
+            data) is torch.Tensor, "Data provided is not a pytorch Tensor"
+        assert len(
+            data.shape
+        ) >= 2, "Data requires to be in at least two dimensions (data, electrode_no)"
+        plateaus = data.unsqueeze(1).expand((len(data), self.plateau_length) +
+                                            data.shape[1:])
+        return self._waveform_chunks(plateaus, data, data, chunk_size)
+
+    def plateaus_to_waveform_chunks(self, data: torch.Tensor,
+                                    chunk_size: int):
+        """
+        Generates the same waveform as plateaus_to_waveform, but yielding it in
+        consecutive chunks of a fixed size, together with the corresponding
+        chunks of the plateau mask. See points_to_waveform_chunks.
+
+        Parameters
+        ----------
+        data : torch.Tensor
+            The input data, consisting of sequences of repeated numbers, each
+            sequence having the same length of the set plateau length of the
+            object.
+        chunk_size : int
+            Number of waveform samples in each chunk. The last chunk can be
+            shorter.
+
+        Yields
+        ------
+        torch.Tensor
+            Chunk of the waveform.
+        torch.Tensor
+            Chunk of the mask, with True at plateaus and False at slopes.
+
+        Raises
+        ------
+        AssertionError
+            If the lenght of the input data is not a multiple of the plateau
+            length of the object.
+        """
+        assert type(
+            data) is torch.Tensor, "Data provided is not a pytorch Tensor"
+        assert (len(data) % self.plateau_length == 0
+                ), f"Length of input data {data.shape} is not multiple of "
+        f"plateau length {self.plateau_length}."
+        plateaus = data.reshape((len(data) // self.plateau_length,
+                                 self.plateau_length) + data.shape[1:])
+        return self._waveform_chunks(plateaus,
+                                     data[::self.plateau_length],
+                                     data[self.plateau_length - 1::self.
+                                          plateau_length], chunk_size)
+
+    def _waveform_chunks(self, plateaus: torch.Tensor, heads: torch.Tensor,
+                         tails: torch.Tensor, chunk_size: int):
+        """
+        Generator shared by points_to_waveform_chunks and
+        plateaus_to_waveform_chunks. The plateaus are transformed in blocks of
+        roughly one chunk, whose slopes start from the end of the previous
+        block.
+
+        Parameters
+        ----------
+        plateaus : torch.Tensor
+            Plateaus of the waveform, with shape
+            (plateau_no, plateau_length, electrode_no).
+        heads : torch.Tensor
+            First value of each plateau, where the slope before it ends.
+        tails : torch.Tensor
+            Last value of each plateau, where the slope after it starts.
+        chunk_size : int
+            Number of waveform samples in each chunk.
+
+        Yields
+        ------
+        torch.Tensor
+            Chunk of the waveform.
+        torch.Tensor
+            Chunk of the mask.
+        """
+        assert type(chunk_size) is int and chunk_size > 0, (
+            "The chunk size should be a positive integer")
+        plateau_no = len(plateaus)
+        period = self.slope_length + self.plateau_length
+        block_size = max(1, chunk_size // max(period, 1))
+        dtype = get_slope_dtype(plateaus.dtype)
+        heads = heads.detach().to(dtype)
+        tails = tails.detach().to(dtype)
+        zero = torch.zeros_like(heads[:1])
+
+        buffer, mask_buffer = None, None
+        for start in range(0, plateau_no, block_size):
+            end = min(start + block_size, plateau_no)
+            first, last = start == 0, end == plateau_no
+            template = self._get_template(end - start, self.plateau_length,
+                                          plateaus.device, dtype, first,
+                                          last)
+            starts = tails[start - 1:end - 1] if not first else torch.cat(
+                (zero, tails[:end - 1]))
+            ends = heads[start:end]
+            if last:
+                starts = torch.cat((starts, tails[-1:]))
+                ends = torch.cat((ends, zero))
+            slopes = self._slopes(starts, ends, template)
+
+            block = torch.empty((len(template["mask"]), ) +
+                                plateaus.shape[2:],
+                                device=plateaus.device,
+                                dtype=plateaus.dtype)
+            body = block[:(end - start) * period].view((end - start, period) +
+                                                       plateaus.shape[2:])
+            body[:, :self.slope_length] = slopes[:end - start]
+            body[:, self.slope_length:] = plateaus[start:end]
+            if last:
+                block[(end - start) * period:] = slopes[-1]
+
+            if buffer is None:
+                buffer, mask_buffer = block, template["mask"]
+            else:
+                buffer = torch.cat((buffer, block))
+                mask_buffer = torch.cat((mask_buffer, template["mask"]))
+            while len(buffer) >= chunk_size:
+                yield buffer[:chunk_size], mask_buffer[:chunk_size].clone()
+                buffer = buffer[chunk_size:]
+                mask_buffer = mask_buffer[chunk_size:]
+        if buffer is not None and len(buffer) > 0:
+            yield buffer, mask_buffer.clone()
+
+    def points_to_compressed_waveform(self,
+                                      data: torch.Tensor,
+                                      plateau_lengths=None,
+                                      slope_lengths=None):
+        """
+        Generates the same waveform as points_to_waveform, but in a
+        run-length compressed form. Each plateau is stored as a single run
+        (value, length) and each slope as a single ramp towards its final
+        value, so the memory required does not depend on the plateau and
+        slope lengths. See CompressedWaveform.
+
+        Parameters
+        ----------
+        data : torch.Tensor
+            Points from which the waveform is generated, with shape
+            (point_no, electrode_no).
+        plateau_lengths : Sequence[int], optional
+            Length of the plateau of each point, with shape (point_no,).
+            By default None, which uses the plateau length of the object.
+        slope_lengths : Sequence[int], optional
+            Length of each slope, with shape (point_no + 1,). By default
+            None, which uses the slope length of the object.
+
+        Returns
+        -------
+        CompressedWaveform
+            Compressed waveform, which expands to the output of
+            points_to_waveform.
+        """
+        assert type(
+            data) is torch.Tensor, "Data provided is not a pytorch Tensor"
+        assert len(
+            data.shape
+        ) >= 2, "Data requires to be in at least two dimensions (data, electrode_no)"
+        data = data.detach()
+        template = self._get_template_key(len(data), plateau_lengths,
+                                          slope_lengths)
+        plateau_lengths, slope_lengths = self.get_lengths(
+            len(data), plateau_lengths, slope_lengths, data.device)
+        waveform = self._compress(data, data, plateau_lengths,
+                                  torch.arange(len(data), device=data.device),
+                                  slope_lengths)
+        waveform.template = template
+        return waveform
+
+    def plateaus_to_compressed_waveform(self,
+                                        data: torch.Tensor,
+                                        plateau_lengths=None,
+                                        slope_lengths=None):
+        """
+        Generates the same waveform as plateaus_to_waveform, but in a
+        run-length compressed form. Consecutive repeated values of a plateau
+        are stored as a single run (value, length), and each slope as a single
+        ramp towards its final value. Plateaus that are not constant are split
+        into several runs, so the compression is lossless. See
+        CompressedWaveform.
+
+        Parameters
+        ----------
+        data : torch.Tensor
+            The input data, consisting of sequences of repeated numbers, each
+            sequence having the same length of the set plateau length of the
+            object.
+        plateau_lengths : Sequence[int], optional
+            Length of each of the plateaus, with shape (plateau_no,). Their
+            sum has to be the length of the data. By default None, which uses
+            the plateau length of the object.
+        slope_lengths : Sequence[int], optional
+            Length of each slope, with shape (plateau_no + 1,). By default
+            None, which uses the slope length of the object.
+
+        Returns
+        -------
+        CompressedWaveform
+            Compressed waveform, which expands to the output of
+            plateaus_to_waveform.
+
+        Raises
+        ------
+        AssertionError
+            If the lenght of the input data is not a multiple of the plateau
+            length of the object.
+        """
+        assert type(
+            data) is torch.Tensor, "Data provided is not a pytorch Tensor"
+        if plateau_lengths is None:
+            assert (len(data) % self.plateau_length == 0
+                    ), f"Length of input data {data.shape} is not multiple of "
+            f"plateau length {self.plateau_length}."
+            plateau_no = len(data) // self.plateau_length
+        else:
+            plateau_no = len(plateau_lengths)
+        data = data.detach()
+        template = self._get_template_key(plateau_no, plateau_lengths,
+                                          slope_lengths)
+        plateau_lengths, slope_lengths = self.get_lengths(
+            plateau_no, plateau_lengths, slope_lengths, data.device)
+        assert (plateau_lengths > 0).all() and int(plateau_lengths.sum()) == len(
+            data), "Plateau lengths should be positive and add up to the data length"
+        starts = torch.cumsum(plateau_lengths, dim=0) - plateau_lengths
+
+        # A new run starts at the beginning of each plateau, and wherever the
+        # value of any electrode changes inside of it.
+        changes = torch.ones(len(data), dtype=torch.bool, device=data.device)
+        if len(data) > 1:
+            changes[1:] = (data[1:] != data[:-1]).reshape(len(data) - 1,
+                                                          -1).any(dim=1)
+        changes[starts] = True
+        run_starts = torch.nonzero(changes).squeeze(1)
+        lengths = torch.diff(run_starts,
+                             append=run_starts.new_tensor([len(data)]))
+        plateau_index = torch.bucketize(run_starts, starts, right=True) - 1
+        waveform = self._compress(data[run_starts], data[starts], lengths,
+                                  plateau_index, slope_lengths)
+        waveform.template = template
+        return waveform
+
+    def _get_template_key(self, plateau_no: int, plateau_lengths,
+                          slope_lengths):
+        """
+        Gets the key of the template of a compressed waveform, which
+        identifies its structure. Only waveforms with the plateau and slope
+        lengths of the object, and with slopes, have a template, as they
+        always start and end at zero, regardless of their values.
+
+        Parameters
+        ----------
+        plateau_no : int
+            Number of plateaus (or points) in the waveform.
+        plateau_lengths : Sequence[int] or None
+            Length of each plateau, as given to the compression method.
+        slope_lengths : Sequence[int] or None
+            Length of each slope, as given to the compression method.
+
+        Returns
+        -------
+        tuple or None
+            Key of the template, or None if the waveform has no template.
+        """
+        if (plateau_lengths is not None or slope_lengths is not None
+                or self.slope_length <= 0):
+            return None
+        return (plateau_no, self.slope_length, self.plateau_length)
+
+    def _compress(self, values: torch.Tensor, heads: torch.Tensor,
+                  lengths: torch.Tensor, plateau_index: torch.Tensor,
+                  slope_lengths: torch.Tensor):
+        """
+        Interleaves the runs of the plateaus with the ramps of the slopes to
+        build a compressed waveform. Segments of length zero are kept, as the
+        ramps that follow them start from their values.
+
+        Parameters
+        ----------
+        values : torch.Tensor
+            Value of each run, with shape (run_no, electrode_no).
+        heads : torch.Tensor
+            First value of each plateau, where the slope before it ends.
+        lengths : torch.Tensor
+            Length of each run.
+        plateau_index : torch.Tensor
+            Index of the plateau to which each run belongs.
+        slope_lengths : torch.Tensor
+            Length of each slope, with shape (plateau_no + 1,).
+
+        Returns
+        -------
+        CompressedWaveform
+            Compressed waveform.
+        """
+        plateau_no, run_no = len(heads), len(values)
+        run_counts = torch.bincount(plateau_index, minlength=plateau_no)
+        ramp_positions = torch.arange(
+            plateau_no + 1, device=values.device) + torch.cat(
+                (run_counts.new_zeros(1), torch.cumsum(run_counts, dim=0)))
+        run_positions = plateau_index + 1 + torch.arange(run_no,
+                                                         device=values.device)
+
+        segment_no = plateau_no + 1 + run_no
+        segment_values = values.new_zeros((segment_no, ) + values.shape[1:])
+        segment_values[ramp_positions[:-1]] = heads
+        segment_values[run_positions] = values
+        segment_lengths = lengths.new_empty((segment_no, ))
+        segment_lengths[ramp_positions] = slope_lengths
+        segment_lengths[run_positions] = lengths
+        ramps = torch.ones(segment_no, dtype=torch.bool, device=values.device)
+        ramps[run_positions] = False
+
+        return CompressedWaveform(segment_values, segment_lengths, ramps)
+
+    def get_lengths(self,
+                    point_no: int,
+                    plateau_lengths=None,
+                    slope_lengths=None,
+                    device=None):
+        """
+        Gets the plateau and slope lengths of each of the points of a
+        waveform, as tensors. The lengths that are not given are filled with
+        the plateau and slope lengths of the object.
+
+        Parameters
+        ----------
+        point_no : int
+            Number of points of the waveform.
+        plateau_lengths : Sequence[int], optional
+            Length of the plateau of each point, with shape (point_no,).
+            By default None.
+        slope_lengths : Sequence[int], optional
+            Length of each slope, with shape (point_no + 1,). By default None.
+        device : torch.device, optional
+            Device where the lengths are stored. By default None, which uses
+            the device of TorchUtils.
+
+        Returns
+        -------
+        torch.Tensor
+            Plateau lengths, with shape (point_no,).
+        torch.Tensor
+            Slope lengths, with shape (point_no + 1,).
+        """
+        if device is None:
+            device = TorchUtils.get_device()
+        lengths = []
+        for parameter, default, size in [
+            (plateau_lengths, self.plateau_length, point_no),
+            (slope_lengths, self.slope_length, point_no + 1)
+        ]:
+            if parameter is None:
+                parameter = torch.full((size, ),
+                                       default,
+                                       dtype=torch.long,
+                                       device=device)
+            else:
+                parameter = torch.as_tensor(parameter,
+                                            dtype=torch.long,
+                                            device=device)
+            assert parameter.shape == (size, ), (
+                f"Expected {size} lengths, got shape {tuple(parameter.shape)}")
+            assert (parameter >= 0).all(), "Lengths cannot be negative"
+            lengths.append(parameter)
+        return lengths[0], lengths[1]
+
+    def plateaus_to_points(self, data, out=None, plateau_lengths=None):
         """
         Transform a tensor of plateaus to a tensor of points. This is done by
         reshaping the data such that one dimension is the plateau length,
-        then removing that dimension by taking the mean over it.
+        then removing that dimension by taking the mean over it (or by
+        applying the plateau reduction of the object, see reduce_plateaus).
 
         Example
         -------
@@ -341,14 +1146,21 @@ class WaveformManager:
 
         Parameters
         ----------
-        data : torch.Tensor
+        data : torch.Tensor or np.array
             The input data, should consist of sequences of repeated numbers,
             each sequence having the lenght of the set plateau length of the
             object.
+        out : torch.Tensor or np.array, optional
+            Preallocated buffer, of the same type as the data, where the output
+            is written. By default None, which allocates a new one.
+        plateau_lengths : Sequence[int], optional
+            Length of each of the plateaus, with shape (plateau_no,). Their
+            sum has to be the length of the data. By default None, which uses
+            the plateau length of the object.
 
         Returns
         -------
-        output : torch.Tensor
+        output : torch.Tensor or np.array
             Tensor where every plateau of the input data is represented
             by a single point.
 
@@ -358,6 +1170,9 @@ class WaveformManager:
             If the lenght of the input data is not a multiple of the plateau
             length of the object.
         """
+        if plateau_lengths is not None:
+            return self._segment_reduce(data, plateau_lengths, out)
+
         # Check input format.
         assert (len(data) % self.plateau_length == 0
                 ), f"Length of input data {data.shape} is not multiple of "
@@ -365,6 +1180,16 @@ class WaveformManager:
 
         data_size = int(len(data) / self.plateau_length)  # number of plateaus
 
+        if not self.is_plain_mean():
+            return self.reduce_plateaus(
+                data.reshape((data_size, self.plateau_length) +
+                             tuple(data.shape[1:])),
+                out=out)
+
+        if isinstance(data, np.ndarray):
+            return data.reshape((data_size, self.plateau_length) +
+                                data.shape[1:]).mean(axis=1, out=out)
+
         # Reshape input so that each data point is represented along
         # dimension 0, then take average over dimension 1 to get rid
         # of plateaus.
@@ -372,7 +1197,10 @@ class WaveformManager:
         data_shape = list(data.shape)
         data_shape[0] = data_size
         data_shape[1] = self.plateau_length
-        output = data.view(data_shape).mean(dim=1)
+        if out is None:
+            output = data.view(data_shape).mean(dim=1)
+        else:
+            output = torch.mean(data.view(data_shape), dim=1, out=out)
 
         # Make the output two-dimensional.
         # if len(output.shape) == 1:
@@ -380,12 +1208,18 @@ class WaveformManager:
         return output
 
     def waveform_to_points(self,
-                           data: torch.Tensor,
-                           mask=None) -> torch.Tensor:
+                           data,
+                           mask=None,
+                           out=None,
+                           plateau_lengths=None,
+                           slope_lengths=None):
         """
         Transform waveform data to point data. First apply a mask to remove
         the slopes, then apply self.plateaus_to_points to get only points.
-        If a mask is not given, it will be generated.
+        If a mask is not given, and the waveform has the length of a whole
+        number of points, the plateaus are averaged directly on a strided
+        view of the data, without copying them. Otherwise, the mask will be
+        generated.
 
         Example
         -------
@@ -396,14 +1230,23 @@ class WaveformManager:
 
         Parameters
         ----------
-        data : torch.Tensor
+        data : torch.Tensor or np.array
             Input data in waveform form.
-        mask : Sequence[bool], optional
+        mask : Sequence[bool] or CompressedMask, optional
             Provide a mask, by default None.
+        out : torch.Tensor or np.array, optional
+            Preallocated buffer, of the same type as the data, where the output
+            is written. By default None, which allocates a new one.
+        plateau_lengths : Sequence[int], optional
+            Length of the plateau of each point, for waveforms generated with
+            per-point lengths. By default None.
+        slope_lengths : Sequence[int], optional
+            Length of each slope, for waveforms generated with per-point
+            lengths. By default None.
 
         Returns
         -------
-        torch.Tensor
+        torch.Tensor or np.array
             A tensor where each data point is represented once.
 
         Raises
@@ -412,22 +1255,42 @@ class WaveformManager:
             If the lenght of the input data is not a multiple of the plateau
             length of the object.
         """
-        assert type(
-            data) is torch.Tensor, "Data provided is not a pytorch Tensor"
+        assert type(data) is torch.Tensor or type(
+            data
+        ) is np.ndarray, "Data provided is not a pytorch Tensor or a numpy array"
         assert len(
             data.shape
         ) >= 2, "Data requires to be in at least two dimensions (data, electrode_no)"
-        print(data.shape)
+        if plateau_lengths is not None or slope_lengths is not None:
+            if plateau_lengths is None:
+                plateau_lengths, _ = self.get_lengths(
+                    len(slope_lengths) - 1, slope_lengths=slope_lengths)
+            if mask is None:
+                mask = self.generate_mask(len(data), plateau_lengths,
+                                          slope_lengths)
+            return self.plateaus_to_points(self.waveform_to_plateaus(
+                data, mask),
+                                           out=out,
+                                           plateau_lengths=plateau_lengths)
         if mask is None:
-            mask = self.generate_mask(len(data))
-        return self.plateaus_to_points(self.waveform_to_plateaus(data, mask))
-
-    def waveform_to_plateaus(self,
-                             data: torch.Tensor,
-                             mask=None) -> torch.Tensor:
+            plateaus = self._plateau_view(data)
+            if plateaus is not None:
+                if not self.is_plain_mean():
+                    return self.reduce_plateaus(plateaus, out=out)
+                if type(data) is np.ndarray:
+                    return plateaus.mean(axis=1, out=out)
+                if out is None:
+                    return plateaus.mean(dim=1)
+                return torch.mean(plateaus, dim=1, out=out)
+        return self.plateaus_to_points(self.waveform_to_plateaus(data, mask),
+                                       out=out)
+
+    def waveform_to_plateaus(self, data, mask=None):
         """
         Go from waveform to only plateaus by removing the slopes.
-        Either generate a mask or use a given one.
+        Either generate a mask or use a given one. If a mask is not given,
+        and the waveform has the length of a whole number of points, the
+        plateaus are copied from a strided view of the data instead.
 
         Assume input data is infact a waveform (no size assertion).
 
@@ -441,26 +1304,262 @@ class WaveformManager:
 
         Parameters
         ----------
-        data : torch.Tensor
+        data : torch.Tensor or np.array
             Input data in waveform form.
-        mask : Sequence[bool], optional
+        mask : Sequence[bool] or CompressedMask, optional
             Provide a mask, by default None
 
         Returns
         -------
-        torch.Tensor
+        torch.Tensor or np.array
             Tensor with the slopes removed.
         """
-        assert type(
-            data) is torch.Tensor, "Data provided is not a pytorch Tensor"
+        assert type(data) is torch.Tensor or type(
+            data
+        ) is np.ndarray, "Data provided is not a pytorch Tensor or a numpy array"
         assert len(
             data.shape
         ) >= 2, "Data requires to be in at least two dimensions (data, electrode_no)"
         if mask is None:
-            mask = self.generate_mask(len(data)).to(data.device)
+            plateaus = self._plateau_view(data)
+            if plateaus is not None:
+                return plateaus.reshape((-1, ) + data.shape[1:])
+            mask = self.generate_mask(len(data))
+        elif isinstance(mask, CompressedMask):
+            mask = mask.expand()
+        if type(data) is np.ndarray:
+            if type(mask) is torch.Tensor:
+                mask = TorchUtils.to_numpy(mask)
+        elif type(mask) is torch.Tensor:
+            mask = mask.to(data.device)
         return data[mask]
 
-    def generate_mask(self, data_size: int) -> torch.Tensor:
+    def _segment_reduce(self, data, lengths, out=None):
+        """
+        Averages consecutive segments of variable length of the data. The
+        segments are described by their lengths, from which the offsets of
+        each segment (as in a CSR matrix) are computed, so that the reduction
+        is done in a single vectorised pass (index_add for torch tensors, and
+        add.reduceat for numpy arrays). Other plateau reductions scatter the
+        segments into a NaN padded tensor, which is passed to reduce_plateaus
+        together with the lengths.
+
+        Parameters
+        ----------
+        data : torch.Tensor or np.array
+            Data to be averaged.
+        lengths : Sequence[int]
+            Length of each segment. Their sum has to be the length of the data.
+        out : torch.Tensor or np.array, optional
+            Preallocated buffer, of the same type as the data, where the output
+            is written. By default None, which allocates a new one.
+
+        Returns
+        -------
+        torch.Tensor or np.array
+            Mean of each segment, with shape (segment_no, electrode_no).
+        """
+        if not self.is_plain_mean():
+            return self._padded_reduce(data, lengths, out)
+        if type(data) is np.ndarray:
+            if type(lengths) is torch.Tensor:
+                lengths = TorchUtils.to_numpy(lengths)
+            lengths = np.asarray(lengths, dtype=np.int64)
+            assert (lengths > 0).all() and lengths.sum() == len(
+                data), "Lengths should be positive and add up to the data length"
+            offsets = np.cumsum(lengths) - lengths
+            out = np.add.reduceat(data, offsets, axis=0, out=out)
+            out /= lengths.reshape((-1, ) + (1, ) * (data.ndim - 1))
+            return out
+        lengths = torch.as_tensor(lengths, dtype=torch.long, device=data.device)
+        assert (lengths > 0).all() and int(lengths.sum()) == len(
+            data), "Lengths should be positive and add up to the data length"
+        segments = torch.repeat_interleave(
+            torch.arange(len(lengths), device=data.device), lengths)
+        if out is None:
+            out = data.new_zeros((len(lengths), ) + data.shape[1:])
+        else:
+            out.zero_()
+        out.index_add_(0, segments, data)
+        out /= lengths.to(data.dtype).view((-1, ) + (1, ) * (data.dim() - 1))
+        return out
+
+    def _padded_reduce(self, data, lengths, out=None):
+        """
+        Reduces consecutive segments of variable length of the data with the
+        plateau reduction of the object, by scattering them into a tensor of
+        shape (segment_no, max_length, electrode_no) padded with NaN. Integer
+        data is reduced in the default floating point type of pytorch.
+
+        Parameters
+        ----------
+        data : torch.Tensor or np.array
+            Data to be reduced.
+        lengths : Sequence[int]
+            Length of each segment. Their sum has to be the length of the data.
+        out : torch.Tensor or np.array, optional
+            Preallocated buffer, of the same type as the data, where the output
+            is written. By default None, which allocates a new one.
+
+        Returns
+        -------
+        torch.Tensor or np.array
+            Reduction of each segment, with shape (segment_no, electrode_no).
+        """
+        if type(data) is np.ndarray:
+            output = self._padded_reduce(torch.from_numpy(data),
+                                         lengths).numpy()
+            if out is None:
+                return output
+            out[...] = output
+            return out
+        lengths = torch.as_tensor(lengths, dtype=torch.long, device=data.device)
+        assert (lengths > 0).all() and int(lengths.sum()) == len(
+            data), "Lengths should be positive and add up to the data length"
+        if not data.is_floating_point():
+            # The padding is NaN, which integer tensors cannot hold
+            data = data.to(torch.get_default_dtype())
+        segments = torch.repeat_interleave(
+            torch.arange(len(lengths), device=data.device), lengths)
+        offsets = torch.cumsum(lengths, dim=0) - lengths
+        positions = torch.arange(len(data),
+                                 device=data.device) - offsets[segments]
+        padded = data.new_full(
+            (len(lengths), int(lengths.max())) + tuple(data.shape[1:]),
+            float("nan"))
+        padded[segments, positions] = data
+        return self.reduce_plateaus(padded, lengths, out)
+
+    def is_plain_mean(self) -> bool:
+        """
+        Whether the plateaus are reduced with a plain mean over all of their
+        samples, which allows to use the cheapest reduction paths.
+
+        Returns
+        -------
+        bool
+            True if the plateau reduction is "mean" and no settling samples
+            are discarded.
+        """
+        return self.plateau_reduction == "mean" and self.settling_samples == 0
+
+    def reduce_plateaus(self, plateaus, lengths=None, out=None):
+        """
+        Reduces each plateau to a single point with the plateau reduction of
+        the object. The first settling_samples of each plateau are discarded
+        and the rest are reduced along dimension 1 with batched operations
+        (see the plateau_reduction parameter of the constructor).
+
+        The exponential fit assumes that the plateau settles as
+        y(t) = a + b * r^t, for which consecutive samples follow
+        y(t + 1) = a * (1 - r) + r * y(t). The ratio r and the asymptote a are
+        obtained with a closed form least squares fit of each sample against
+        the previous one. Plateaus where the fit is not a decaying
+        exponential (0 < r < 1) are reduced with the mean instead.
+
+        Example
+        -------
+        >>> manager = WaveformManager({"plateau_length": 4, "slope_length": 2,
+                                       "plateau_reduction": "median"})
+        >>> data = torch.tensor([[[0.], [1.], [1.], [1.]],
+                                 [[3.], [5.], [5.], [9.]]])
+        >>> manager.reduce_plateaus(data)
+        torch.tensor([[1.], [5.]])
+
+        Parameters
+        ----------
+        plateaus : torch.Tensor or np.array
+            Plateaus with shape (plateau_no, plateau_length, electrode_no).
+        lengths : torch.Tensor, optional
+            Number of valid samples of each plateau, with shape (plateau_no,),
+            for plateaus of different lengths. The samples after them are
+            ignored. By default None, which uses all of them.
+        out : torch.Tensor or np.array, optional
+            Preallocated buffer, of the same type as the plateaus, where the
+            output is written. By default None, which allocates a new one.
+
+        Returns
+        -------
+        torch.Tensor or np.array
+            Reduced plateaus, with shape (plateau_no, electrode_no).
+
+        Raises
+        ------
+        AssertionError
+            If there are no samples left in a plateau after discarding the
+            settling samples.
+        """
+        if type(plateaus) is np.ndarray:
+            output = self.reduce_plateaus(torch.from_numpy(plateaus),
+                                          lengths).numpy()
+            if out is None:
+                return output
+            out[...] = output
+            return out
+        shape = plateaus.shape
+        plateaus = plateaus.reshape(shape[0], shape[1], -1)
+        plateaus = plateaus[:, self.settling_samples:]
+        if lengths is None:
+            assert plateaus.shape[1] > 0, (
+                "There are no samples left in the plateaus after discarding "
+                "the settling samples")
+            counts = None
+        else:
+            counts = lengths.to(plateaus.device) - self.settling_samples
+            assert (counts > 0).all(), (
+                "There are no samples left in the plateaus after discarding "
+                "the settling samples")
+        if self.plateau_reduction == "mean":
+            output = _masked_mean(plateaus, counts)
+        elif self.plateau_reduction == "median":
+            output = _median(plateaus, counts)
+        elif self.plateau_reduction == "trimmed_mean":
+            output = _trimmed_mean(plateaus, counts, self.trim_proportion)
+        else:
+            output = _exponential_fit(plateaus, counts)
+        output = output.reshape((shape[0], ) + tuple(shape[2:]))
+        if out is None:
+            return output
+        return out.copy_(output)
+
+    def _plateau_view(self, data):
+        """
+        Gets a strided view of the plateaus of a waveform, without copying
+        them. It is only possible when the waveform has the length of a whole
+        number of points. Waveforms without slopes are left to the mask.
+
+        Parameters
+        ----------
+        data : torch.Tensor or np.array
+            Input data in waveform form.
+
+        Returns
+        -------
+        torch.Tensor or np.array
+            View of the plateaus, with shape
+            (point_no, plateau_length, electrode_no), or None if the length of
+            the waveform does not correspond to a whole number of points.
+        """
+        period = self.slope_length + self.plateau_length
+        if (self.plateau_length <= 0 or self.slope_length <= 0
+                or len(data) < self.slope_length
+                or (len(data) - self.slope_length) % period != 0):
+            return None
+        shape = ((len(data) - self.slope_length) // period,
+                 self.plateau_length) + tuple(data.shape[1:])
+        data = data[self.slope_length:]
+        if type(data) is np.ndarray:
+            strides = (period * data.strides[0], ) + data.strides
+            return np.lib.stride_tricks.as_strided(data,
+                                                   shape=shape,
+                                                   strides=strides)
+        strides = (period * data.stride(0), ) + data.stride()
+        return data.as_strided(shape, strides, data.storage_offset())
+
+    def generate_mask(self,
+                      data_size: int,
+                      plateau_lengths=None,
+                      slope_lengths=None) -> torch.Tensor:
         """
         Use self.mask and self.final_mask to make a mask for input
         of given size:
@@ -480,10 +1579,19 @@ class WaveformManager:
 
         This example has two plateaus of length 2 and 3 slopes of length 1.
 
+        When per-point plateau or slope lengths are given, the mask is built
+        from them, and the data size has to match the length of the waveform
+        that they describe.
+
         Parameters
         ----------
         data_size : int
             The number of points in the data.
+        plateau_lengths : Sequence[int], optional
+            Length of the plateau of each point, with shape (point_no,).
+            By default None.
+        slope_lengths : Sequence[int], optional
+            Length of each slope, with shape (point_no + 1,). By default None.
 
         Returns
         -------
@@ -491,7 +1599,393 @@ class WaveformManager:
             A mask of the required length.
 
         """
+        if plateau_lengths is not None or slope_lengths is not None:
+            if plateau_lengths is not None:
+                point_no = len(plateau_lengths)
+            else:
+                point_no = len(slope_lengths) - 1
+            plateau_lengths, slope_lengths = self.get_lengths(
+                point_no, plateau_lengths, slope_lengths)
+            lengths = slope_lengths.new_empty(2 * point_no + 1)
+            lengths[::2] = slope_lengths
+            lengths[1::2] = plateau_lengths
+            values = torch.arange(len(lengths), device=lengths.device) % 2 == 1
+            mask = torch.repeat_interleave(values, lengths)
+            assert len(mask) == data_size, (
+                f"The lengths describe a waveform of {len(mask)} points, "
+                + f"but the data has {data_size}")
+            return mask
         repetitions = int(((data_size - self.slope_length) /
                            (self.slope_length + self.plateau_length)))
         mask = self.initial_mask.clone().repeat(repetitions)
         return torch.cat((mask, self.final_mask))
+
+
+class CompressedWaveform:
+    """
+    Run-length compressed representation of a waveform. Waveforms are mostly
+    long runs of repeated plateau values joined by linear slopes, so instead
+    of keeping every sample, the waveform is stored as a sequence of segments,
+    each of them described by a value, a length and whether it is a ramp:
+
+    - A run repeats its value during its whole length.
+    - A ramp goes linearly from the value of the previous segment (or zero,
+      for the first segment) to its own value. As in the slopes generated by
+      the WaveformManager, ramps exclude both of their extremes, except for
+      a ramp in the first segment of the waveform, which includes its initial
+      value, and a ramp in the last segment, which includes its final value.
+
+    The memory required is proportional to the number of points, regardless of
+    the plateau and slope lengths. Dense samples are only generated when
+    calling expand, which returns exactly the same values as the methods
+    points_to_waveform or plateaus_to_waveform of the WaveformManager.
+
+    Attributes:
+    ----------
+    values : torch.Tensor
+        Value of each segment, with shape (segment_no, electrode_no).
+    lengths : torch.Tensor
+        Number of samples of each segment.
+    ramps : torch.Tensor
+        Boolean tensor, True for the segments that are ramps and False for the
+        runs.
+    template : tuple or None
+        Key of the template of the WaveformManager from which the waveform was
+        generated, when its slopes have the fixed slope length of the manager,
+        so that they ramp from and to zero at its ends. None otherwise.
+    """
+    def __init__(self,
+                 values: torch.Tensor,
+                 lengths: torch.Tensor,
+                 ramps: torch.Tensor,
+                 template: tuple = None):
+        """
+        Initialises the compressed waveform with the description of its
+        segments.
+
+        Parameters
+        ----------
+        values : torch.Tensor
+            Value of each segment, with shape (segment_no, electrode_no).
+        lengths : torch.Tensor
+            Number of samples of each segment.
+        ramps : torch.Tensor
+            Boolean tensor, True for the segments that are ramps and False for
+            the runs.
+        template : tuple, optional
+            Key of the template from which the waveform was generated. By
+            default None.
+        """
+        assert len(values) == len(lengths) == len(ramps), (
+            "Values, lengths and ramps should have one element per segment")
+        self.values = values
+        self.lengths = lengths
+        self.ramps = ramps
+        self.template = template
+        self.length = int(lengths.sum())
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def shape(self):
+        """
+        Shape of the waveform once it is expanded, (sample_no, electrode_no).
+        """
+        return (self.length, ) + self.values.shape[1:]
+
+    def expand(self, dtype: torch.dtype = None) -> torch.Tensor:
+        """
+        Generates the dense samples of the waveform.
+
+        Parameters
+        ----------
+        dtype : torch.dtype, optional
+            Data type of the output. By default None, which keeps the data type
+            of the values.
+
+        Returns
+        -------
+        torch.Tensor
+            Dense waveform, with shape (sample_no, electrode_no).
+        """
+        device = self.values.device
+        segments = torch.repeat_interleave(
+            torch.arange(len(self.values), device=device), self.lengths)
+        return self._get_samples(segments,
+                                 torch.arange(self.length, device=device),
+                                 dtype)
+
+    def _get_samples(self,
+                     segments: torch.Tensor,
+                     samples: torch.Tensor,
+                     dtype: torch.dtype = None) -> torch.Tensor:
+        """
+        Generates some of the dense samples of the waveform.
+
+        Parameters
+        ----------
+        segments : torch.Tensor
+            Segment to which each of the samples belongs.
+        samples : torch.Tensor
+            Index of each of the samples in the waveform.
+        dtype : torch.dtype, optional
+            Data type of the output. By default None, which keeps the data type
+            of the values.
+
+        Returns
+        -------
+        torch.Tensor
+            Value of each of the samples, with shape (sample_no, electrode_no).
+        """
+        if dtype is None:
+            dtype = self.values.dtype
+        compute_dtype = get_slope_dtype(self.values.dtype)
+        values = self.values.to(compute_dtype)
+        segment_no = len(values)
+        device = values.device
+        output = values[segments].to(dtype)
+
+        ramp_samples = torch.nonzero(self.ramps[segments]).squeeze(1)
+        if len(ramp_samples) > 0:
+            extra_dims = (1, ) * (values.dim() - 1)
+            first = torch.zeros(segment_no, dtype=torch.bool, device=device)
+            first[0] = True
+            last = torch.zeros(segment_no, dtype=torch.bool, device=device)
+            last[-1] = True
+            starts = torch.cat((torch.zeros_like(values[:1]), values[:-1]))
+            delta = values - starts
+            divisions = (self.lengths + 1 - (first | last).long()).to(
+                compute_dtype).view((segment_no, ) + extra_dims)
+            step = delta / divisions
+
+            # Same arithmetic as WaveformManager._slopes, so that the ramps
+            # are bit-identical to the slopes generated there.
+            ramp_segments = segments[ramp_samples]
+            offsets = torch.cumsum(self.lengths, dim=0) - self.lengths
+            steps = (samples[ramp_samples] - offsets[ramp_segments] +
+                     (~first[ramp_segments]).long()).to(compute_dtype).view(
+                         (len(ramp_samples), ) + extra_dims)
+            ramp_values = steps * step[ramp_segments] + starts[ramp_segments]
+            zero_step = (step == 0).flatten(1).any(dim=1)[ramp_segments]
+            if zero_step.any():
+                ramp_values = torch.where(
+                    zero_step.view((len(ramp_samples), ) + extra_dims),
+                    (steps / divisions[ramp_segments]) * delta[ramp_segments]
+                    + starts[ramp_segments], ramp_values)
+            output[ramp_samples] = ramp_values.to(dtype)
+
+        # The last ramp of the waveform ends exactly on its final value.
+        if segment_no > 0 and self.ramps[-1] and self.lengths[-1] > 0:
+            output[samples == self.length - 1] = values[-1].to(dtype)
+        return output
+
+    def to_numpy(self) -> np.ndarray:
+        """
+        Generates the dense samples of the waveform as a numpy array, in the
+        same data type that plateaus_to_waveform uses when returning numpy
+        arrays.
+
+        Returns
+        -------
+        np.array
+            Dense waveform, with shape (sample_no, electrode_no).
+        """
+        return TorchUtils.to_numpy(
+            self.expand(get_slope_dtype(self.values.dtype)))
+
+    def get_key_samples(self) -> torch.Tensor:
+        """
+        Gets the first sample, the value of every segment and the last sample
+        of the waveform. Every other sample lies between these values, so they
+        are enough for checking the voltage limits and the start and end of
+        the waveform without expanding it.
+
+        Returns
+        -------
+        torch.Tensor
+            Key samples, with shape (segment_no + 2, electrode_no).
+        """
+        if self.length == 0:
+            return self.values
+        samples = torch.tensor([0, self.length - 1],
+                               device=self.values.device)
+        segments = torch.bucketize(samples,
+                                   torch.cumsum(self.lengths, dim=0),
+                                   right=True)
+        limits = self._get_samples(segments, samples)
+        return torch.cat((limits[:1], self.values, limits[1:]))
+
+    def get_mask(self):
+        """
+        Gets the compressed mask of the waveform, which is True at the samples
+        of the runs (plateaus) and False at the samples of the ramps (slopes).
+
+        Returns
+        -------
+        CompressedMask
+            Compressed mask of the waveform.
+        """
+        return CompressedMask(self.lengths, ~self.ramps)
+
+
+class CompressedMask:
+    """
+    Run-length compressed representation of a mask, where each run of
+    consecutive samples with the same value is stored as a length and a
+    boolean value. It can be passed as a mask to the methods waveform_to_points
+    and waveform_to_plateaus of the WaveformManager.
+
+    Attributes:
+    ----------
+    lengths : torch.Tensor
+        Number of samples of each run.
+    values : torch.Tensor
+        Boolean value of each run.
+    """
+    def __init__(self, lengths: torch.Tensor, values: torch.Tensor):
+        """
+        Initialises the compressed mask with the description of its runs.
+
+        Parameters
+        ----------
+        lengths : torch.Tensor
+            Number of samples of each run.
+        values : torch.Tensor
+            Boolean value of each run.
+        """
+        assert len(lengths) == len(
+            values), "Lengths and values should have one element per run"
+        self.lengths = lengths
+        self.values = values
+
+    def __len__(self):
+        return int(self.lengths.sum())
+
+    def expand(self) -> torch.Tensor:
+        """
+        Generates the dense mask.
+
+        Returns
+        -------
+        torch.Tensor
+            Dense boolean mask.
+        """
+        return torch.repeat_interleave(self.values, self.lengths)
+
+
+def get_slope_dtype(dtype: torch.dtype) -> torch.dtype:
+    """
+    Gets the data type in which the slopes of a waveform are computed. Floating
+    point data keeps its own precision, while other data types are computed in
+    double precision (as numpy.linspace does) and truncated afterwards.
+
+    Parameters
+    ----------
+    dtype : torch.dtype
+        Data type of the points or plateaus.
+
+    Returns
+    -------
+    torch.dtype
+        Data type used for computing the slopes.
+    """
+    if dtype.is_floating_point:
+        return dtype
+    return torch.float64
+
+
+def _valid_samples(plateaus: torch.Tensor, counts: torch.Tensor,
+                   start=0) -> torch.Tensor:
+    """
+    Mask of the samples of each plateau in the range [start, counts), with a
+    shape that broadcasts against the plateaus.
+    """
+    positions = torch.arange(plateaus.shape[1], device=plateaus.device)
+    positions = positions.view(1, -1, 1)
+    start = torch.as_tensor(start, device=plateaus.device)
+    return (positions >= start.view(-1, 1, 1)) & (positions < counts.view(
+        -1, 1, 1))
+
+
+def _masked_mean(plateaus: torch.Tensor,
+                 counts: torch.Tensor = None,
+                 start=0) -> torch.Tensor:
+    """
+    Mean along dimension 1 of the samples in the range [start, counts).
+    """
+    if counts is None and type(start) is int:
+        return plateaus[:, start:].mean(dim=1)
+    if counts is None:
+        counts = torch.full((plateaus.shape[0], ),
+                            plateaus.shape[1],
+                            device=plateaus.device)
+    valid = _valid_samples(plateaus, counts, start)
+    total = torch.where(valid, plateaus, plateaus.new_zeros(())).sum(dim=1)
+    return total / (counts - start).to(plateaus.dtype).view(-1, 1)
+
+
+def _median(plateaus: torch.Tensor,
+            counts: torch.Tensor = None) -> torch.Tensor:
+    """
+    Median along dimension 1, averaging the two middle samples of plateaus
+    with an even number of them. NaN padding is sorted to the end.
+    """
+    ordered = torch.sort(plateaus, dim=1).values
+    if counts is None:
+        counts = torch.full((plateaus.shape[0], ),
+                            plateaus.shape[1],
+                            device=plateaus.device)
+    index = ((counts - 1) // 2).view(-1, 1, 1).expand(-1, 1,
+                                                       plateaus.shape[2])
+    lower = ordered.gather(1, index)
+    index = (counts // 2).view(-1, 1, 1).expand(-1, 1, plateaus.shape[2])
+    upper = ordered.gather(1, index)
+    return ((lower + upper) / 2).squeeze(1)
+
+
+def _trimmed_mean(plateaus: torch.Tensor, counts: torch.Tensor,
+                  proportion: float) -> torch.Tensor:
+    """
+    Mean along dimension 1 after cutting int(proportion * count) samples from
+    each end of the sorted plateaus.
+    """
+    ordered = torch.sort(plateaus, dim=1).values
+    if counts is None:
+        cut = int(proportion * plateaus.shape[1])
+        return ordered[:, cut:plateaus.shape[1] - cut].mean(dim=1)
+    cut = (proportion * counts).long()
+    return _masked_mean(ordered, counts - cut, cut)
+
+
+def _exponential_fit(plateaus: torch.Tensor,
+                     counts: torch.Tensor = None) -> torch.Tensor:
+    """
+    Asymptote along dimension 1 of an exponential settling curve, fitted by
+    least squares of each sample against the previous one. Falls back to the
+    mean where the fit does not describe a decaying exponential.
+    """
+    mean = _masked_mean(plateaus, counts)
+    if plateaus.shape[1] < 3:
+        return mean
+    previous, current = plateaus[:, :-1], plateaus[:, 1:]
+    if counts is None:
+        pairs = torch.full((plateaus.shape[0], ),
+                           plateaus.shape[1] - 1,
+                           device=plateaus.device)
+    else:
+        pairs = counts - 1
+    valid = _valid_samples(previous, pairs)
+    zero = plateaus.new_zeros(())
+    pair_no = pairs.clamp(min=1).to(plateaus.dtype).view(-1, 1)
+    previous_mean = torch.where(valid, previous, zero).sum(dim=1) / pair_no
+    current_mean = torch.where(valid, current, zero).sum(dim=1) / pair_no
+    previous = previous - previous_mean.unsqueeze(1)
+    current = current - current_mean.unsqueeze(1)
+    variance = torch.where(valid, previous * previous, zero).sum(dim=1)
+    covariance = torch.where(valid, previous * current, zero).sum(dim=1)
+    ratio = covariance / variance
+    asymptote = (current_mean - ratio * previous_mean) / (1 - ratio)
+    fitted = ((variance > 0) & (ratio > 0) & (ratio < 1)
+              & torch.isfinite(asymptote) & (pairs >= 2).view(-1, 1))
+    return torch.where(fitted, asymptote, mean)
@@ -0,0 +1,76 @@
+"""
+Module for testing the acquisition worker of the national instruments setups.
+"""
+import time
+import threading
+import unittest
+from concurrent.futures import CancelledError
+from brainspy.processors.hardware.drivers.ni.worker import AcquisitionWorker
+
+
+class AcquisitionWorkerTest(unittest.TestCase):
+    """
+    Class for testing the AcquisitionWorker in worker.py. It does not require any hardware.
+    """
+    def test_submit(self):
+        """
+        Test that the requests are run in order in a single worker thread, and that their
+        results and exceptions are delivered through futures.
+        """
+        worker = AcquisitionWorker(max_requests=3)
+        threads = []
+
+        def measure(i):
+            threads.append(threading.current_thread())
+            return i * 2
+
+        futures = [worker.submit(measure, i) for i in range(10)]
+        self.assertEqual([f.result() for f in futures], list(range(0, 20, 2)))
+        self.assertEqual(len(set(threads)), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+        future = worker.submit(lambda: 1 / 0)
+        with self.assertRaises(ZeroDivisionError):
+            future.result()
+        # The worker keeps running after an error
+        self.assertEqual(worker.submit(measure, 4).result(), 8)
+        worker.stop()
+        self.assertFalse(worker.is_alive())
+        with self.assertRaises(AssertionError):
+            worker.submit(measure, 1)
+
+    def test_cancel_pending(self):
+        """
+        Test that pending requests are cancelled while the running one finishes.
+        """
+        worker = AcquisitionWorker(max_requests=5)
+        started, release = threading.Event(), threading.Event()
+
+        def blocking():
+            started.set()
+            release.wait()
+            return "done"
+
+        running = worker.submit(blocking)
+        started.wait()
+        pending = [worker.submit(time.sleep, 0) for _ in range(3)]
+        worker.cancel_pending()
+        release.set()
+        worker.wait()
+        self.assertEqual(running.result(), "done")
+        for future in pending:
+            with self.assertRaises(CancelledError):
+                future.result()
+        worker.stop()
+
+    def test_init_fail(self):
+        """
+        Invalid queue sizes raise an AssertionError
+        """
+        with self.assertRaises(AssertionError):
+            AcquisitionWorker(max_requests=0)
+        with self.assertRaises(AssertionError):
+            AcquisitionWorker(max_requests=1.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
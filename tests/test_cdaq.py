@@ -155,6 +155,25 @@ class CDAQ_Processor_Test(unittest.TestCase):
             if model is not None:
                 model.close_tasks()
 
+    @unittest.skipUnless(brainspy.__TEST_MODE__ == "HARDWARE_CDAQ",
+                         "Hardware test is skipped for simulation setup.")
+    def test_forward_numpy_continuous(self):
+        """
+        Test that a continuous acquisition of a chunked waveform returns as many points as
+        were written, in blocks of the requested size.
+        """
+        model = CDAQtoCDAQ(get_configs())
+        try:
+            x = np.zeros((1000, 7))
+            x[1:-1] = 0.1
+            chunks = np.split(x, [300, 600])
+            blocks = list(
+                model.forward_numpy_continuous(iter(chunks), len(x), samples_per_read=128))
+            self.assertEqual(sum(len(b) for b in blocks), len(x))
+            self.assertEqual(blocks[0].shape[1], 1)
+        finally:
+            model.close_tasks()
+
     @unittest.skipUnless(brainspy.__TEST_MODE__ == "HARDWARE_CDAQ",
                          "Hardware test is skipped for simulation setup.")
     def test_forward_numpy_fail(self):
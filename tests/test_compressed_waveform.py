@@ -0,0 +1,147 @@
+"""
+Module for testing the run-length compressed representation of waveforms.
+"""
+import unittest
+import torch
+import warnings
+from brainspy.utils.waveform import WaveformManager, CompressedMask
+from brainspy.utils.pytorch import TorchUtils
+
+
+class CompressedWaveformTest(unittest.TestCase):
+    """
+    Class for testing the class CompressedWaveform, and the methods
+    points_to_compressed_waveform() and plateaus_to_compressed_waveform() in
+    waveform.py.
+    """
+    def test_points_to_compressed_waveform(self):
+        """
+        Test that the expanded waveform is identical to the one generated by
+        points_to_waveform, and that it only keeps one value per slope and
+        plateau.
+        """
+        for plateau_length, slope_length in [(80, 20), (7, 5), (1, 1), (3, 0),
+                                             (0, 4)]:
+            configs = {}
+            configs["plateau_length"] = plateau_length
+            configs["slope_length"] = slope_length
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                waveform_mgr = WaveformManager(configs)
+            for dtype in (torch.float32, torch.float64):
+                points = torch.rand(
+                    (15, 3), device=TorchUtils.get_device(),
+                    dtype=dtype) - 0.5
+                points[5:8] = points[4]
+                waveform = waveform_mgr.points_to_compressed_waveform(points)
+                expected = waveform_mgr.points_to_waveform(points)
+                self.assertEqual(len(waveform), len(expected))
+                self.assertEqual(waveform.shape, expected.shape)
+                self.assertTrue(torch.equal(waveform.expand(), expected))
+                self.assertLessEqual(len(waveform.values), 2 * len(points) + 1)
+                self.assertTrue(
+                    torch.equal(waveform.get_mask().expand().cpu(),
+                                waveform_mgr.generate_mask(len(expected))))
+
+    def test_plateaus_to_compressed_waveform(self):
+        """
+        Test that the expanded waveform and mask are identical to the ones
+        generated by plateaus_to_waveform, also when plateaus are not constant.
+        """
+        configs = {}
+        configs["plateau_length"] = 6
+        configs["slope_length"] = 4
+        waveform_mgr = WaveformManager(configs)
+        points = torch.rand((10, 2), device=TorchUtils.get_device())
+        plateaus = waveform_mgr.points_to_plateaus(points)
+        plateaus[20:23] = 0.5
+        waveform = waveform_mgr.plateaus_to_compressed_waveform(plateaus)
+        expected, mask = waveform_mgr.plateaus_to_waveform(plateaus)
+        self.assertTrue(torch.equal(waveform.expand(), expected))
+        self.assertTrue(torch.equal(waveform.get_mask().expand(), mask))
+        numpy_expected, _ = waveform_mgr.plateaus_to_waveform(
+            plateaus, return_pytorch=False)
+        self.assertTrue((waveform.to_numpy() == numpy_expected).all())
+
+    def test_compressed_mask(self):
+        """
+        Test that a compressed mask can be used to recover the points from a
+        waveform.
+        """
+        configs = {}
+        configs["plateau_length"] = 5
+        configs["slope_length"] = 3
+        waveform_mgr = WaveformManager(configs)
+        points = torch.rand((8, 2), device=TorchUtils.get_device())
+        waveform = waveform_mgr.points_to_compressed_waveform(points)
+        mask = waveform.get_mask()
+        self.assertIsInstance(mask, CompressedMask)
+        self.assertEqual(len(mask), len(waveform))
+        result = waveform_mgr.waveform_to_points(waveform.expand(), mask)
+        self.assertTrue(torch.allclose(result, points))
+
+    def test_get_key_samples(self):
+        """
+        Test that the key samples contain the limits of the waveform, and that
+        the waveform starts and ends at zero.
+        """
+        configs = {}
+        configs["plateau_length"] = 5
+        configs["slope_length"] = 3
+        waveform_mgr = WaveformManager(configs)
+        points = torch.rand((8, 2), device=TorchUtils.get_device()) - 0.5
+        waveform = waveform_mgr.points_to_compressed_waveform(points)
+        samples = waveform.get_key_samples()
+        expected = waveform.expand()
+        self.assertTrue(torch.equal(samples[0], expected[0]))
+        self.assertTrue(torch.equal(samples[-1], expected[-1]))
+        self.assertTrue(torch.equal(samples.max(dim=0)[0],
+                                    expected.max(dim=0)[0]))
+        self.assertTrue(torch.equal(samples.min(dim=0)[0],
+                                    expected.min(dim=0)[0]))
+
+    def test_template(self):
+        """
+        Test that waveforms generated with the fixed lengths of the manager
+        share the key of their template, and that the waveforms that may not
+        start and end at zero do not have one.
+        """
+        configs = {}
+        configs["plateau_length"] = 5
+        configs["slope_length"] = 3
+        waveform_mgr = WaveformManager(configs)
+        points = torch.rand((8, 2), device=TorchUtils.get_device()) - 0.5
+        waveform = waveform_mgr.points_to_compressed_waveform(points)
+        self.assertEqual(waveform.template, (8, 3, 5))
+        plateaus = waveform_mgr.points_to_plateaus(points)
+        self.assertEqual(
+            waveform_mgr.plateaus_to_compressed_waveform(plateaus).template,
+            waveform.template)
+        waveform = waveform_mgr.points_to_compressed_waveform(
+            points, slope_lengths=[3] * 9)
+        self.assertIsNone(waveform.template)
+        configs["slope_length"] = 0
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            waveform_mgr = WaveformManager(configs)
+        waveform = waveform_mgr.points_to_compressed_waveform(points)
+        self.assertIsNone(waveform.template)
+
+    def test_compressed_waveform_invalid_type(self):
+        """
+        Invalid data types raise an AssertionError
+        """
+        configs = {}
+        configs["plateau_length"] = 5
+        configs["slope_length"] = 3
+        waveform_mgr = WaveformManager(configs)
+        with self.assertRaises(AssertionError):
+            waveform_mgr.points_to_compressed_waveform([1, 2, 3, 4])
+        with self.assertRaises(AssertionError):
+            waveform_mgr.plateaus_to_compressed_waveform("invalid type")
+        with self.assertRaises(AssertionError):
+            waveform_mgr.plateaus_to_compressed_waveform(torch.rand((7, 2)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -118,6 +118,20 @@ class WaveformTest(unittest.TestCase):
                              device=TorchUtils.get_device(),
                              dtype=torch.bool).float()), "Generate mask error")
 
+    def test_generate_mask_variable_lengths(self):
+        """
+        Test to generate a mask with a different plateau and slope length per point
+        """
+        waveform_mgr = WaveformManager({"plateau_length": 2, "slope_length": 1})
+        mask = waveform_mgr.generate_mask(12, [1, 3, 2], [2, 0, 1, 3])
+        expected = [False, False, True, True, True, True,
+                    False, True, True, False, False, False]
+        self.assertTrue(torch.equal(mask.cpu(), torch.tensor(expected)))
+        mask = waveform_mgr.generate_mask(7, slope_lengths=[1, 1, 1])
+        self.assertTrue(torch.equal(mask.cpu(), waveform_mgr.generate_mask(7)))
+        with self.assertRaises(AssertionError):
+            waveform_mgr.generate_mask(10, [1, 3, 2], [2, 0, 1, 3])
+
 
 if __name__ == "__main__":
     unittest.main()
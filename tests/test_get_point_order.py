@@ -0,0 +1,94 @@
+"""
+Module for testing the ordering of points to reduce the voltage jumps of the waveform.
+"""
+import unittest
+import torch
+from brainspy.utils.waveform import WaveformManager, REORDER_CHUNK_SIZE
+from brainspy.utils.pytorch import TorchUtils
+
+
+class PointOrderTest(unittest.TestCase):
+    """
+    Class for testing the methods - get_point_order(), get_transition_deltas() and
+    get_ramp_length() in waveform.py.
+    """
+    def test_get_point_order(self):
+        """
+        Test that the order is a permutation that follows the nearest neighbours, and that it
+        does not increase the length of the slopes.
+        """
+        configs = {}
+        configs["plateau_length"] = 1
+        configs["slope_length"] = 10
+        waveform_mgr = WaveformManager(configs)
+        data = torch.tensor([[0.9], [0.1], [0.5], [-0.2]],
+                            device=TorchUtils.get_device())
+        order = waveform_mgr.get_point_order(data)
+        self.assertEqual(order.tolist(), [1, 3, 2, 0])
+        data = torch.rand((100, 7), device=TorchUtils.get_device()) - 0.5
+        order = waveform_mgr.get_point_order(data)
+        self.assertEqual(sorted(order.tolist()), list(range(100)))
+        self.assertTrue(
+            waveform_mgr.get_ramp_length(data[order], 1.0) <=
+            waveform_mgr.get_ramp_length(data, 1.0))
+
+    def test_get_point_order_chunks(self):
+        """
+        Test that batches larger than the reordering chunks are reordered chunk by chunk, so
+        that the order is still a permutation that keeps the points of each chunk together.
+        """
+        waveform_mgr = WaveformManager({"plateau_length": 1, "slope_length": 10})
+        point_no = REORDER_CHUNK_SIZE + 100
+        data = torch.rand((point_no, 7), device=TorchUtils.get_device()) - 0.5
+        order = waveform_mgr.get_point_order(data)
+        self.assertEqual(sorted(order.tolist()), list(range(point_no)))
+        self.assertEqual(sorted(order[:REORDER_CHUNK_SIZE].tolist()),
+                         list(range(REORDER_CHUNK_SIZE)))
+        self.assertEqual(order[:REORDER_CHUNK_SIZE].tolist(),
+                         waveform_mgr.get_point_order(data[:REORDER_CHUNK_SIZE]).tolist())
+
+    def test_get_ramp_length(self):
+        """
+        Test that the slopes are shortened in proportion to their voltage jumps, including the
+        slopes from and to zero.
+        """
+        configs = {}
+        configs["plateau_length"] = 1
+        configs["slope_length"] = 10
+        waveform_mgr = WaveformManager(configs)
+        data = torch.tensor([[0.5, 0.25], [0.25, -0.5]])
+        deltas = waveform_mgr.get_transition_deltas(data)
+        self.assertTrue(torch.equal(deltas, torch.tensor([0.5, 0.75, 0.5])))
+        self.assertEqual(waveform_mgr.get_ramp_length(data, 1.0), 5 + 8 + 5)
+        self.assertEqual(waveform_mgr.get_ramp_length(data, 0.1), 30)
+
+    def test_get_slope_lengths(self):
+        """
+        Test that the slope lengths follow the jumps between the last value of each plateau and
+        the first value of the next one, and that the waveform starts and ends at zero.
+        """
+        configs = {}
+        configs["plateau_length"] = 2
+        configs["slope_length"] = 10
+        waveform_mgr = WaveformManager(configs)
+        data = torch.tensor([[0.5], [0.5], [0.5], [0.]])
+        slope_lengths = waveform_mgr.get_slope_lengths(data[::2], 1.0, tails=data[1::2])
+        self.assertEqual(slope_lengths.tolist(), [5, 0, 0])
+        points = torch.tensor([[0.5, 0.25], [0.25, -0.5], [0.25, -0.5]])
+        slope_lengths = waveform_mgr.get_slope_lengths(points, 2.0)
+        self.assertEqual(slope_lengths.tolist(), [3, 4, 0, 3])
+        self.assertEqual(
+            waveform_mgr.get_slope_lengths(points, 0.).tolist(), [10, 10, 0, 10])
+        with self.assertRaises(AssertionError):
+            waveform_mgr.get_slope_lengths(points, -1.)
+        waveform = waveform_mgr.points_to_waveform(points, slope_lengths=slope_lengths)
+        self.assertEqual(len(waveform), 10 + 6)
+        self.assertEqual(waveform[0].tolist(), [0., 0.])
+        self.assertEqual(waveform[-1].tolist(), [0., 0.])
+        mask = waveform_mgr.generate_mask(len(waveform), slope_lengths=slope_lengths)
+        self.assertTrue(
+            torch.equal(waveform_mgr.plateaus_to_points(waveform[mask]), points))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+"""
+Module for testing the measurement cache of the HardwareProcessor.
+"""
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import torch
+from brainspy.processors.hardware.cache import MeasurementCache, get_context
+from brainspy.processors.hardware.processor import HardwareProcessor
+from brainspy.processors.hardware.tuning import set_waveform_configs
+from brainspy.utils.waveform import WaveformManager
+from tests.test_simulated_backend import get_simulated_configs
+
+
+class MeasurementCacheTest(unittest.TestCase):
+    """
+    Class for testing the MeasurementCache in cache.py. The measurements of the HardwareProcessor
+    are run on the simulated backend, so they do not require any hardware.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "cache.npz")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_keys(self):
+        """
+        Test that the keys only depend on the quantised input, the context and the arguments.
+        """
+        cache = MeasurementCache({"quantisation": 1e-3}, get_context({"amplification": [1]}))
+        x = torch.rand((10, 7))
+        key = cache.get_key(x, "points")
+        self.assertEqual(key, cache.get_key(x + 1e-5, "points"))
+        self.assertNotEqual(key, cache.get_key(x + 1e-2, "points"))
+        self.assertNotEqual(key, cache.get_key(x, "plateaus"))
+        self.assertNotEqual(key, cache.get_key(x.reshape(7, 10), "points"))
+        other = MeasurementCache({"quantisation": 1e-3}, get_context({"amplification": [2]}))
+        self.assertNotEqual(key, other.get_key(x, "points"))
+
+    def test_eviction(self):
+        """
+        Test that the least recently used outputs are evicted when the cache exceeds its number
+        of entries or its memory budget, and that outputs expire after their maximum age.
+        """
+        cache = MeasurementCache({"max_entries": 2, "max_memory": 8 * 100})
+        cache.put("a", np.zeros(10))
+        cache.put("b", np.zeros(10))
+        self.assertIsNotNone(cache.get("a"))
+        cache.put("c", np.zeros(10))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(len(cache), 2)
+        cache.put("d", np.zeros(95))
+        self.assertEqual(list(cache.entries), ["d"])
+        cache.put("e", np.zeros(101))
+        self.assertIsNone(cache.get("e"))
+        self.assertEqual(cache.stats["evictions"], 3)
+
+        cache = MeasurementCache({"max_age": 0.05})
+        output = np.ones(5)
+        cache.put("a", output)
+        output[0] = 0
+        self.assertTrue(np.array_equal(cache.get("a"), np.ones(5)))
+        self.assertFalse(cache.get("a").flags.writeable)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats["expirations"], 1)
+
+    def test_persistence(self):
+        """
+        Test that the outputs persisted to disk are loaded by a new cache.
+        """
+        cache = MeasurementCache({"path": self.path})
+        cache.put("a", np.arange(4.0))
+        cache.put("b", np.ones((2, 3)))
+        cache.save()
+        cache = MeasurementCache({"path": self.path})
+        self.assertEqual(list(cache.entries), ["a", "b"])
+        self.assertTrue(np.array_equal(cache.get("b"), np.ones((2, 3))))
+
+    def test_hardware_processor(self):
+        """
+        Test that repeated batches are returned from the cache of the HardwareProcessor without
+        being measured again, for both forward passes.
+        """
+        processor = HardwareProcessor(get_simulated_configs("cdaq_to_cdaq", noise=0.1),
+                                      slope_length=1,
+                                      plateau_length=5,
+                                      waveform_configs={"measurement_cache": {}})
+        session = processor.driver.tasks_driver.session
+        x = torch.rand((10, 7)) - 0.5
+        for forward in [processor.forward, processor.forward_points]:
+            acquisitions = session.acquisitions
+            output = forward(x)
+            self.assertTrue(torch.equal(forward(x.clone()), output))
+            self.assertEqual(session.acquisitions, acquisitions + 1)
+            self.assertFalse(torch.equal(forward(x + 0.1), forward(x)))
+            self.assertEqual(session.acquisitions, acquisitions + 2)
+        self.assertEqual(processor.measurement_cache.stats["misses"], 4)
+        self.assertEqual(processor.measurement_cache.stats["hits"], 4)
+        processor.close()
+
+    def test_retuned_processor(self):
+        """
+        Test that batches are measured again after the offset of the driver is widened, or the
+        waveform of the processor is tuned.
+        """
+        configs = {"waveform": {"plateau_length": 5, "slope_length": 1, "measurement_cache": {}}}
+        processor = HardwareProcessor(get_simulated_configs("cdaq_to_nidaq"),
+                                      slope_length=1,
+                                      plateau_length=5,
+                                      waveform_configs=configs["waveform"])
+        session = processor.driver.tasks_driver.session
+        x = torch.rand((10, 7)) - 0.5
+        output = processor.forward_points(x)
+        acquisitions = session.acquisitions
+        self.assertTrue(processor.driver.widen_offset())
+        self.assertTrue(torch.allclose(processor.forward_points(x), output))
+        self.assertEqual(session.acquisitions, acquisitions + 1)
+        processor.waveform_mgr = WaveformManager({"plateau_length": 10, "slope_length": 1})
+        processor.forward_points(x)
+        self.assertEqual(session.acquisitions, acquisitions + 2)
+        set_waveform_configs(configs, {"plateau_length": 8, "slope_length": 1}, processor)
+        processor.forward_points(x)
+        self.assertEqual(session.acquisitions, acquisitions + 3)
+        self.assertEqual(processor.measurement_cache.stats["misses"], 4)
+        self.assertEqual(processor.measurement_cache.stats["hits"], 0)
+        processor.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
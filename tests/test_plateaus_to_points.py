@@ -229,6 +229,50 @@ class WaveformTest(unittest.TestCase):
         with self.assertRaises(RuntimeError):
             waveform_mgr.plateaus_to_points(TorchUtils.format(plateau))
 
+    def test_plateaus_to_points_variable_lengths(self):
+        """
+        Test to generate points from plateaus of different lengths, for torch
+        tensors and numpy arrays.
+        """
+        configs = {}
+        configs["plateau_length"] = 4
+        configs["slope_length"] = 2
+        waveform_mgr = WaveformManager(configs)
+        plateau_lengths = [3, 1, 6, 2]
+        points = torch.rand((4, 3),
+                            device=TorchUtils.get_device(),
+                            dtype=torch.float64)
+        plateaus = torch.repeat_interleave(
+            points, torch.tensor(plateau_lengths, device=points.device), dim=0)
+        plateaus = plateaus + 0.01 * torch.randn_like(plateaus)
+        expected = torch.stack(
+            [chunk.mean(dim=0) for chunk in plateaus.split(plateau_lengths)])
+        result = waveform_mgr.plateaus_to_points(
+            plateaus, plateau_lengths=plateau_lengths)
+        self.assertTrue(torch.allclose(result, expected))
+        out = torch.empty_like(points)
+        waveform_mgr.plateaus_to_points(plateaus,
+                                        out=out,
+                                        plateau_lengths=plateau_lengths)
+        self.assertTrue(torch.allclose(out, expected))
+        result = waveform_mgr.plateaus_to_points(
+            TorchUtils.to_numpy(plateaus), plateau_lengths=plateau_lengths)
+        self.assertTrue(np.allclose(result, TorchUtils.to_numpy(expected)))
+        with self.assertRaises(AssertionError):
+            waveform_mgr.plateaus_to_points(plateaus,
+                                            plateau_lengths=[3, 1, 6, 1])
+        # Reductions other than the mean pad the plateaus with NaN
+        waveform_mgr = WaveformManager({
+            "plateau_length": 4,
+            "slope_length": 2,
+            "plateau_reduction": "median"
+        })
+        integers = torch.tensor([[1], [3], [4], [6], [7], [8]])
+        result = waveform_mgr.plateaus_to_points(integers, plateau_lengths=[2, 1, 3])
+        self.assertEqual(result.tolist(), [[2.], [4.], [7.]])
+        result = waveform_mgr.plateaus_to_points(integers.numpy(), plateau_lengths=[2, 1, 3])
+        self.assertEqual(result.tolist(), [[2.], [4.], [7.]])
+
 
 if __name__ == "__main__":
     unittest.main()
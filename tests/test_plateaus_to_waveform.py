@@ -24,6 +24,7 @@ class WaveformTest(unittest.TestCase):
                             device=TorchUtils.get_device(),
                             dtype=torch.get_default_dtype())
         output_data, output_mask = manager.plateaus_to_waveform(data, False)
+        self.assertEqual(type(output_mask), list)
         self.assertTrue(
             np.equal(
                 output_data,
@@ -329,6 +330,50 @@ class WaveformTest(unittest.TestCase):
         with self.assertRaises(ValueError):
             waveform_mgr.plateaus_to_waveform(plateau)
 
+    def test_plateaus_to_waveform_no_plateaus(self):
+        """
+        Test that input data without any plateau raises an AssertionError
+        """
+        manager = WaveformManager({"plateau_length": 4, "slope_length": 3})
+        with self.assertRaises(AssertionError):
+            manager.plateaus_to_waveform(
+                torch.empty((0, 2), device=TorchUtils.get_device()))
+
+    def test_plateaus_to_waveform_zero_plateau_length(self):
+        """
+        Test that a plateau length of zero raises an AssertionError instead of
+        a ZeroDivisionError
+        """
+        manager = WaveformManager({"plateau_length": 0, "slope_length": 3})
+        with self.assertRaises(AssertionError):
+            manager.plateaus_to_waveform(
+                torch.ones((4, 2), device=TorchUtils.get_device()))
+
+    def test_plateaus_to_waveform_template_cache(self):
+        """
+        Test that the mask and slope weights are cached per number of plateaus,
+        and that cached templates produce the same waveform.
+        """
+        configs = {"plateau_length": 4, "slope_length": 3}
+        manager = WaveformManager(configs)
+        points = torch.rand((6, 2),
+                            device=TorchUtils.get_device(),
+                            dtype=torch.get_default_dtype())
+        plateaus = manager.points_to_plateaus(points)
+        waveform, mask = manager.plateaus_to_waveform(plateaus)
+        self.assertEqual(len(manager._templates), 1)
+        cached_waveform, cached_mask = manager.plateaus_to_waveform(plateaus)
+        self.assertEqual(len(manager._templates), 1)
+        self.assertTrue(torch.equal(waveform, cached_waveform))
+        self.assertTrue(torch.equal(mask, cached_mask))
+        self.assertTrue(
+            torch.equal(waveform, manager.points_to_waveform(points)))
+        self.assertTrue(
+            torch.equal(mask, manager.generate_mask(len(waveform)).to(
+                mask.device)))
+        manager.plateaus_to_waveform(plateaus[:8])
+        self.assertEqual(len(manager._templates), 2)
+
     def test_plateaus_to_wavefrom_random(self):
         """
         Test to generate a waveform from a plateau with random slope and plateau numbers
@@ -345,6 +390,45 @@ class WaveformTest(unittest.TestCase):
         except Exception:
             self.fail("Exception raised")
 
+    def test_plateaus_to_waveform_variable_lengths(self):
+        """
+        Test to generate a waveform from plateaus of different lengths, which is
+        the same as the one generated from their points, with the right mask.
+        """
+        configs = {}
+        configs["plateau_length"] = 4
+        configs["slope_length"] = 3
+        waveform_mgr = WaveformManager(configs)
+        plateau_lengths = torch.tensor([2, 7, 1, 4])
+        slope_lengths = torch.tensor([3, 1, 5, 0, 2])
+        points = torch.rand((4, 2), device=TorchUtils.get_device())
+        plateaus = torch.repeat_interleave(points,
+                                           plateau_lengths.to(points.device),
+                                           dim=0)
+        waveform, mask = waveform_mgr.plateaus_to_waveform(
+            plateaus,
+            plateau_lengths=plateau_lengths,
+            slope_lengths=slope_lengths)
+        expected = waveform_mgr.points_to_waveform(points, plateau_lengths,
+                                                   slope_lengths)
+        self.assertTrue(torch.equal(waveform, expected))
+        self.assertTrue(torch.equal(waveform[mask], plateaus))
+        self.assertTrue(
+            torch.equal(
+                mask,
+                waveform_mgr.generate_mask(len(waveform), plateau_lengths,
+                                           slope_lengths).to(mask.device)))
+        numpy_waveform, numpy_mask = waveform_mgr.plateaus_to_waveform(
+            plateaus,
+            return_pytorch=False,
+            plateau_lengths=plateau_lengths,
+            slope_lengths=slope_lengths)
+        self.assertTrue((numpy_waveform == TorchUtils.to_numpy(waveform)).all())
+        self.assertTrue((numpy_mask == TorchUtils.to_numpy(mask)).all())
+        with self.assertRaises(AssertionError):
+            waveform_mgr.plateaus_to_waveform(plateaus,
+                                              plateau_lengths=[2, 7, 1, 3])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -224,6 +224,34 @@ class WaveformTest(unittest.TestCase):
         with self.assertRaises(ValueError):
             waveform_mgr.points_to_waveform(points.to(TorchUtils.get_device()))
 
+    def test_points_to_waveform_linspace_reference(self):
+        """
+        Test that the vectorised waveform is bit-identical to the one
+        built point by point with numpy.linspace.
+        """
+        configs = {}
+        configs["plateau_length"] = 7
+        configs["slope_length"] = 5
+        waveform_mgr = WaveformManager(configs)
+        for dtype in (torch.float32, torch.float64):
+            points = torch.rand((50, 3), dtype=dtype) - 0.5
+            points[10:13] = points[9]  # Slopes with a zero step
+            tmp = points.numpy()
+            expected = [np.linspace(0, tmp[0], num=5, endpoint=False)]
+            for i in range(len(tmp) - 1):
+                expected.append(np.repeat(tmp[i:i + 1], 7, axis=0))
+                expected.append(
+                    np.linspace(tmp[i], tmp[i + 1], num=6,
+                                endpoint=False)[1:])
+            expected.append(np.repeat(tmp[-1:], 7, axis=0))
+            expected.append(np.linspace(tmp[-1], 0, num=6)[1:])
+            expected = torch.tensor(np.concatenate(expected), dtype=dtype)
+            waveform = waveform_mgr.points_to_waveform(
+                points.to(TorchUtils.get_device()))
+            self.assertEqual(waveform.device.type,
+                             TorchUtils.get_device().type)
+            self.assertTrue(torch.equal(waveform.cpu(), expected))
+
     def test_points_to_waveform_random(self):
         """
         Test to generate a waveform with random slope and plateau numbers
@@ -239,6 +267,48 @@ class WaveformTest(unittest.TestCase):
         except Exception:
             self.fail("Exception raised")
 
+    def test_points_to_waveform_variable_lengths(self):
+        """
+        Test to generate a waveform with a different plateau and slope length
+        per point, which is bit-identical to the one built point by point with
+        numpy.linspace.
+        """
+        configs = {}
+        configs["plateau_length"] = 4
+        configs["slope_length"] = 3
+        waveform_mgr = WaveformManager(configs)
+        plateau_lengths = [2, 9, 0, 4, 1]
+        slope_lengths = [3, 1, 6, 0, 2, 5]
+        points = torch.rand((5, 2), dtype=torch.float64) - 0.5
+        tmp = points.numpy()
+        expected = [np.linspace(0, tmp[0], num=3, endpoint=False)]
+        for i in range(len(tmp)):
+            expected.append(
+                np.repeat(tmp[i:i + 1], plateau_lengths[i], axis=0))
+            if i < len(tmp) - 1:
+                expected.append(
+                    np.linspace(tmp[i],
+                                tmp[i + 1],
+                                num=slope_lengths[i + 1] + 1,
+                                endpoint=False)[1:])
+        expected.append(np.linspace(tmp[-1], 0, num=6)[1:])
+        expected = torch.tensor(np.concatenate(expected))
+        waveform = waveform_mgr.points_to_waveform(
+            points.to(TorchUtils.get_device()), plateau_lengths,
+            slope_lengths)
+        self.assertTrue(torch.equal(waveform.cpu(), expected))
+        # Only the plateau lengths can also be given on their own
+        waveform = waveform_mgr.points_to_waveform(
+            points.to(TorchUtils.get_device()), plateau_lengths=[4] * 5)
+        self.assertTrue(
+            torch.equal(waveform,
+                        waveform_mgr.points_to_waveform(
+                            points.to(TorchUtils.get_device()))))
+        with self.assertRaises(AssertionError):
+            waveform_mgr.points_to_waveform(points, [1, 2, 3])
+        with self.assertRaises(AssertionError):
+            waveform_mgr.points_to_waveform(points, [1, 2, 3, -1, 1])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,8 +1,12 @@
+import copy
 import unittest
+import warnings
+import threading
 import torch
 import brainspy
 from brainspy.utils.pytorch import TorchUtils
 from brainspy.processors.processor import Processor
+from brainspy.processors.hardware.processor import HardwareProcessor
 from tests.test_utils import get_configs, get_custom_model_configs
 
 
@@ -149,6 +153,223 @@ class Processor_Test_CDAQ(unittest.TestCase):
                 model.close()
             self.fail("Could not initialize processor")
 
+    def test_forward_points_simulation_debug(self):
+        """
+        Test that averaging the plateaus directly from the output of the driver gives the same
+        result as converting the points to plateaus and averaging the output plateaus.
+        """
+        processor_configs, model_data = get_custom_model_configs()
+        processor_configs["processor_type"] = 'simulation_debug'
+        model = Processor(processor_configs, model_data['info'])
+        model = TorchUtils.format(model)
+        x = TorchUtils.format(torch.rand((5, 7)) - 0.5)
+        result = model(x)
+        expected = model.waveform_mgr.plateaus_to_points(
+            model.processor(model.waveform_mgr.points_to_plateaus(x)))
+        self.assertEqual(result.shape, (5, 1))
+        self.assertTrue(torch.allclose(result, expected, atol=1e-6))
+        self.assertTrue(torch.allclose(model(x), result))
+
+    def test_forward_reordered_simulation_debug(self):
+        """
+        Test that measuring the points in a reordered way gives the outputs in the original
+        order, for averaged and non-averaged plateaus, and reports the saved waveform length.
+        """
+        processor_configs, model_data = get_custom_model_configs()
+        processor_configs["processor_type"] = 'simulation_debug'
+        processor_configs["waveform"]["adaptive_slopes"] = True
+        x = TorchUtils.format(torch.rand((20, 7)) - 0.5)
+        for average_plateaus in [True, False]:
+            model = TorchUtils.format(
+                Processor(processor_configs,
+                          model_data['info'],
+                          average_plateaus=average_plateaus))
+            expected = model(x)
+            self.assertEqual(model.saved_waveform_length, 0)
+            model.reorder_points = True
+            result = model(x)
+            self.assertEqual(result.shape, expected.shape)
+            self.assertTrue(torch.allclose(result, expected, atol=1e-6))
+            self.assertTrue(model.saved_waveform_length > 0)
+            model.waveform_mgr.adaptive_slopes = False
+            model(x)
+            self.assertEqual(model.saved_waveform_length, 0)
+
+    def test_forward_pipelined_simulation_debug(self):
+        """
+        Test that the pipelined forward pass gives the outputs of the forward pass of each
+        batch, in the same order.
+        """
+        processor_configs, model_data = get_custom_model_configs()
+        processor_configs["processor_type"] = 'simulation_debug'
+        batches = [TorchUtils.format(torch.rand((i + 2, 7)) - 0.5) for i in range(5)]
+        for average_plateaus in [True, False]:
+            model = TorchUtils.format(
+                Processor(processor_configs,
+                          model_data['info'],
+                          average_plateaus=average_plateaus))
+            results = list(model.forward_pipelined(iter(batches)))
+            self.assertEqual(len(results), len(batches))
+            for x, result in zip(batches, results):
+                self.assertTrue(torch.allclose(result, model(x), atol=1e-6))
+
+    def test_forward_pipelined_acquisition_path(self):
+        """
+        Test that the pipelined forward pass splits the batches at the acquisition limits,
+        measures failed acquisitions again, and returns repeated batches from the measurement
+        cache, as the forward pass does.
+        """
+        processor_configs, model_data = get_custom_model_configs()
+        processor_configs["processor_type"] = 'simulation_debug'
+        processor_configs["waveform"]["max_acquisition_points"] = 4
+        processor_configs["waveform"]["acquisition_retries"] = 1
+        processor_configs["waveform"]["measurement_cache"] = {}
+        model = TorchUtils.format(Processor(processor_configs, model_data['info']))
+        batches = [TorchUtils.format(torch.rand((10, 7)) - 0.5) for i in range(2)]
+        forward_numpy, lengths, failures = model.processor.forward_numpy, [], [True]
+
+        def failing_forward_numpy(waveform, driver=None):
+            lengths.append(len(waveform))
+            if len(lengths) == 2 and failures:
+                failures.pop()
+                raise RuntimeError("Simulated acquisition failure")
+            return forward_numpy(waveform, driver)
+
+        model.processor.forward_numpy = failing_forward_numpy
+        with warnings.catch_warnings(record=True) as caught_warnings:
+            warnings.simplefilter("always")
+            results = list(model.forward_pipelined(iter(batches)))
+            self.assertEqual(len(caught_warnings), 1)
+        self.assertEqual(lengths, [4 * 40 + 30] * 3 + [2 * 40 + 30] +
+                         [4 * 40 + 30] * 2 + [2 * 40 + 30])
+        lengths.clear()
+        for x, result in zip(batches, results):
+            self.assertTrue(torch.allclose(result, model(x), atol=1e-6))
+        self.assertEqual(list(model.forward_pipelined(iter(batches)))[1].tolist(),
+                         results[1].tolist())
+        self.assertEqual(lengths, [])
+
+    def test_forward_adaptive_slopes_simulation_debug(self):
+        """
+        Test that adapting the slope lengths to the voltage jumps gives the same points and
+        plateaus as fixed slopes, with a shorter waveform.
+        """
+        processor_configs, model_data = get_custom_model_configs()
+        processor_configs["processor_type"] = 'simulation_debug'
+        model = TorchUtils.format(Processor(processor_configs, model_data['info']))
+        x = TorchUtils.format(torch.rand((20, 7)) - 0.5)
+        plateaus = model.waveform_mgr.points_to_plateaus(x)
+        expected_points, expected_plateaus = model(x), model.processor(plateaus)
+        model.processor.waveform_mgr.adaptive_slopes = True
+        slope_lengths = model.processor.get_slope_lengths(x)
+        self.assertTrue(int(slope_lengths.sum()) < 21 * 30)
+        self.assertTrue(torch.equal(slope_lengths,
+                                    model.processor.get_slope_lengths(plateaus, plateaus=True)))
+        self.assertTrue(torch.allclose(model(x), expected_points, atol=1e-6))
+        self.assertTrue(torch.allclose(model.processor(plateaus), expected_plateaus, atol=1e-6))
+
+    def test_forward_acquisition_limits_simulation_debug(self):
+        """
+        Test that batches over the maximum number of points per acquisition are measured in
+        several acquisitions, that a failed acquisition is measured again on its own, and that
+        the outputs are the same as with a single acquisition.
+        """
+        processor_configs, model_data = get_custom_model_configs()
+        processor_configs["processor_type"] = 'simulation_debug'
+        model = TorchUtils.format(Processor(processor_configs, model_data['info']))
+        x = TorchUtils.format(torch.rand((10, 7)) - 0.5)
+        plateaus = model.waveform_mgr.points_to_plateaus(x)
+        expected_points, expected_plateaus = model(x), model.processor(plateaus)
+        processor_configs["waveform"]["max_acquisition_points"] = 4
+        processor_configs["waveform"]["acquisition_retries"] = 1
+        model = TorchUtils.format(Processor(processor_configs, model_data['info']))
+        forward_numpy, lengths, failures = model.processor.forward_numpy, [], [True]
+
+        def failing_forward_numpy(waveform, driver=None):
+            lengths.append(len(waveform))
+            if len(lengths) == 2 and failures:
+                failures.pop()
+                raise RuntimeError("Simulated acquisition failure")
+            return forward_numpy(waveform, driver)
+
+        model.processor.forward_numpy = failing_forward_numpy
+        with warnings.catch_warnings(record=True) as caught_warnings:
+            warnings.simplefilter("always")
+            self.assertTrue(torch.allclose(model(x), expected_points, atol=1e-6))
+            self.assertEqual(len(caught_warnings), 1)
+        self.assertEqual(lengths, [4 * 40 + 30] * 3 + [2 * 40 + 30])
+        lengths.clear()
+        self.assertTrue(torch.allclose(model.processor(plateaus), expected_plateaus, atol=1e-6))
+        self.assertEqual(len(lengths), 4)
+        model.processor.acquisition_retries = 0
+        lengths.clear()
+        failures.append(True)
+        with self.assertRaises(RuntimeError):
+            model(x)
+
+    def test_forward_racks_simulation_debug(self):
+        """
+        Test that batches are sharded across several racks, which are measured concurrently,
+        and that the outputs are merged in the order of the batch.
+        """
+        processor_configs, model_data = get_custom_model_configs()
+        processor_configs["processor_type"] = 'simulation_debug'
+        model = TorchUtils.format(Processor(processor_configs, model_data['info']))
+        racks = [model.processor.driver, copy.deepcopy(model.processor.driver)]
+        measured = []
+
+        def record(rack, index):
+            forward_numpy = rack.forward_numpy
+
+            def recorded_forward_numpy(y):
+                measured.append((index, threading.current_thread()))
+                return forward_numpy(y)
+
+            rack.forward_numpy = recorded_forward_numpy
+
+        for index, rack in enumerate(racks):
+            record(rack, index)
+        processor = TorchUtils.format(
+            HardwareProcessor(racks, 30, 10, waveform_configs={"max_acquisition_points": 2}))
+        x = TorchUtils.format(torch.rand((11, 7)) - 0.5)
+        plateaus = model.waveform_mgr.points_to_plateaus(x)
+        expected_points = model.processor.forward_points(x)
+        expected_plateaus = model.processor(plateaus)
+        measured.clear()
+        self.assertTrue(torch.allclose(processor.forward_points(x), expected_points, atol=1e-6))
+        self.assertEqual(sorted(index for index, _ in measured), [0, 0, 0, 1, 1, 1])
+        self.assertNotIn(threading.current_thread(), [thread for _, thread in measured])
+        self.assertTrue(torch.allclose(processor(plateaus), expected_plateaus, atol=1e-6))
+        processor.close()
+
+    def test_nodes_to_devices(self):
+        """
+        Test that DNPU nodes mapped onto several devices are measured in parallel, always on the
+        same device, and that their outputs are mapped back in the time-multiplexed order.
+        """
+        processor_configs, model_data = get_custom_model_configs()
+        processor_configs["processor_type"] = 'simulation_debug'
+        model = TorchUtils.format(Processor(processor_configs, model_data['info']))
+        self.assertEqual(model.get_device_no(), 1)
+        hardware_processor = model.processor
+        hardware_processor.get_device_no = lambda: 2
+        hardware_processor.get_activation_channel_no = lambda: 14
+        x = TorchUtils.format(torch.rand((3, 5, 7)))
+        mapped = hardware_processor.nodes_to_devices(x)
+        self.assertEqual(mapped.shape, (9, 14))
+        self.assertTrue(torch.equal(mapped[1, :7], x[0, 2]))
+        self.assertTrue(torch.equal(mapped[2, 7:], torch.zeros_like(x[0, 0])))
+        # Each device returns the sum of its activation electrodes
+        output = mapped.reshape(9, 2, 7).sum(dim=-1)
+        expected = x.sum(dim=-1).reshape(15, 1)
+        self.assertTrue(torch.allclose(hardware_processor.devices_to_nodes(output, 5), expected))
+        self.assertTrue(
+            torch.allclose(
+                hardware_processor.devices_to_nodes(output.repeat_interleave(4, dim=0), 5, 4),
+                expected.repeat_interleave(4, dim=0)))
+        with self.assertRaises(AssertionError):
+            hardware_processor.nodes_to_devices(x[..., :6])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,107 @@
+"""
+Module for testing the reduction of plateaus to points.
+"""
+import unittest
+import torch
+import numpy as np
+from brainspy.utils.waveform import WaveformManager
+from brainspy.utils.pytorch import TorchUtils
+
+
+class ReducePlateausTest(unittest.TestCase):
+    """
+    Class for testing the method - reduce_plateaus() in waveform.py, and the
+    plateau reductions used by plateaus_to_points() and waveform_to_points().
+    """
+    def get_manager(self, **kwargs):
+        configs = {}
+        configs["plateau_length"] = 8
+        configs["slope_length"] = 3
+        configs.update(kwargs)
+        return WaveformManager(configs)
+
+    def test_reduce_plateaus_references(self):
+        """
+        Test that each reducer gives the same result as its numpy reference,
+        after discarding the settling samples.
+        """
+        plateaus = torch.rand((6, 8, 3), dtype=torch.float64)
+        tmp = plateaus.numpy()[:, 2:]
+        sorted_tmp = np.sort(tmp, axis=1)
+        references = {
+            "mean": tmp.mean(axis=1),
+            "median": np.median(tmp, axis=1),
+            "trimmed_mean": sorted_tmp[:, 1:-1].mean(axis=1)
+        }
+        for reduction, expected in references.items():
+            waveform_mgr = self.get_manager(plateau_reduction=reduction,
+                                            settling_samples=2,
+                                            trim_proportion=0.2)
+            result = waveform_mgr.reduce_plateaus(
+                plateaus.to(TorchUtils.get_device()))
+            self.assertTrue(np.allclose(TorchUtils.to_numpy(result),
+                                        expected))
+            result = waveform_mgr.reduce_plateaus(plateaus.numpy())
+            self.assertTrue(np.allclose(result, expected))
+
+    def test_reduce_plateaus_exponential_fit(self):
+        """
+        Test that the exponential fit recovers the asymptote of a plateau
+        that is still settling, and falls back to the mean for flat ones.
+        """
+        waveform_mgr = self.get_manager(plateau_reduction="exponential_fit")
+        t = torch.arange(8, dtype=torch.float64).view(1, -1, 1)
+        plateaus = torch.cat((0.7 - 0.5 * 0.6**t, torch.full_like(t, 0.2)))
+        result = waveform_mgr.reduce_plateaus(plateaus)
+        self.assertTrue(
+            torch.allclose(result, torch.tensor([[0.7], [0.2]],
+                                                dtype=torch.float64)))
+
+    def test_reduce_plateaus_points(self):
+        """
+        Test that plateaus_to_points and waveform_to_points use the
+        configured reduction, for fixed and per-point plateau lengths.
+        """
+        waveform_mgr = self.get_manager(plateau_reduction="median",
+                                        settling_samples=1)
+        points = torch.rand((5, 2),
+                            device=TorchUtils.get_device(),
+                            dtype=torch.float64)
+        waveform = waveform_mgr.points_to_waveform(points)
+        # A settling glitch at the start of every plateau is ignored
+        waveform[3::11] += 1
+        self.assertTrue(
+            torch.allclose(waveform_mgr.waveform_to_points(waveform), points))
+        result = waveform_mgr.waveform_to_points(TorchUtils.to_numpy(waveform))
+        self.assertTrue(np.allclose(result, TorchUtils.to_numpy(points)))
+        plateaus = waveform_mgr.waveform_to_plateaus(waveform)
+        self.assertTrue(
+            torch.allclose(waveform_mgr.plateaus_to_points(plateaus), points))
+        plateau_lengths = [2, 5, 3, 9, 4]
+        waveform = waveform_mgr.points_to_waveform(points, plateau_lengths)
+        waveform[waveform_mgr.generate_mask(len(waveform),
+                                            plateau_lengths)] += torch.cat([
+                                                torch.arange(length) == 0
+                                                for length in plateau_lengths
+                                            ]).view(-1, 1).to(waveform)
+        result = waveform_mgr.waveform_to_points(
+            waveform, plateau_lengths=plateau_lengths)
+        self.assertTrue(torch.allclose(result, points))
+
+    def test_reduce_plateaus_fail(self):
+        """
+        Invalid reductions and settling samples raise an AssertionError
+        """
+        with self.assertRaises(AssertionError):
+            self.get_manager(plateau_reduction="mode")
+        with self.assertRaises(AssertionError):
+            self.get_manager(settling_samples=-1)
+        with self.assertRaises(AssertionError):
+            self.get_manager(trim_proportion=0.5)
+        waveform_mgr = self.get_manager(settling_samples=8)
+        with self.assertRaises(AssertionError):
+            waveform_mgr.reduce_plateaus(torch.rand((2, 8, 1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Module for testing the request scheduler of the national instruments setups.
+"""
+import threading
+import unittest
+import numpy as np
+from brainspy.processors.hardware.drivers.ni.scheduler import (RequestScheduler,
+                                                               get_compatibility_key)
+
+
+class ScaleDriver:
+    """
+    Driver that returns twice the sum of the input channels, and records the length of each
+    measured waveform. Negative inputs raise a ValueError. It does not require any hardware.
+    """
+    def __init__(self):
+        self.lengths = []
+        self.closed = False
+        self.configs = {"offset": 0}
+
+    def forward_numpy(self, y):
+        self.lengths.append(len(y))
+        if (y < 0).any():
+            raise ValueError("Negative input")
+        return 2 * y.sum(axis=1, keepdims=True)
+
+    def close_tasks(self):
+        self.closed = True
+
+
+class RequestSchedulerTest(unittest.TestCase):
+    """
+    Class for testing the RequestScheduler in scheduler.py.
+    """
+    def test_coalesce(self):
+        """
+        Test that the requests of several threads are measured together, and that each of them
+        receives its own output.
+        """
+        driver = ScaleDriver()
+        scheduler = RequestScheduler(driver, max_wait_time=0.5)
+        waveforms = [np.random.rand(10 + i, 3) for i in range(4)]
+        outputs = [None] * len(waveforms)
+
+        def measure(i):
+            outputs[i] = scheduler.forward_numpy(waveforms[i])
+
+        threads = [threading.Thread(target=measure, args=(i, )) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for y, output in zip(waveforms, outputs):
+            self.assertTrue(np.allclose(output, 2 * y.sum(axis=1, keepdims=True)))
+        self.assertEqual(driver.lengths, [46])
+        self.assertEqual(scheduler.measurements, 1)
+        # Attributes that the scheduler does not define are taken from the driver
+        self.assertEqual(scheduler.configs["offset"], 0)
+        scheduler.close_tasks()
+        self.assertTrue(driver.closed)
+        with self.assertRaises(AssertionError):
+            scheduler.forward_numpy(waveforms[0])
+
+    def test_max_batch_samples(self):
+        """
+        Test that requests that would exceed the maximum batch samples are measured separately,
+        and that errors are delivered to all the requests of a measurement.
+        """
+        driver = ScaleDriver()
+        scheduler = RequestScheduler(driver, max_wait_time=0.2, max_batch_samples=25)
+        futures = [scheduler.submit(np.ones((10, 2))) for _ in range(5)]
+        for future in futures:
+            self.assertTrue(np.allclose(future.result(), 4))
+        self.assertEqual(driver.lengths, [20, 20, 10])
+        failing = [scheduler.submit(-np.ones((10, 2))) for _ in range(2)]
+        for future in failing:
+            with self.assertRaises(ValueError):
+                future.result()
+        scheduler.stop()
+
+    def test_compatibility_key(self):
+        """
+        Test that configurations are only compatible when the channels, voltage ranges,
+        sampling rates, amplification and offset are the same.
+        """
+        configs = {
+            "instrument_type": "cdaq_to_cdaq",
+            "amplification": [100],
+            "instruments_setup": {
+                "activation_channels": [0, 1],
+                "activation_voltage_ranges": [[-1.2, 0.6], [-1.2, 0.6]],
+                "activation_sampling_frequency": 1000,
+                "readout_channels": [4],
+                "readout_sampling_frequency": 2000
+            }
+        }
+        key = get_compatibility_key(configs)
+        configs["request_scheduler"] = {"max_wait_time": 1}
+        self.assertEqual(get_compatibility_key(configs), key)
+        configs["amplification"] = [10]
+        self.assertNotEqual(get_compatibility_key(configs), key)
+        configs["amplification"] = [100]
+        configs["instruments_setup"]["activation_voltage_ranges"][1] = [-0.7, 0.3]
+        self.assertNotEqual(get_compatibility_key(configs), key)
+        configs["instruments_setup"]["activation_voltage_ranges"][1] = [-1.2, 0.6]
+        self.assertEqual(get_compatibility_key(configs), key)
+        configs["offset"] = 5
+        self.assertNotEqual(get_compatibility_key(configs), key)
+
+    def test_init_fail(self):
+        """
+        Invalid wait times and batch samples raise an AssertionError
+        """
+        with self.assertRaises(AssertionError):
+            RequestScheduler(ScaleDriver(), max_wait_time=-1)
+        with self.assertRaises(AssertionError):
+            RequestScheduler(ScaleDriver(), max_batch_samples=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
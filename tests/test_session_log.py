@@ -0,0 +1,84 @@
+"""
+Module for testing the recording and replay of the sessions of the national instruments setups.
+"""
+import os
+import copy
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import torch
+from brainspy.processors.hardware.processor import HardwareProcessor
+from brainspy.processors.hardware.drivers.ni.session_log import (SessionLog, SessionReplay,
+                                                                 WRITE_RECORD, READ_RECORD)
+from tests.test_simulated_backend import get_simulated_configs
+
+
+class SessionLogTest(unittest.TestCase):
+    """
+    Class for testing the SessionRecorder and SessionReplay in session_log.py. The sessions are
+    recorded on the simulated backend, so they do not require any hardware.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "session.bin")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record(self, configs, inputs):
+        configs = copy.deepcopy(configs)
+        configs["session_log"] = {"path": self.path, "mode": "record"}
+        processor = HardwareProcessor(configs, slope_length=1, plateau_length=5)
+        outputs = [processor(x) for x in inputs]
+        processor.close()
+        return outputs
+
+    def replay(self, configs, inputs):
+        configs = copy.deepcopy(configs)
+        configs["session_log"] = {"path": self.path, "mode": "replay"}
+        processor = HardwareProcessor(configs, slope_length=1, plateau_length=5)
+        outputs = [processor(x) for x in inputs]
+        processor.close()
+        return outputs
+
+    def test_record_replay(self):
+        """
+        Test that replaying a session through the forward pass of the HardwareProcessor gives
+        the same outputs as the recorded session, for both types of setups.
+        """
+        for instrument_type in ["cdaq_to_cdaq", "cdaq_to_nidaq"]:
+            configs = get_simulated_configs(instrument_type, noise=0.1)
+            inputs = [torch.rand((20, 7)) - 0.5, torch.rand((35, 7)) - 0.5]
+            recorded = self.record(configs, inputs)
+            log = SessionLog(self.path)
+            self.assertEqual(len(log.get_indices(WRITE_RECORD)), 2)
+            self.assertEqual(len(log.get_indices(READ_RECORD)), 2)
+            self.assertEqual(log.configs["instrument_type"], instrument_type)
+            log.close()
+            # The noise is not simulated again, as the recorded reads are replayed
+            replayed = self.replay(configs, inputs)
+            for x, y in zip(recorded, replayed):
+                self.assertTrue(torch.equal(x, y))
+
+    def test_replay_mismatch(self):
+        """
+        Test that writes that differ from the recorded ones raise an AssertionError, unless the
+        check is disabled, and that reading past the end of the log raises an AssertionError.
+        """
+        configs = get_simulated_configs("cdaq_to_cdaq")
+        self.record(configs, [torch.rand((10, 7)) - 0.5])
+        replay = SessionReplay(self.path)
+        with self.assertRaises(AssertionError):
+            replay.write(np.zeros((7, 10)), True)
+        replay = SessionReplay(self.path, check_writes=False)
+        replay.write(np.zeros((7, 10)), True)
+        data = replay.read_numpy(replay.log.get_data(1).shape[1])
+        self.assertFalse(data.flags.writeable)
+        with self.assertRaises(AssertionError):
+            replay.read_numpy(data.shape[1])
+        replay.close_tasks()
+
+
+if __name__ == "__main__":
+    unittest.main()
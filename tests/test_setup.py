@@ -4,7 +4,8 @@ import nidaqmx
 import random
 import brainspy
 from brainspy.processors.hardware.drivers.ni.tasks import IOTasksManager
-from brainspy.processors.hardware.drivers.ni.setup import NationalInstrumentsSetup
+from brainspy.processors.hardware.drivers.ni.setup import (NationalInstrumentsSetup,
+                                                         check_input_voltages)
 from tests.test_utils import get_configs
 
 
@@ -873,6 +874,54 @@ class Setup_Test(unittest.TestCase):
             if setup is not None:
                 setup.close_tasks()
 
+    @unittest.skipUnless(brainspy.__TEST_MODE__ == "HARDWARE_CDAQ"
+                         or brainspy.__TEST_MODE__ == "HARDWARE_NIDAQ",
+                         "Hardware test is skipped for simulation setup.")
+    def test_process_output_data_in_place(self):
+        """
+        Test that float64 arrays are amplified in place, with the same result as lists, and
+        that read-only arrays are copied
+        """
+        configs = get_configs()
+        setup = NationalInstrumentsSetup(configs)
+        try:
+            data = np.random.rand(1, 50)
+            expected = setup.process_output_data(data.tolist())
+            val = setup.process_output_data(data)
+            self.assertIs(val, data)
+            self.assertTrue(np.allclose(val, expected))
+            data = np.random.rand(1, 50)
+            data.setflags(write=False)
+            original = data.copy()
+            val = setup.process_output_data(data)
+            self.assertIsNot(val, data)
+            self.assertTrue(np.array_equal(data, original))
+        finally:
+            setup.close_tasks()
+
+    def test_check_input_voltages(self):
+        """
+        Test the vectorised security checks of the input data, which do not require any
+        hardware.
+        """
+        y = np.random.uniform(-1, 1, (7, 1000))
+        y[:, 0] = 0
+        y[:, -1] = 0
+        check_input_voltages(y)
+        for value in [1.6, -1.6, np.nan]:
+            unsafe = y.copy()
+            unsafe[3, 500] = value
+            with self.assertRaises(AssertionError) as context:
+                check_input_voltages(unsafe)
+            self.assertIn("electrode 3", str(context.exception))
+        y[2, -1] = 0.1
+        with self.assertRaises(AssertionError):
+            check_input_voltages(y)
+        check_input_voltages(y, check_end=False)
+        y[5, 0] = 0.1
+        with self.assertRaises(AssertionError):
+            check_input_voltages(y, check_end=False)
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
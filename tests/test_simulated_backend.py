@@ -0,0 +1,393 @@
+"""
+Module for testing the simulated backend of the national instruments setups.
+"""
+import sys
+import time
+import signal
+import unittest
+import numpy as np
+import torch
+import nidaqmx
+from brainspy.processors.hardware.drivers.cdaq import CDAQtoCDAQ
+from brainspy.processors.hardware.drivers.nidaq import (CDAQtoNiDAQ, CUT_AT_ZERO,
+                                                       SPIKE_NOT_FOUND)
+from brainspy.utils.waveform import WaveformManager
+from brainspy.processors.hardware.processor import HardwareProcessor
+from brainspy.processors.hardware.drivers.ni.setup import interrupt_setups
+from brainspy.processors.hardware.drivers.ni.simulated import (
+    SimulatedIOTasksManager, GENERATION_UNDERFLOW_ERROR, MEMORY_FULL_ERROR)
+
+
+def get_simulated_configs(instrument_type, **simulated_backend):
+    """
+    Generate the configs of a setup with seven activation electrodes and one readout electrode,
+    running on the simulated backend.
+    """
+    simulated_backend.setdefault("time_scale", 0)
+    return {
+        "instrument_type": instrument_type,
+        "inverted_output": True,
+        "amplification": [100],
+        "simulated_backend": simulated_backend,
+        "instruments_setup": {
+            "multiple_devices": False,
+            "trigger_source": "cDAQ1/segment1",
+            "average_io_point_difference": True,
+            "activation_instrument": "cDAQ1Mod3",
+            "activation_channels": [0, 1, 2, 3, 4, 5, 6],
+            "activation_channel_mask": [1, 1, 1, 1, 1, 1, 1],
+            "activation_voltage_ranges": [[-1.2, 0.6]] * 7,
+            "activation_sampling_frequency": 1000,
+            "readout_instrument": "cDAQ1Mod4",
+            "readout_channels": [0],
+            "readout_sampling_frequency": 2000
+        }
+    }
+
+
+def get_waveform(point_no=60):
+    """
+    Random waveform that starts and ends at zero, with a shape of (point_no, 7).
+    """
+    y = np.zeros((point_no, 7))
+    y[1:-1] = np.random.uniform(-0.5, 0.5, (point_no - 2, 7))
+    return y
+
+
+class SimulatedBackendTest(unittest.TestCase):
+    """
+    Class for testing the SimulatedIOTasksManager in simulated.py. It does not require any
+    hardware.
+    """
+    def test_cdaq_forward(self):
+        """
+        Test that the output of a CDAQ to CDAQ setup is the output of the default surrogate
+        model (the mean of the activations), once the trigger delay is removed.
+        """
+        driver = CDAQtoCDAQ(get_simulated_configs("cdaq_to_cdaq"))
+        y = get_waveform()
+        output = driver.forward_numpy(y)
+        self.assertEqual(output.shape, (60, 1))
+        self.assertTrue(np.allclose(output, y.mean(axis=1, keepdims=True)))
+        session = driver.tasks_driver.session
+        self.assertEqual(session.acquisitions, 1)
+        self.assertEqual(session.samples_read, 121)
+        driver.close_tasks()
+
+    def test_outputs_not_overwritten(self):
+        """
+        Test that the outputs of a measurement are not overwritten by the next one, as the
+        driver copies them out of the reused read buffer of the tasks driver.
+        """
+        driver = CDAQtoCDAQ(get_simulated_configs("cdaq_to_cdaq"))
+        y = get_waveform()
+        raw = driver.read_data(y.T)
+        output = driver.forward_numpy(y)
+        expected, raw_expected = output.copy(), raw.copy()
+        driver.forward_numpy(get_waveform())
+        self.assertTrue(np.array_equal(output, expected))
+        self.assertTrue(np.array_equal(raw, raw_expected))
+        driver.close_tasks()
+
+    def test_nidaq_forward(self):
+        """
+        Test that the synchronisation spike compensates the latency between the activation and
+        readout tasks of a CDAQ to NIDAQ setup.
+        """
+        driver = CDAQtoNiDAQ(
+            get_simulated_configs("cdaq_to_nidaq",
+                                  start_latency=0.005,
+                                  surrogate=lambda x: 2 * x[:, :1]))
+        y = get_waveform()
+        output = driver.forward_numpy(y)
+        self.assertEqual(output.shape, (60, 1))
+        self.assertTrue(np.allclose(output, 2 * y[:, :1]))
+        driver.close_tasks()
+
+    def test_nidaq_sub_sample_latency(self):
+        """
+        Test that the output of a CDAQ to NIDAQ setup is aligned with the input when the latency
+        is not a multiple of the readout samples per activation point, and that noise on the
+        synchronisation channel does not move the cut value.
+        """
+        driver = CDAQtoNiDAQ(
+            get_simulated_configs("cdaq_to_nidaq", start_latency=0.0055))
+        y = get_waveform()
+        self.assertTrue(np.allclose(driver.forward_numpy(y), y.mean(axis=1, keepdims=True)))
+        read_data = np.random.normal(0, 0.01, (2, 200))
+        read_data[-1, 59:61] = 1
+        read_data[-1, 190] = 2  # Outside of the window where the spike can appear
+        self.assertEqual(driver.get_output_cut_value(read_data, 2), 59)
+        driver.close_tasks()
+
+    def test_nidaq_write_buffer(self):
+        """
+        Test that the input data is synchronised into a reused write buffer.
+        """
+        driver = CDAQtoNiDAQ(get_simulated_configs("cdaq_to_nidaq"))
+        offset = driver.configs["offset"]
+        y = np.random.rand(7, 30)
+        y_corr = driver.synchronise_input_data(y)
+        self.assertEqual(y_corr.shape, (8, 30 + offset))
+        self.assertTrue(np.array_equal(y_corr[:-1, offset:], y))
+        self.assertFalse(y_corr[:-1, :offset].any())
+        self.assertEqual(y_corr[-1].sum(), 1)
+        self.assertEqual(y_corr[-1, offset], 1)
+        smaller = driver.synchronise_input_data(y[:, :20])
+        self.assertTrue(np.shares_memory(y_corr, smaller))
+        self.assertEqual(smaller[-1].sum(), 1)
+        driver.close_tasks()
+
+    def test_nidaq_retry_widen(self):
+        """
+        Test that a readout that starts as late as the offset is classified as cut at zero, and
+        that widening the offset synchronises it, keeping the wider offset afterwards.
+        """
+        driver = CDAQtoNiDAQ(
+            get_simulated_configs("cdaq_to_nidaq", start_latency=0.04))
+        offset = driver.configs["offset"]
+        y = get_waveform()
+        with self.assertWarns(UserWarning):
+            output = driver.forward_numpy(y)
+        self.assertTrue(np.allclose(output, y.mean(axis=1, keepdims=True)))
+        self.assertEqual(driver.configs["offset"], 2 * offset)
+        self.assertEqual(driver.retry_counters[CUT_AT_ZERO], 1)
+        self.assertEqual(driver.retry_counters["remeasurements"], 1)
+        self.assertTrue(np.allclose(driver.forward_numpy(y), y.mean(axis=1, keepdims=True)))
+        self.assertEqual(driver.retry_counters["measurements"], 2)
+        self.assertEqual(driver.retry_counters["remeasurements"], 1)
+        driver.close_tasks()
+
+    def test_nidaq_retry_policy(self):
+        """
+        Test that the actions of the retry policy can be configured per failure class, and that
+        the measurement fails once the attempts are exhausted.
+        """
+        configs = get_simulated_configs("cdaq_to_nidaq", start_latency=0.05)
+        configs["retry_policy"] = {"max_attempts": 3, "actions": {SPIKE_NOT_FOUND: "widen"}}
+        driver = CDAQtoNiDAQ(configs)
+        y = get_waveform()
+        with self.assertWarns(UserWarning):
+            output = driver.forward_numpy(y)
+        self.assertTrue(np.allclose(output, y.mean(axis=1, keepdims=True)))
+        self.assertEqual(driver.retry_counters[SPIKE_NOT_FOUND], 1)
+        driver.close_tasks()
+
+        configs["retry_policy"] = {"actions": {SPIKE_NOT_FOUND: "raise"}}
+        driver = CDAQtoNiDAQ(configs)
+        with self.assertRaises(AssertionError):
+            with self.assertWarns(UserWarning):
+                driver.forward_numpy(y)
+        self.assertEqual(driver.retry_counters["remeasurements"], 0)
+        driver.close_tasks()
+
+        configs["retry_policy"] = {"actions": {SPIKE_NOT_FOUND: "reboot"}}
+        with self.assertRaises(AssertionError):
+            CDAQtoNiDAQ(configs)
+
+    def test_template_security_checks(self):
+        """
+        Test that the start and end of the waveforms generated from a template are only checked
+        once per template, while their voltages are checked for every waveform.
+        """
+        configs = get_simulated_configs("cdaq_to_cdaq")
+        configs["security_checks"] = "template"
+        driver = CDAQtoCDAQ(configs)
+        waveform_mgr = WaveformManager({"plateau_length": 4, "slope_length": 2})
+        points = torch.rand((10, 7), dtype=torch.float64) - 0.5
+        waveform = waveform_mgr.points_to_compressed_waveform(points)
+        driver.forward_numpy(waveform)
+        self.assertEqual(driver.checked_templates, {waveform.template})
+        points[3, 2] = 2
+        with self.assertRaises(AssertionError):
+            driver.read_security_checks(waveform_mgr.points_to_compressed_waveform(points))
+        driver.close_tasks()
+
+    def test_padding(self):
+        """
+        Test that the timing of the tasks is reused for shorter waveforms, up to the maximum
+        number of padded points, and that the output of the padding is discarded.
+        """
+        for instrument_type in ["cdaq_to_cdaq", "cdaq_to_nidaq"]:
+            configs = get_simulated_configs(instrument_type)
+            configs["max_padded_points"] = 300
+            driver = CDAQtoCDAQ(configs) if instrument_type == "cdaq_to_cdaq" else CDAQtoNiDAQ(
+                configs)
+            for point_no in [100, 60, 100, 60, 30]:
+                y = get_waveform(point_no)
+                output = driver.forward_numpy(y)
+                self.assertEqual(output.shape, (point_no, 1))
+                self.assertTrue(np.allclose(output, y.mean(axis=1, keepdims=True)))
+            self.assertEqual(driver.reconfigurations, 1)
+            self.assertEqual(driver.padding, 70)
+            driver.forward_numpy(get_waveform(400))
+            driver.forward_numpy(get_waveform(200))
+            self.assertEqual(driver.reconfigurations, 3)
+            driver.close_tasks()
+
+    def test_continuous(self):
+        """
+        Test that a waveform streamed in chunks through the ring buffers gives the same output
+        as measuring it at once.
+        """
+        driver = CDAQtoCDAQ(get_simulated_configs("cdaq_to_cdaq"))
+        y = get_waveform(200)
+        blocks = list(
+            driver.forward_numpy_continuous(np.split(y, [50, 120]), 200,
+                                            samples_per_read=40))
+        self.assertTrue(
+            np.allclose(np.concatenate(blocks), y.mean(axis=1, keepdims=True)))
+        driver.close_tasks()
+
+    def test_measure_during_stream(self):
+        """
+        Test that measuring while a streamed measurement holds the setup fails instead of
+        blocking, and that the setup can be measured again once the generator is closed. The
+        CDAQ to NIDAQ setups do not expose streaming.
+        """
+        driver = CDAQtoCDAQ(get_simulated_configs("cdaq_to_cdaq"))
+        y = get_waveform(200)
+        outputs = driver.forward_numpy_chunks(iter(np.split(y, [50, 120])), 200)
+        next(outputs)
+        with self.assertRaises(AssertionError):
+            driver.forward_numpy(get_waveform())
+        with self.assertRaises(AssertionError):
+            next(driver.forward_numpy_chunks(iter([y]), 200))
+        outputs.close()
+        self.assertEqual(driver.forward_numpy(get_waveform()).shape, (60, 1))
+        driver.close_tasks()
+
+        driver = CDAQtoNiDAQ(get_simulated_configs("cdaq_to_nidaq"))
+        self.assertFalse(hasattr(driver, "forward_numpy_chunks"))
+        self.assertFalse(hasattr(driver, "forward_numpy_continuous"))
+        driver.close_tasks()
+
+    def test_racks_overlap(self):
+        """
+        Test that the racks of a processor measure their shards at the same time, as each
+        setup has its own semaphore, and that each rack splits its shard at its own acquisition
+        limits.
+        """
+        processor = HardwareProcessor(
+            [get_simulated_configs("cdaq_to_cdaq", time_scale=0.5) for _ in range(2)],
+            slope_length=1,
+            plateau_length=5)
+        intervals = []
+
+        def record(driver):
+            read_data = driver._read_data
+
+            def recorded_read_data(y):
+                start = time.monotonic()
+                output = read_data(y)
+                intervals.append((start, time.monotonic()))
+                return output
+
+            driver._read_data = recorded_read_data
+
+        for driver in processor.drivers:
+            record(driver)
+        processor.forward_points(torch.rand((200, 7)) - 0.5)
+        self.assertEqual(len(intervals), 2)
+        self.assertLess(max(start for start, _ in intervals), min(end for _, end in intervals))
+        processor.close()
+
+        configs = [get_simulated_configs("cdaq_to_cdaq") for _ in range(2)]
+        # 25 points of 6 samples, the offset and the final slope
+        configs[1]["max_acquisition_samples"] = 152
+        processor = HardwareProcessor(configs, slope_length=1, plateau_length=5)
+        self.assertEqual(processor.get_points_per_acquisition(processor.drivers[1]), 25)
+        self.assertIsNone(processor.get_points_per_acquisition(processor.drivers[0]))
+        processor.forward_points(torch.rand((200, 7)) - 0.5)
+        self.assertEqual(
+            [driver.tasks_driver.session.acquisitions for driver in processor.drivers], [1, 4])
+        processor.close()
+
+    def test_acquisition_retries(self):
+        """
+        Test that an acquisition whose read times out is measured again once its tasks have
+        been stopped, and that the other acquisitions of the batch are not measured again.
+        """
+        processor = HardwareProcessor(
+            get_simulated_configs("cdaq_to_cdaq", time_scale=0.01),
+            slope_length=1,
+            plateau_length=5,
+            waveform_configs={"max_acquisition_points": 10, "acquisition_retries": 1})
+        tasks_driver = processor.driver.tasks_driver
+        read_numpy, reads = tasks_driver.read_numpy, []
+
+        def timed_out_read_numpy(number_of_samples_per_channel, timeout=None):
+            reads.append(number_of_samples_per_channel)
+            if len(reads) == 3:
+                # The samples of the last acquisition have not been acquired yet
+                timeout = 0
+            return read_numpy(number_of_samples_per_channel, timeout)
+
+        tasks_driver.read_numpy = timed_out_read_numpy
+        x = torch.rand((25, 7)) - 0.5
+        with self.assertWarns(UserWarning):
+            output = processor.forward_points(x)
+        self.assertTrue(torch.allclose(output, x.mean(dim=1, keepdim=True).to(output), atol=1e-6))
+        # Two acquisitions of 10 points, and the last one of 5 points measured twice
+        self.assertEqual(reads[0], reads[1])
+        self.assertEqual(reads[2], reads[3])
+        self.assertLess(reads[2], reads[0])
+        self.assertEqual(len(reads), 4)
+        self.assertEqual(tasks_driver.session.acquisitions, 4)
+        processor.close()
+
+    def test_signals(self):
+        """
+        Test that an interruption signal interrupts the acquisitions of every rack and closes
+        the tasks of all of them, not only those of the last created setup.
+        """
+        processor = HardwareProcessor(
+            [get_simulated_configs("cdaq_to_cdaq") for _ in range(2)],
+            slope_length=1,
+            plateau_length=5)
+        processor.forward_points(torch.rand((20, 7)) - 0.5)
+        if sys.platform != "win32":
+            self.assertIs(signal.getsignal(signal.SIGINT), interrupt_setups)
+        with self.assertRaises(SystemExit):
+            processor.drivers[0].os_signal_handler(signal.SIGINT)
+        for driver in processor.drivers:
+            self.assertTrue(driver.event.is_set())
+            self.assertFalse(driver.worker.is_alive())
+
+    def test_time_scale(self):
+        """
+        Test that the readout waits for the samples to be acquired in scaled time.
+        """
+        driver = CDAQtoCDAQ(get_simulated_configs("cdaq_to_cdaq", time_scale=0.5))
+        start = time.monotonic()
+        driver.forward_numpy(get_waveform(200))
+        # 200 points at 1000 Hz take 0.2 simulated seconds
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+        driver.close_tasks()
+
+    def test_buffer_limits(self):
+        """
+        Test that writes that do not fit in the buffer, and generations that run out of
+        samples, raise the errors of nidaqmx.
+        """
+        configs = get_simulated_configs("cdaq_to_cdaq", buffer_size=50)
+        manager = SimulatedIOTasksManager(configs)
+        manager.set_sampling_frequencies(1000, 2000, 100, 200)
+        with self.assertRaises(nidaqmx.errors.DaqError) as context:
+            manager.write_numpy(np.zeros((7, 100)), False)
+        self.assertEqual(context.exception.error_code, MEMORY_FULL_ERROR)
+        manager.close_tasks()
+
+        configs = get_simulated_configs("cdaq_to_cdaq", time_scale=1)
+        manager = SimulatedIOTasksManager(configs)
+        manager.set_continuous_sampling(1000, 2000, 100, 200)
+        manager.write(np.zeros((7, 10)), False)
+        time.sleep(0.05)
+        with self.assertRaises(nidaqmx.errors.DaqError) as context:
+            manager.read_numpy(20, timeout=1)
+        self.assertEqual(context.exception.error_code, GENERATION_UNDERFLOW_ERROR)
+        manager.close_tasks()
+
+
+if __name__ == "__main__":
+    unittest.main()
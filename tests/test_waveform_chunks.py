@@ -0,0 +1,73 @@
+"""
+Module for testing the streaming of waveforms in chunks.
+"""
+import unittest
+import torch
+from brainspy.utils.waveform import WaveformManager
+from brainspy.utils.pytorch import TorchUtils
+
+
+class WaveformChunksTest(unittest.TestCase):
+    """
+    Class for testing the methods - points_to_waveform_chunks() and
+    plateaus_to_waveform_chunks() in waveform.py.
+    """
+    def test_points_to_waveform_chunks(self):
+        """
+        Test that concatenating the chunks gives the same waveform and mask as
+        generating the whole waveform at once, for chunk sizes that are
+        smaller, equal and bigger than a slope and plateau period.
+        """
+        configs = {}
+        configs["plateau_length"] = 7
+        configs["slope_length"] = 5
+        waveform_mgr = WaveformManager(configs)
+        points = torch.rand((23, 3), device=TorchUtils.get_device()) - 0.5
+        waveform = waveform_mgr.points_to_waveform(points)
+        mask = waveform_mgr.generate_mask(len(waveform))
+        for chunk_size in [1, 5, 12, 13, 100, len(waveform), 10000]:
+            chunks, masks = zip(
+                *waveform_mgr.points_to_waveform_chunks(points, chunk_size))
+            self.assertTrue(all(len(c) == chunk_size for c in chunks[:-1]))
+            self.assertTrue(torch.equal(torch.cat(chunks), waveform))
+            self.assertTrue(torch.equal(torch.cat(masks).cpu(), mask))
+
+    def test_plateaus_to_waveform_chunks(self):
+        """
+        Test that concatenating the chunks gives the same waveform and mask as
+        plateaus_to_waveform.
+        """
+        configs = {}
+        configs["plateau_length"] = 4
+        configs["slope_length"] = 3
+        waveform_mgr = WaveformManager(configs)
+        points = torch.rand((9, 2), device=TorchUtils.get_device())
+        plateaus = waveform_mgr.points_to_plateaus(points)
+        waveform, mask = waveform_mgr.plateaus_to_waveform(plateaus)
+        for chunk_size in [2, 7, 8, 50]:
+            chunks, masks = zip(*waveform_mgr.plateaus_to_waveform_chunks(
+                plateaus, chunk_size))
+            self.assertTrue(torch.equal(torch.cat(chunks), waveform))
+            self.assertTrue(torch.equal(torch.cat(masks), mask))
+
+    def test_waveform_chunks_fail(self):
+        """
+        Invalid chunk sizes or data types raise an AssertionError
+        """
+        configs = {}
+        configs["plateau_length"] = 4
+        configs["slope_length"] = 3
+        waveform_mgr = WaveformManager(configs)
+        points = torch.rand((9, 2))
+        with self.assertRaises(AssertionError):
+            next(waveform_mgr.points_to_waveform_chunks(points, 0))
+        with self.assertRaises(AssertionError):
+            next(waveform_mgr.points_to_waveform_chunks(points, 2.5))
+        with self.assertRaises(AssertionError):
+            waveform_mgr.points_to_waveform_chunks(points.numpy(), 10)
+        with self.assertRaises(AssertionError):
+            waveform_mgr.plateaus_to_waveform_chunks(points, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -56,6 +56,25 @@ class WaveformTest(unittest.TestCase):
             self.assertTrue(torch.equal(waveform, waveform_reverse),
                             "Plateaus to waveform error")
 
+    def test_waveform_to_plateaus_numpy(self):
+        """
+        Test to transform from waveform to plateaus with numpy arrays, which gives the
+        same result as with torch tensors.
+        """
+        configs = {}
+        configs["plateau_length"] = 5
+        configs["slope_length"] = 2
+        waveform_mgr = WaveformManager(configs)
+        points = torch.rand((6, 2), device=TorchUtils.get_device())
+        waveform = waveform_mgr.points_to_waveform(points)
+        plateaus = waveform_mgr.waveform_to_plateaus(waveform)
+        self.assertTrue(
+            torch.equal(plateaus, waveform_mgr.points_to_plateaus(points)))
+        numpy_plateaus = waveform_mgr.waveform_to_plateaus(
+            TorchUtils.to_numpy(waveform))
+        self.assertIsInstance(numpy_plateaus, np.ndarray)
+        self.assertTrue((numpy_plateaus == TorchUtils.to_numpy(plateaus)).all())
+
     def test_waveform_to_plateaus_slope_plateau_0(self):
         """
         Test to transform from waveform to plateaus with slope length = 0 raises mask IndexError
@@ -53,6 +53,41 @@ class WaveformTest(unittest.TestCase):
             self.assertTrue(torch.allclose(points, points_reverse),
                             "Waveform to points error")
 
+    def test_waveform_to_points_strided(self):
+        """
+        Test that the points obtained from a strided view of the waveform are the
+        same as the ones obtained with a mask, for torch tensors and numpy arrays,
+        also when writing them into a preallocated buffer.
+        """
+        configs = {}
+        configs["plateau_length"] = 8
+        configs["slope_length"] = 3
+        waveform_mgr = WaveformManager(configs)
+        points = torch.rand((12, 3),
+                            device=TorchUtils.get_device(),
+                            dtype=torch.float64)
+        waveform = waveform_mgr.points_to_waveform(points)
+        mask = waveform_mgr.generate_mask(len(waveform))
+        expected = waveform_mgr.waveform_to_points(waveform, mask)
+        self.assertTrue(
+            torch.allclose(waveform_mgr.waveform_to_points(waveform),
+                           expected))
+        out = torch.empty_like(points)
+        result = waveform_mgr.waveform_to_points(waveform, out=out)
+        self.assertEqual(result.data_ptr(), out.data_ptr())
+        self.assertTrue(torch.allclose(out, expected))
+
+        # Non-contiguous numpy arrays, as returned by the drivers
+        waveform = np.ascontiguousarray(
+            TorchUtils.to_numpy(waveform).T).T
+        out = np.empty((12, 3))
+        result = waveform_mgr.waveform_to_points(waveform, out=out)
+        self.assertIs(result, out)
+        self.assertTrue(np.allclose(out, TorchUtils.to_numpy(expected)))
+        self.assertTrue(
+            np.allclose(waveform_mgr.waveform_to_points(waveform, mask),
+                        out))
+
     def test_waveform_to_points_slope_plateau_0(self):
         """
         Test to generate points from a waveform with slope length = 0 raises mask IndexError
@@ -225,6 +260,26 @@ class WaveformTest(unittest.TestCase):
         with self.assertRaises(RuntimeError):
             manager.waveform_to_points(data)
 
+    def test_waveform_to_points_variable_lengths(self):
+        """
+        Test to recover the points of a waveform with a different plateau and
+        slope length per point.
+        """
+        configs = {}
+        configs["plateau_length"] = 4
+        configs["slope_length"] = 2
+        waveform_mgr = WaveformManager(configs)
+        plateau_lengths = [3, 1, 6, 2]
+        slope_lengths = [1, 4, 0, 2, 3]
+        points = torch.rand((4, 3), device=TorchUtils.get_device())
+        waveform = waveform_mgr.points_to_waveform(points, plateau_lengths,
+                                                   slope_lengths)
+        result = waveform_mgr.waveform_to_points(
+            waveform,
+            plateau_lengths=plateau_lengths,
+            slope_lengths=slope_lengths)
+        self.assertTrue(torch.allclose(result, points))
+
 
 if __name__ == "__main__":
     unittest.main()
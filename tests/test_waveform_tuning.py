@@ -0,0 +1,106 @@
+"""
+Module for testing the tuning of the plateau and slope lengths of the waveform.
+"""
+import unittest
+import warnings
+import torch
+from brainspy.processors.processor import Processor
+from brainspy.processors.hardware.processor import HardwareProcessor
+from brainspy.processors.hardware.tuning import (measure_waveform, tune_waveform,
+                                                 set_waveform_configs)
+from brainspy.utils.pytorch import TorchUtils
+from tests.test_utils import get_custom_model_configs
+from tests.test_simulated_backend import get_simulated_configs
+
+
+class WaveformTuningTest(unittest.TestCase):
+    """
+    Class for testing the waveform tuning functions with a simulation_debug processor, where
+    the output of the surrogate model has gaussian noise with a unit variance.
+    """
+    def get_processor(self):
+        configs, model_data = get_custom_model_configs()
+        configs["processor_type"] = "simulation_debug"
+        configs["electrode_effects"] = {"noise": {"type": "gaussian", "variance": 1.0}}
+        processor = TorchUtils.format(Processor(configs, model_data["info"]))
+        return configs, processor
+
+    def test_measure_waveform(self):
+        """
+        Test that the noise of the averaged points decreases with the plateau length, and that
+        the returned measurements have one value per point and readout electrode.
+        """
+        configs, processor = self.get_processor()
+        points = TorchUtils.format(torch.rand((30, 7)) - 0.5)
+        short = measure_waveform(processor, points, 4, 5, repetitions=3)
+        long = measure_waveform(processor, points, 64, 5, repetitions=3)
+        for key in ["points", "noise", "variance", "overshoot"]:
+            self.assertEqual(short[key].shape, (30, 1))
+        self.assertTrue(long["noise"].mean() < short["noise"].mean())
+        with self.assertRaises(AssertionError):
+            measure_waveform(processor, points, 4, 5, repetitions=1)
+
+    def test_tune_waveform(self):
+        """
+        Test that the recommended plateau length is the shortest one that meets the noise
+        target, and that it is written back into the configs and the processor.
+        """
+        configs, processor = self.get_processor()
+        tuning = tune_waveform(processor, [1, 4, 16, 64], [20, 5],
+                               max_noise=0.35,
+                               point_no=50,
+                               repetitions=3)
+        self.assertEqual(tuning["plateau_length"], 16)
+        self.assertEqual(tuning["slope_length"], 5)
+        self.assertEqual(len(tuning["results"]), 8)
+        set_waveform_configs(configs, tuning, processor)
+        self.assertEqual(configs["waveform"]["plateau_length"], 16)
+        self.assertEqual(processor.waveform_mgr.plateau_length, 16)
+        self.assertEqual(processor.processor.waveform_mgr.slope_length, 5)
+
+    def test_set_waveform_configs_hardware(self):
+        """
+        Test that the lengths written into a hardware processor are validated against the
+        maximum ramping time, and that its measurement cache is cleared.
+        """
+        configs = {"waveform": {"plateau_length": 5, "slope_length": 1, "measurement_cache": {}}}
+        processor = HardwareProcessor(get_simulated_configs("cdaq_to_cdaq"),
+                                      slope_length=1,
+                                      plateau_length=5,
+                                      waveform_configs=configs["waveform"])
+        processor.forward_points(torch.rand((10, 7)) - 0.5)
+        self.assertEqual(len(processor.measurement_cache), 1)
+        set_waveform_configs(configs, {"plateau_length": 10, "slope_length": 2}, processor)
+        self.assertEqual(processor.waveform_mgr.plateau_length, 10)
+        self.assertEqual(len(processor.measurement_cache), 0)
+        # 1000 points at 1000 Hz take longer than the maximum ramping time of 0.1 seconds
+        with self.assertRaises(AssertionError):
+            set_waveform_configs(configs, {"plateau_length": 10, "slope_length": 1000},
+                                 processor)
+        self.assertEqual(configs["waveform"]["slope_length"], 2)
+        self.assertEqual(processor.waveform_mgr.slope_length, 2)
+        processor.close()
+
+    def test_tune_waveform_fail(self):
+        """
+        Test that a missing target raises an AssertionError, and that unreachable targets give
+        no recommendation.
+        """
+        configs, processor = self.get_processor()
+        with self.assertRaises(AssertionError):
+            tune_waveform(processor, [1, 4], [5])
+        with warnings.catch_warnings(record=True) as caught_warnings:
+            warnings.simplefilter("always")
+            tuning = tune_waveform(processor, [1, 4], [5], max_noise=1e-6)
+            self.assertEqual(len(caught_warnings), 1)
+        self.assertIsNone(tuning["plateau_length"])
+        with self.assertRaises(AssertionError):
+            set_waveform_configs(configs, tuning)
+        configs["processor_type"] = "simulation"
+        with self.assertRaises(AssertionError):
+            tune_waveform(Processor(configs, get_custom_model_configs()[1]["info"]), [1], [5],
+                          max_noise=1)
+
+
+if __name__ == "__main__":
+    unittest.main()